@@ -3,3 +3,43 @@ __version__ = '0.3.0'
 from .orm import Orm
 
 from .example import Example
+
+from .router import ReplicaRouter
+
+from .shard import ShardMap, ShardedOrm
+
+from .result import ResultList
+
+from .errors import OrmError, QueryTimeoutError, DatabaseError, DeadlockError, LockWaitTimeoutError, ConnectionLostError, ResultTooLargeError
+
+from .retry import RetryPolicy
+
+from .explain import ExplainSampler
+
+from .aggregate import Aggregate
+
+from .pipeline import Pipeline
+
+from .changes import FileCheckpoint, TableCheckpoint
+
+from .model import Model
+
+from .session import Session
+
+from .prefetch import PageIterator
+
+from .gather import setMaxConcurrency
+
+from .subquery import SubQuery
+
+from .mirror import SQLiteMirror
+
+from .capture import WorkloadCapture, replayWorkload, redactStrings
+
+from .guard import resultPeaks
+
+from .idgen import HiLoGenerator, SnowflakeGenerator
+
+from .singleflight import SingleFlight
+
+from .jsonout import JSONFetch
@@ -0,0 +1,68 @@
+from .sqlutil import quoteKey
+
+__all__ = ['Aggregate']
+
+# 支持的聚合函数
+_FUNCS = ('COUNT', 'SUM', 'AVG', 'MIN', 'MAX', 'GROUP_CONCAT', 'STD', 'STDDEV', 'VARIANCE', 'BIT_AND', 'BIT_OR')
+
+
+class Aggregate(object):
+    def __init__(self, func, column = '*', alias = None, distinct = False, when = None):
+        ''' 聚合项
+        --
+            @example
+                Aggregate('COUNT')                                          # COUNT(*)
+                Aggregate('SUM', 'result', 'total')                         # SUM(`result`) `total`
+                Aggregate('COUNT', 'sid', 'students', distinct=True)        # COUNT(DISTINCT `sid`) `students`
+                Aggregate('SUM', 'result', 'passed', when=Example().andGreaterThanOrEqualTo({'result':60}))
+                # SUM(CASE WHEN `result` >= %s THEN `result` ELSE 0 END) `passed`
+                Aggregate('COUNT', '*', 'passedNum', when=Example().andGreaterThanOrEqualTo({'result':60}))
+                # COUNT(CASE WHEN `result` >= %s THEN 1 END) `passedNum`
+                Aggregate('COUNT', 'sid', 'passedStudents', distinct=True, when=Example().andGreaterThanOrEqualTo({'result':60}))
+                # COUNT(DISTINCT CASE WHEN `result` >= %s THEN `sid` END) `passedStudents`
+
+            @param func: 聚合函数
+            @param column: 字段名，默认*
+            @param alias: 别名，不填时结果字段名为MySQL生成的表达式
+            @param distinct: 是否去重
+            @param when: Example条件，只聚合满足条件的行
+        '''
+        func = func.upper()
+        if func not in _FUNCS:
+            raise Exception('不支持的聚合函数：{}'.format(func))
+        self.func = func
+        self.column = column
+        self.alias = alias
+        self.distinct = distinct
+        self.when = when
+
+    @classmethod
+    def of(cls, spec):
+        ''' 把 Aggregate / (func, column, alias) 元组 / 字典 转换为Aggregate
+        --
+        '''
+        if isinstance(spec, Aggregate):
+            return spec
+        if isinstance(spec, dict):
+            return cls(**spec)
+        return cls(*spec)
+
+    def build(self):
+        ''' 编译为SQL表达式
+        --
+            @return: (表达式, 参数列表)
+        '''
+        column = quoteKey(self.column)
+        values = []
+        if self.when is not None:
+            whenStr, values = self.when.whereBuilder()
+            if column == '*':
+                column = 'CASE WHEN {} THEN 1 END'.format(whenStr)
+            elif self.func == 'SUM':
+                column = 'CASE WHEN {} THEN {} ELSE 0 END'.format(whenStr, column)
+            else:
+                column = 'CASE WHEN {} THEN {} END'.format(whenStr, column)
+        sql = '{}({}{})'.format(self.func, 'DISTINCT ' if self.distinct else '', column)
+        if self.alias:
+            sql += ' `{}`'.format(self.alias)
+        return sql, values
@@ -0,0 +1,276 @@
+import json
+import logging
+import math
+import queue
+import random
+import threading
+import time
+import zlib
+from .changes import _encode, _decode
+from .fingerprint import fingerprint
+from .largein import InSpill, createSpill, dropSpill
+from .pool import borrow, giveBack
+
+__all__ = ['WorkloadCapture', 'replayWorkload', 'redactStrings']
+
+_log = logging.getLogger()
+
+
+def redactStrings(sql, values):
+    ''' 脱敏：字符串参数替换为等长的x，其他参数保留
+    --
+    '''
+    return [('x' * len(v)) if isinstance(v, str) else v for v in values]
+
+
+def _connectionId(conn):
+    threadId = getattr(conn, 'thread_id', None)
+    if callable(threadId):
+        try:
+            return threadId()
+        except Exception:
+            pass
+    return id(conn)
+
+
+class WorkloadCapture(object):
+    def __init__(self, path, sampleRate = 1.0, redact = None):
+        ''' 记录Orm执行的语句，每行一条JSON：
+            {"t": 相对开始时间（秒）, "c": 连接ID, "s": 语句, "v": 参数, "d": 耗时（毫秒）, "w": 是否写操作, "m": 是否executemany,
+             "p": TEMP_TABLE方式的大IN列表临时表 [[表名, 列类型, 值列表]]}
+            以及提交和回滚：{"t": 相对开始时间（秒）, "c": 连接ID, "e": "commit"或"rollback"}
+            语句是调用方生成的原始语句（不包含自动添加的LIMIT和超时提示）。文件只追加写入，可以用replayWorkload回放
+        --
+            @example
+                capture = WorkloadCapture('/data/workload.jsonl', sampleRate=0.1, redact=redactStrings)
+                stuOrm.setCapture(capture)
+                courseOrm.setCapture(capture)
+                ...
+                capture.close()
+
+            @param path: 文件路径
+            @param sampleRate: 采样比例
+            @param redact: 脱敏函数redact(sql, values)，返回写入文件的参数
+        '''
+        self.path = path
+        self.sampleRate = sampleRate
+        self.redact = redact
+        self.startedAt = time.monotonic()
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def record(self, conn, sql, values, duration, write, many, spills = None):
+        ''' 由Orm._execute调用，记录一条语句
+        --
+            @param duration: 耗时（秒）
+            @param spills: 语句使用的大IN列表临时表（InSpill列表）
+        '''
+        if self.sampleRate < 1 and random.random() >= self.sampleRate:
+            return
+        values = self._values(sql, values, many)
+        item = {
+            't': round(time.monotonic() - self.startedAt, 6),
+            'c': _connectionId(conn),
+            's': ' '.join(sql.split()),
+            'v': values,
+            'd': round(duration * 1000, 3),
+            'w': 1 if write else 0
+        }
+        if many:
+            item['m'] = 1
+        if spills:
+            item['p'] = [[s.name, s.columnType, self._values(sql, s.values, False)] for s in spills]
+        self._write(item)
+
+    def recordEnd(self, conn, commit):
+        ''' 记录连接上的提交或回滚，由Orm调用；手动提交模式下自己提交或回滚后调用
+        --
+            @param commit: True为提交，False为回滚
+        '''
+        self._write({
+            't': round(time.monotonic() - self.startedAt, 6),
+            'c': _connectionId(conn),
+            'e': 'commit' if commit else 'rollback'
+        })
+
+    def _values(self, sql, values, many):
+        ''' 参数脱敏并编码为JSON可以保存的值
+        --
+        '''
+        if values is None:
+            return None
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        if self.redact:
+            values = [self.redact(sql, v) for v in values] if many else self.redact(sql, values)
+        return [[_encode(x) for x in v] for v in values] if many else [_encode(v) for v in values]
+
+    def _write(self, item):
+        line = json.dumps(item, ensure_ascii=False, separators=(',', ':'), default=str)
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + '\n')
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        ''' 停止记录并关闭文件
+        --
+        '''
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _readWorkload(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            values = item.get('v')
+            if values is not None:
+                if item.get('m'):
+                    item['v'] = [[_decode(x) for x in v] for v in values]
+                else:
+                    item['v'] = [_decode(v) for v in values]
+            if item.get('p'):
+                item['p'] = [InSpill([_decode(v) for v in values], columnType, name) for name, columnType, values in item['p']]
+            yield item
+
+
+def _percentile(sortedValues, p):
+    if not sortedValues:
+        return None
+    rank = max(1, math.ceil(p / 100.0 * len(sortedValues)))
+    return sortedValues[rank - 1]
+
+
+def replayWorkload(path, pool, speed = 1.0, threads = 4, writes = True):
+    ''' 在目标数据库上回放WorkloadCapture记录的语句，同一连接的语句由同一个线程按原顺序执行，
+        在记录的位置提交或回滚（事务边界与原来一致），结束时回滚未提交的事务
+    --
+        @example
+            report = replayWorkload('/data/workload.jsonl', PooledDB(pymysql, 8, **testDb), speed=2, threads=8)
+            for fp, r in sorted(report['statements'].items(), key=lambda x: -(x[1]['p99'] or 0)):
+                print(r['count'], r['p50'], r['p99'], fp)
+
+        @param path: 记录文件
+        @param pool: 目标数据库的连接池（有connection()方法）或者返回新连接的函数，每个线程使用一个连接
+        @param speed: 回放速度倍数，1为原速，2为两倍速，None或0为不等待（最大速度）
+        @param threads: 线程数
+        @param writes: 是否回放写操作，只在测试库上回放写操作
+        @return: {'elapsed': 总耗时（秒）, 'count': 语句数, 'errors': 错误数,
+                  'statements': {指纹: {'count', 'errors', 'p50', 'p95', 'p99', 'max', 'capturedP50'}}}，耗时单位毫秒
+    '''
+    queues = [queue.Queue(maxsize=1000) for _ in range(threads)]
+    lock = threading.Lock()
+    stats = {}
+    startedAt = None
+
+    def stat(sql):
+        fp = fingerprint(sql)
+        s = stats.get(fp)
+        if s is None:
+            s = stats[fp] = {'latencies': [], 'captured': [], 'errors': 0}
+        return s
+
+    def end(conn, event):
+        try:
+            if event == 'commit':
+                conn.commit()
+            else:
+                conn.rollback()
+        except Exception as e:
+            _log.warning('replay {} error: {}'.format(event, e))
+
+    def worker(q, conn):
+        while True:
+            item = q.get()
+            if item is None:
+                end(conn, 'rollback')
+                return
+            if speed:
+                wait = startedAt + item['t'] / speed - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+            if item.get('e'):
+                end(conn, item['e'])
+                continue
+            cursor = conn.cursor()
+            spills = item.get('p') or []
+            error = False
+            latency = None
+            try:
+                for spill in spills:
+                    createSpill(cursor, spill)
+                start = time.perf_counter()
+                if item.get('m'):
+                    cursor.executemany(item['s'], item['v'])
+                elif item['v'] is None:
+                    cursor.execute(item['s'])
+                else:
+                    cursor.execute(item['s'], item['v'])
+                cursor.fetchall()
+                latency = (time.perf_counter() - start) * 1000
+            except Exception as e:
+                # 与MySQL一致，语句出错不结束事务，由记录中后续的提交或回滚决定
+                _log.warning('replay error: {} {}'.format(e, item['s']))
+                error = True
+            finally:
+                for spill in spills:
+                    dropSpill(cursor, spill)
+                cursor.close()
+            with lock:
+                s = stat(item['s'])
+                s['captured'].append(item['d'])
+                if error:
+                    s['errors'] += 1
+                else:
+                    s['latencies'].append(latency)
+
+    conns = []
+    workers = []
+    try:
+        for _ in range(threads):
+            conns.append(borrow(pool))
+        startedAt = time.monotonic()
+        for q, conn in zip(queues, conns):
+            w = threading.Thread(target=worker, args=(q, conn), name='fcorm-replay', daemon=True)
+            w.start()
+            workers.append(w)
+        for item in _readWorkload(path):
+            if item.get('w') and not writes:
+                continue
+            queues[zlib.crc32(str(item['c']).encode('utf-8')) % threads].put(item)
+    finally:
+        for q in queues[:len(workers)]:
+            q.put(None)
+        for w in workers:
+            w.join()
+        for conn in conns:
+            giveBack(pool, conn)
+
+    report = {}
+    count = 0
+    errors = 0
+    for fp, s in stats.items():
+        latencies = sorted(s['latencies'])
+        captured = sorted(s['captured'])
+        count += len(captured)
+        errors += s['errors']
+        report[fp] = {
+            'count': len(captured),
+            'errors': s['errors'],
+            'p50': _percentile(latencies, 50),
+            'p95': _percentile(latencies, 95),
+            'p99': _percentile(latencies, 99),
+            'max': latencies[-1] if latencies else None,
+            'capturedP50': _percentile(captured, 50)
+        }
+    return {'elapsed': time.monotonic() - startedAt, 'count': count, 'errors': errors, 'statements': report}
@@ -0,0 +1,132 @@
+import base64
+import datetime
+import decimal
+import json
+import os
+
+__all__ = ['FileCheckpoint', 'TableCheckpoint', 'keysetWhere']
+
+
+def _encode(v):
+    ''' 水位值转换为可以json序列化的形式
+    --
+    '''
+    if isinstance(v, datetime.datetime):
+        return {'t': 'datetime', 'v': v.isoformat()}
+    if isinstance(v, datetime.date):
+        return {'t': 'date', 'v': v.isoformat()}
+    if isinstance(v, decimal.Decimal):
+        return {'t': 'decimal', 'v': str(v)}
+    if isinstance(v, bytes):
+        return {'t': 'bytes', 'v': base64.b64encode(v).decode('ascii')}
+    return v
+
+
+def _decode(v):
+    if isinstance(v, dict):
+        if v['t'] == 'datetime':
+            return datetime.datetime.fromisoformat(v['v'])
+        if v['t'] == 'date':
+            return datetime.date.fromisoformat(v['v'])
+        if v['t'] == 'decimal':
+            return decimal.Decimal(v['v'])
+        if v['t'] == 'bytes':
+            return base64.b64decode(v['v'])
+    return v
+
+
+def _dumpPosition(position):
+    return json.dumps([_encode(v) for v in position])
+
+
+def _loadPosition(s):
+    return tuple(_decode(v) for v in json.loads(s))
+
+
+def keysetWhere(keys):
+    ''' 多字段字典序大于条件 (k1, k2, ...) > (%s, %s, ...)，展开为OR形式以便使用索引
+    --
+        @example
+            keysetWhere(['updated_at', 'sid'])
+            # ('(`updated_at` > %s) OR (`updated_at` = %s AND `sid` > %s)', 参数顺序[0, 0, 1])
+        @return: (条件, 参数下标列表)
+    '''
+    parts = []
+    order = []
+    for i, k in enumerate(keys):
+        conds = ['`{}` = %s'.format(keys[j]) for j in range(i)]
+        conds.append('`{}` > %s'.format(k))
+        parts.append('(' + ' AND '.join(conds) + ')')
+        order.extend(range(i + 1))
+    return ' OR '.join(parts), order
+
+
+class FileCheckpoint(object):
+    def __init__(self, path):
+        ''' 保存在本地文件中的同步位置，写入时先写临时文件再替换，保证原子性
+        --
+            @param path: 文件路径
+        '''
+        self.path = path
+
+    def load(self):
+        ''' 读取同步位置，没有则返回None
+        --
+        '''
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return _loadPosition(f.read())
+
+    def save(self, position):
+        ''' 保存同步位置
+        --
+        '''
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(_dumpPosition(position))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+class TableCheckpoint(object):
+    def __init__(self, conn, name, tableName = 'fcorm_checkpoint'):
+        ''' 保存在数据库表中的同步位置，表结构：
+                CREATE TABLE `fcorm_checkpoint` (
+                    `name` varchar(100) NOT NULL COMMENT '同步任务名',
+                    `position` varchar(1000) NOT NULL COMMENT '同步位置',
+                    PRIMARY KEY (`name`)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+        --
+            @param conn: 数据库连接
+            @param name: 同步任务名
+            @param tableName: 表名
+        '''
+        self.conn = conn
+        self.name = name
+        self.tableName = tableName
+
+    def load(self):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute('SELECT `position` FROM `{}` WHERE `name`=%s'.format(self.tableName), self.name)
+            row = cursor.fetchone()
+            self.conn.commit()
+        finally:
+            cursor.close()
+        if not row:
+            return None
+        return _loadPosition(row['position'] if isinstance(row, dict) else row[0])
+
+    def save(self, position):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute('INSERT INTO `{}`(`name`, `position`) VALUES(%s, %s) ON DUPLICATE KEY UPDATE `position`=VALUES(`position`)'
+                           .format(self.tableName), [self.name, _dumpPosition(position)])
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
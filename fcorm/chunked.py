@@ -0,0 +1,95 @@
+import logging
+import time
+
+__all__ = ['runInChunks']
+
+_log = logging.getLogger()
+
+# 自适应调整时的最小分批大小
+MIN_CHUNK_SIZE = 10
+
+
+def runInChunks(orm, example, execute, chunkSize = 1000, pause = 0, maxLatency = None, maxLag = None, since = None, progress = None):
+    ''' 按主键范围分批执行写操作，每批是一个单独的短事务
+        1. 按主键升序取下一批的主键上界：SELECT `key` ... WHERE `key` > 上一批上界 AND (条件) LIMIT chunkSize
+        2. 执行 execute('`key` > %s AND `key` <= %s AND (条件)', 参数)，条件在写入时重新判断
+        3. 每批之后暂停pause秒；语句耗时超过maxLatency时分批大小减半，低于一半时逐步恢复；
+           从库复制延迟超过maxLag时等待（复制未运行等延迟未知的情况不等待）
+    --
+        @param orm: Orm，只支持单字段主键，必须是自动提交模式
+        @param example: 条件，None表示所有数据
+        @param execute: 执行一批的函数，参数为(条件, 参数列表)，返回影响行数
+        @param chunkSize: 每批最多处理的行数
+        @param pause: 每批之后暂停的秒数
+        @param maxLatency: 每批语句的目标耗时（秒），None表示不根据耗时调整
+        @param maxLag: 允许的最大从库复制延迟（秒），需要Orm配置从库，None表示不检查
+        @param since: 从哪个主键之后开始（不包含），也可以是FileCheckpoint/TableCheckpoint，每批之后自动保存
+        @param progress: 进度回调，每批之后调用progress(已影响行数, 当前主键上界)
+        @return: 影响行数之和
+    '''
+    keys = orm._primaryKeys()
+    if len(keys) != 1:
+        raise Exception('分批执行只支持单字段主键！')
+    if not orm.auto_commit:
+        raise Exception('分批执行需要自动提交模式！')
+    key = '`{}`'.format(keys[0])
+
+    checkpoint = since if hasattr(since, 'save') else None
+    if checkpoint:
+        position = checkpoint.load()
+        last = position[0] if position else None
+    else:
+        last = since
+    whereStr, whereValues = orm._whereBuilder(example) if example is not None else ('', [])
+
+    size = chunkSize
+    total = 0
+    while True:
+        conds = []
+        values = []
+        if last is not None:
+            conds.append('{} > %s'.format(key))
+            values.append(last)
+        if whereStr:
+            conds.append('(' + whereStr + ')')
+            values.extend(whereValues)
+        sql = 'SELECT {} FROM `{}` {} ORDER BY {} ASC LIMIT {}'.format(
+            key, orm.tableName, 'WHERE ' + ' AND '.join(conds) if conds else '', key, int(size))
+        rows = orm._execute(sql, values or None, usePrimary=True)
+        if not rows:
+            break
+        upper = rows[-1][keys[0]]
+
+        conds = ['{} <= %s'.format(key)]
+        values = [upper]
+        if last is not None:
+            conds.insert(0, '{} > %s'.format(key))
+            values.insert(0, last)
+        if whereStr:
+            conds.append('(' + whereStr + ')')
+            values.extend(whereValues)
+        start = time.monotonic()
+        total += execute(' AND '.join(conds), values)
+        latency = time.monotonic() - start
+        last = upper
+        if checkpoint:
+            checkpoint.save((last,))
+        if progress:
+            progress(total, last)
+        if len(rows) < size:
+            break
+
+        if maxLatency:
+            if latency > maxLatency:
+                size = max(min(MIN_CHUNK_SIZE, chunkSize), size // 2)
+            elif latency < maxLatency / 2 and size < chunkSize:
+                size = min(chunkSize, size * 2)
+        if pause:
+            time.sleep(pause)
+        if maxLag is not None and orm.router:
+            lag = orm.router.currentLag()
+            while lag is not None and lag > maxLag:
+                _log.warning('replica lag {}s, waiting'.format(lag))
+                time.sleep(max(pause, 1))
+                lag = orm.router.currentLag()
+    return total
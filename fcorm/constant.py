@@ -1,4 +1,12 @@
 # 自增主键
 AUTO_INCREMENT_KEYS = 'AUTO_INCREMENT'
 # 默认主键名
-PRIMARY_KEY = 'id'
\ No newline at end of file
+PRIMARY_KEY = 'id'
+# 从库负载均衡策略：轮询
+ROUND_ROBIN = 'ROUND_ROBIN'
+# 从库负载均衡策略：最少未完成请求
+LEAST_OUTSTANDING = 'LEAST_OUTSTANDING'
+# 大IN列表的处理方式：JSON_TABLE派生表（MySQL 8.0.4+）
+JSON_TABLE = 'JSON_TABLE'
+# 大IN列表的处理方式：会话临时表
+TEMP_TABLE = 'TEMP_TABLE'
@@ -0,0 +1,101 @@
+__all__ = ['OrmError', 'QueryTimeoutError', 'DatabaseError', 'DeadlockError', 'LockWaitTimeoutError',
+           'ConnectionLostError', 'ResultTooLargeError', 'wrapError', 'errorCode']
+
+# 死锁
+DEADLOCK_CODES = (1213,)
+# 锁等待超时
+LOCK_WAIT_CODES = (1205,)
+# 连接断开：2006 MySQL server has gone away，2013 Lost connection，2003 无法连接，2055 读写失败
+CONNECTION_LOST_CODES = (2006, 2013, 2003, 2055)
+
+
+class OrmError(Exception):
+    def __init__(self, msg, code = None):
+        ''' Orm异常基类
+        --
+            @param msg: 错误信息
+            @param code: MySQL错误码，没有则为None
+        '''
+        super(OrmError, self).__init__(msg)
+        self.code = code
+
+
+class QueryTimeoutError(OrmError):
+    ''' 语句执行超时（超过timeout设置），调用方可以据此放弃请求而不是继续排队
+    '''
+    pass
+
+
+class DatabaseError(OrmError):
+    ''' 数据库返回的错误，code为MySQL错误码
+    '''
+    pass
+
+
+class DeadlockError(DatabaseError):
+    ''' 死锁（1213），事务已被数据库回滚
+    '''
+    pass
+
+
+class LockWaitTimeoutError(DatabaseError):
+    ''' 锁等待超时（1205）
+    '''
+    pass
+
+
+class ConnectionLostError(DatabaseError):
+    ''' 连接断开（2006/2013等）
+    '''
+    pass
+
+
+class ResultTooLargeError(OrmError):
+    def __init__(self, msg, rows, size):
+        ''' 查询结果超过maxRows/maxBytes限制
+        --
+            @param rows: 超限时已读取的行数
+            @param size: 超限时已读取数据的估算大小（字节）
+        '''
+        super(ResultTooLargeError, self).__init__(msg)
+        self.rows = rows
+        self.size = size
+
+
+def errorCode(e):
+    ''' 取驱动异常中的MySQL错误码，没有则返回None
+    --
+    '''
+    if isinstance(e, OrmError):
+        return e.code
+    if e is not None and e.args and isinstance(e.args[0], int):
+        return e.args[0]
+    return None
+
+
+def errorClass(code):
+    ''' 根据MySQL错误码返回对应的异常类
+    --
+    '''
+    if code in DEADLOCK_CODES:
+        return DeadlockError
+    if code in LOCK_WAIT_CODES:
+        return LockWaitTimeoutError
+    if code in CONNECTION_LOST_CODES:
+        return ConnectionLostError
+    return DatabaseError
+
+
+def wrapError(e, msg):
+    ''' 把执行中的异常转换为对外抛出的异常：已经是OrmError的原样返回，
+        驱动异常按错误码转换为对应的DatabaseError子类并保留错误码，其他异常转换为Exception
+    --
+        @param e: 原始异常
+        @param msg: 错误信息
+    '''
+    if isinstance(e, OrmError):
+        return e
+    code = errorCode(e)
+    if code is not None:
+        return errorClass(code)('{} [{}] {}'.format(msg, code, e.args[1] if len(e.args) > 1 else ''), code)
+    return Exception(msg)
@@ -1,4 +1,7 @@
 from fcutils import pers
+from .parser import parseWhere
+from .subquery import SubQuery
+from .largein import largeInSQL
 
 __all__ = ['Example']
 
@@ -221,108 +224,92 @@ class Example(object):
         self._append('OR', (key, [v1, v2], 'NOT BETWEEN'))
         return self
 
+    def andInSubquery(self, key, subQuery):
+        ''' AND key IN (子查询)
+        --
+            @example
+                # 有成绩不及格的学生
+                studyOrm = Orm(db, 'study')
+                Example().andInSubquery('sid', studyOrm.subQuery(Example().andLessThan({'result': 60}), 'sid'))
+                # ' `sid` IN (SELECT `sid` FROM `study` WHERE ( `result` < %s )) ', [60]
+
+            @param subQuery: SubQuery，一般由Orm.subQuery生成
+        '''
+        self._append('AND', (key, subQuery, 'IN'))
+        return self
+
+    def orInSubquery(self, key, subQuery):
+        ''' OR key IN (子查询)
+        --
+        '''
+        self._append('OR', (key, subQuery, 'IN'))
+        return self
+
+    def andNotInSubquery(self, key, subQuery):
+        ''' AND key NOT IN (子查询)
+        --
+        '''
+        self._append('AND', (key, subQuery, 'NOT IN'))
+        return self
+
+    def orNotInSubquery(self, key, subQuery):
+        ''' OR key NOT IN (子查询)
+        --
+        '''
+        self._append('OR', (key, subQuery, 'NOT IN'))
+        return self
+
+    def andExists(self, subQuery):
+        ''' AND EXISTS (子查询)
+        --
+            @example
+                # 选了课的学生，子查询通过correlation关联外层表
+                sub = studyOrm.subQuery(Example().andGreaterThan({'result': 60}), '1', correlation='`study`.`sid`=`student`.`sid`')
+                stuOrm.selectByExample(Example().andExists(sub))
+        '''
+        self._append('AND', (None, subQuery, 'EXISTS'))
+        return self
+
+    def orExists(self, subQuery):
+        ''' OR EXISTS (子查询)
+        --
+        '''
+        self._append('OR', (None, subQuery, 'EXISTS'))
+        return self
+
+    def andNotExists(self, subQuery):
+        ''' AND NOT EXISTS (子查询)
+        --
+        '''
+        self._append('AND', (None, subQuery, 'NOT EXISTS'))
+        return self
+
+    def orNotExists(self, subQuery):
+        ''' OR NOT EXISTS (子查询)
+        --
+        '''
+        self._append('OR', (None, subQuery, 'NOT EXISTS'))
+        return self
+
     def whereFromStr(self, whereStr):
-        ''' 直接从字符串中读取where条件，暂不支持带子查询的语句
-        --
-        '''
-        import re
-        keyword = ''
-        # 前面是否有NOT关键字
-        haveNot = False
-        # 圆括号
-        parentheses = False
-        # 符号
-        sign = ''
-        key = ''
-        value = ''
-        whereSplit = re.split(r'\s+', whereStr.strip())
-        for s in whereSplit:
-            if (s.upper() == 'AND' or s.upper() == 'OR') and not parentheses:
-                if sign and (sign.upper() == 'BETWEEN' or sign.upper() == 'NOT BETWEEN'):
-                    continue
-                keyword = s.upper()
-                continue
-
-            if s.startswith('('):
-                parentheses = True
-                if len(s) > 1:
-                    s = s[1:]
-                else:
-                    continue
-
-            if parentheses:
-                if s.endswith(')'):
-                    if len(s) > 1:
-                        value += s[:-1]
-                else:
-                    value += s + ' '
-                    continue
-            else:
-                if s.upper() == 'NOT':
-                    haveNot = True
-                    continue
-                elif s.upper() == 'IN' or s.upper() == 'LIKE' or s.upper() == 'BETWEEN':
-                    if haveNot:
-                        sign = 'NOT ' + s
-                    else:
-                        sign = s
-                    continue
-                else:
-                    s = s.replace('`', '')
-                    if '=' in s and '=' != s:
-                        sign = '='
-                        key, value = s.split('=')
-                    elif '<>' in s and '<>' != s:
-                        sign = '<>'
-                        key, value = s.split('<>')
-                    elif '>' in s and '>' != s:
-                        sign = '>'
-                        key, value = s.split('>')
-                    elif '<' in s and '<' != s:
-                        sign = '<'
-                        key, value = s.split('<')
-                    elif '>=' in s and '>=' != s:
-                        sign = '>='
-                        key, value = s.split('>=')
-                    elif '<=' in s and '<=' != s:
-                        sign = '<='
-                        key, value = s.split('<=')
-                    else:
-                        if sign and key:
-                            if sign.upper() == 'BETWEEN' or sign.upper() == 'NOT BETWEEN':
-                                if value:
-                                    value.append(s)
-                                else:
-                                    value = [s]
-                                    continue
-                            else:
-                                value = s
-                        elif key:
-                            sign = s
-                            continue
-                        else:
-                            key = s
-                            continue
-
-            if not sign:
-                self._append(keyword, Example().whereFromStr(value))
-            elif sign.upper() == 'IN' or sign.upper() == 'NOT IN':
-                import json
-                value = json.loads('[' + value + ']')
-                print(type(value))
-                print((keyword, (key, value, sign)))
-                self._append(keyword, (key, value, sign))
+        ''' 直接从字符串中读取where条件，暂不支持带子查询的语句。相同字符串的解析结果会被缓存。
+            字段名只能是 字段 或 表名.字段，否则抛出异常；没有引号的数字转换为int/Decimal
+        --
+            @example
+                Example().whereFromStr("name LIKE '张 %' AND (age BETWEEN 18 AND 20 OR sid NOT IN (1, 2))")
+        '''
+        self._appendParsed(parseWhere(whereStr.strip()))
+        return self
+
+    def _appendParsed(self, items):
+        ''' 添加解析后的条件
+        '''
+        for orAnd, node in items:
+            if isinstance(node[0], str):
+                k, v, p = node
+                self._append(orAnd, (k, list(v) if isinstance(v, tuple) else v, p))
             else:
-                if isinstance(value, str) and value.startswith('"') and value.endswith('"') and len(value) > 1:
-                    value = value[1:-1]
-                value = value
-                self._append(keyword, (key, value, sign))
-            sign = ''
-            key = ''
-            value = ''
-            haveNot = False
-            parentheses = False
-            keyword = ''
+                self._append(orAnd, Example()._appendParsed(node))
         return self
 
     def _append(self, orAnd, where):
@@ -334,18 +321,27 @@ class Example(object):
             self.orAnd.append(orAnd)
             self.where.append(where)
 
-    def _builder(self, w):
+    def _builder(self, w, largeIn = None):
         ''' 单个条件编译
         '''
         if isinstance(w, tuple):
             k, v, p = w
+            if k is None:
+                # EXISTS/NOT EXISTS
+                return ' ' + p + ' (' + v.sql + ') ', list(v.values)
             if '.' in k:
                 kSplit = k.split('.')
                 if len(kSplit) == 2:
                     k = '`' + kSplit[0] + '`.`' + kSplit[1] + '`'
             else:
                 k = '`' + k + '`'
+            if isinstance(v, SubQuery):
+                # 子查询，比较运算符用于标量子查询，如 age > (SELECT AVG(`age`) ...)
+                whereStr = ' ' + k + ' ' + p.upper() + ' (' + v.sql + ') '
+                return whereStr, list(v.values)
             if p.upper() == 'IN' or p.upper() == 'NOT IN':
+                if largeIn and len(v) > largeIn[0]:
+                    return largeInSQL(k, p.upper(), v, largeIn[1])
                 whereStr = ' ' + k + ' ' + p.upper() + ' (' + pers(len(v)) + ') '
                 return whereStr, v
             elif p.upper() == 'BETWEEN' or p.upper() == 'NOT BETWEEN':
@@ -355,13 +351,15 @@ class Example(object):
                 whereStr = ' ' + k + ' ' + p.upper() + ' %s '
                 return whereStr, v
         elif isinstance(w, Example):
-            s, v = w.whereBuilder()
+            s, v = w.whereBuilder(largeIn)
             whereStr = ' (' + s + ') '
             return whereStr, v
 
-    def whereBuilder(self):
+    def whereBuilder(self, largeIn = None):
         ''' 编译生成where后面的语句
         --
+            @param largeIn: (阈值, 处理方式)，值的数量超过阈值的IN/NOT IN列表改写为JSON_TABLE或临时表子查询，
+                            由Orm.setLargeInThreshold设置，None表示不改写
             @example
                 Example().andEqualTo({'name':'张三', 'age':18}).andInValues('id', [1, 2, 3]).orLike('title', '%a%').whereBuilder()
                 @print (' name = %s  AND  age = %s  AND  id IN (%s, %s, %s)  OR  title LIKE %s ', ['张三', 18, 1, 2, 3, '%a%'])
@@ -372,7 +370,7 @@ class Example(object):
         whereStr = ''
         values = []
         for i, w in enumerate(self.where):
-            s, v = self._builder(w)
+            s, v = self._builder(w, largeIn)
 
             if i == 0:
                 whereStr += s
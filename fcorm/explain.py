@@ -0,0 +1,123 @@
+import json
+import logging
+import random
+import re
+import threading
+from .fingerprint import fingerprint
+
+__all__ = ['ExplainSampler', 'explainSQL', 'planWarnings']
+
+_log = logging.getLogger()
+
+# 可以EXPLAIN的语句
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|UPDATE|DELETE)\b', re.I)
+
+
+def explainSQL(conn, sql, values = None):
+    ''' 执行EXPLAIN FORMAT=JSON，返回解析后的执行计划
+    --
+    '''
+    cursor = conn.cursor()
+    try:
+        if values is None:
+            cursor.execute('EXPLAIN FORMAT=JSON ' + sql)
+        else:
+            cursor.execute('EXPLAIN FORMAT=JSON ' + sql, values)
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    if isinstance(row, dict):
+        row = list(row.values())
+    return json.loads(row[0])
+
+
+def planWarnings(plan, rowsThreshold = 10000):
+    ''' 检查执行计划，返回问题列表：全表扫描（type=ALL）、filesort、临时表、预估扫描行数超过阈值
+    --
+        @param plan: EXPLAIN FORMAT=JSON的结果
+        @param rowsThreshold: 预估扫描行数阈值
+    '''
+    warnings = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            table = node.get('table_name')
+            if node.get('access_type') == 'ALL':
+                warnings.append('full table scan on {}'.format(table))
+            if node.get('using_filesort'):
+                warnings.append('using filesort')
+            if node.get('using_temporary_table'):
+                warnings.append('using temporary table')
+            rows = node.get('rows_examined_per_scan')
+            if rows is not None and rows > rowsThreshold:
+                warnings.append('{} rows examined on {}'.format(rows, table))
+            for v in node.values():
+                walk(v)
+        elif isinstance(node, list):
+            for v in node:
+                walk(v)
+
+    walk(plan)
+    return warnings
+
+
+class ExplainSampler(object):
+    def __init__(self, rate = 0.1, rowsThreshold = 10000):
+        ''' 执行计划采样。每个语句指纹第一次出现时以rate的概率决定是否采样，
+            采样的指纹执行一次EXPLAIN FORMAT=JSON并缓存执行计划，发现问题时打印警告
+        --
+            @example
+                sampler = ExplainSampler(rate=0.2)
+                stuOrm.setExplainSampler(sampler)
+                ...
+                for r in sampler.report():
+                    print(r['calls'], r['fingerprint'], r['warnings'])
+
+            @param rate: 采样比例，0~1
+            @param rowsThreshold: 预估扫描行数阈值
+        '''
+        self.rate = rate
+        self.rowsThreshold = rowsThreshold
+        # 每个指纹的调用次数
+        self.calls = {}
+        # 每个指纹的采样结果 {指纹: (执行计划, 问题列表)}，未采样的指纹值为None
+        self.plans = {}
+        self._lock = threading.Lock()
+
+    def observe(self, conn, sql, values = None):
+        ''' 记录一次语句执行，需要采样时在conn上执行EXPLAIN
+        --
+        '''
+        if not _EXPLAINABLE.match(sql):
+            return
+        fp = fingerprint(sql)
+        with self._lock:
+            self.calls[fp] = self.calls.get(fp, 0) + 1
+            if fp in self.plans:
+                return
+            sampled = random.random() < self.rate
+            # 先占位，避免并发时重复EXPLAIN
+            self.plans[fp] = None
+        if not sampled:
+            return
+        try:
+            plan = explainSQL(conn, sql, values)
+        except Exception as e:
+            _log.warning('explain error: {}'.format(e))
+            return
+        warnings = planWarnings(plan, self.rowsThreshold)
+        if warnings:
+            _log.warning('slow query shape: {} {}'.format(fp, warnings))
+        with self._lock:
+            self.plans[fp] = (plan, warnings)
+
+    def report(self):
+        ''' 有问题的语句形状，按调用次数从多到少排序
+        --
+            @return: [{'fingerprint': 指纹, 'calls': 调用次数, 'warnings': 问题列表, 'plan': 执行计划}]
+        '''
+        with self._lock:
+            res = [{'fingerprint': fp, 'calls': self.calls.get(fp, 0), 'warnings': p[1], 'plan': p[0]}
+                   for fp, p in self.plans.items() if p and p[1]]
+        res.sort(key=lambda r: r['calls'], reverse=True)
+        return res
@@ -0,0 +1,26 @@
+import re
+
+__all__ = ['fingerprint']
+
+_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIMIT = re.compile(r'\bLIMIT\s+\?\s*(?:,\s*\?)?', re.I)
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    ''' 语句指纹：去掉注释（包括优化器提示），IN列表、字符串和数字常量、LIMIT参数替换为占位符，合并空白。
+        同一形状的语句指纹相同
+    --
+        @example
+            fingerprint('SELECT * FROM student WHERE `sid` IN (%s, %s) LIMIT 0, 10')
+            # 'SELECT * FROM student WHERE `sid` IN (...) LIMIT ?'
+    '''
+    sql = _COMMENT.sub(' ', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _LIMIT.sub('LIMIT ?', sql)
+    return _SPACE.sub(' ', sql).strip()
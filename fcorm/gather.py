@@ -0,0 +1,79 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION, ALL_COMPLETED
+from .pool import borrow, giveBack, copyOnConnection
+
+__all__ = ['gather', 'setMaxConcurrency']
+
+_log = logging.getLogger()
+
+# 进程内所有gather同时占用的连接数上限，None表示不限制
+_cap = None
+
+
+def setMaxConcurrency(maxConcurrency):
+    ''' 设置进程内所有gather同时执行的查询数上限，避免一个报表占满连接池
+    --
+        @param maxConcurrency: 上限，None表示不限制
+    '''
+    global _cap
+    _cap = threading.BoundedSemaphore(maxConcurrency) if maxConcurrency else None
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def gather(orm, thunks, pool, maxWorkers = 4, cancelOnError = True):
+    ''' 并发执行多个互不相关的查询，每个任务使用连接池中的一个连接，按传入顺序返回结果
+    --
+        @param orm: Orm，每个任务得到它的副本，副本使用任务自己的连接，不使用从库路由、SingleFlight和本地镜像
+        @param thunks: 任务列表，每个任务是接收一个Orm参数的函数
+        @param pool: 连接池（有connection()方法）或者返回新连接的函数
+        @param maxWorkers: 最大并发数
+        @param cancelOnError: 出错时取消还未开始的任务（已经开始的查询会执行完）
+        @return: 结果列表；有任务出错时抛出最先出现的错误
+    '''
+    thunks = list(thunks)
+    if not thunks:
+        return []
+    cancelled = threading.Event()
+    lock = threading.Lock()
+    errors = []
+
+    def run(thunk):
+        if cancelled.is_set():
+            raise _Cancelled()
+        cap = _cap
+        if cap is not None:
+            cap.acquire()
+        try:
+            if cancelled.is_set():
+                raise _Cancelled()
+            conn = borrow(pool)
+            try:
+                return thunk(copyOnConnection(orm, conn))
+            finally:
+                giveBack(pool, conn)
+        except _Cancelled:
+            raise
+        except Exception as e:
+            _log.error(e)
+            with lock:
+                errors.append(e)
+            if cancelOnError:
+                cancelled.set()
+            raise
+        finally:
+            if cap is not None:
+                cap.release()
+
+    with ThreadPoolExecutor(max_workers=min(maxWorkers, len(thunks))) as executor:
+        futures = [executor.submit(run, thunk) for thunk in thunks]
+        wait(futures, return_when=FIRST_EXCEPTION if cancelOnError else ALL_COMPLETED)
+        if errors and cancelOnError:
+            for f in futures:
+                f.cancel()
+    if errors:
+        raise errors[0]
+    return [f.result() for f in futures]
@@ -0,0 +1,178 @@
+import logging
+import re
+import threading
+from .errors import ResultTooLargeError
+from .fingerprint import fingerprint
+from .pool import rawConnection
+from .result import ResultList
+
+__all__ = ['injectLimit', 'fetchLimited', 'withinLimit', 'streamingCursor', 'resultPeaks', 'clearResultPeaks']
+
+try:
+    from pymysql.cursors import DictCursorMixin, SSCursor, SSDictCursor
+except ImportError:
+    DictCursorMixin = SSCursor = SSDictCursor = None
+
+_log = logging.getLogger()
+
+_SELECT = re.compile(r'^\s*SELECT\b', re.I)
+# 最外层出现这些关键字时不自动添加LIMIT（加锁读、写入变量或文件、多语句）
+_NO_LIMIT = re.compile(r'\b(INTO|FOR\s+UPDATE|FOR\s+SHARE|LOCK\s+IN\s+SHARE\s+MODE)\b|;', re.I)
+# 最外层末尾的LIMIT：LIMIT n、LIMIT offset, n、LIMIT n OFFSET offset
+_TAIL_LIMIT = re.compile(r'\bLIMIT\s+(?:(\d+)\s*,\s*)?(\S+)(\s+OFFSET\s+\S+)?\s*$', re.I)
+
+# 每次从游标读取的行数
+FETCH_BATCH = 1000
+
+# 每个语句指纹的最大结果 {指纹: {'rows': 最大行数, 'bytes': 最大字节数, 'calls': 次数, 'limited': 超限次数}}
+_peaks = {}
+_lock = threading.Lock()
+
+
+def _topLevel(sql):
+    ''' 把括号内（子查询、函数参数）、字符串、带引号的名字和注释替换为空格，长度不变，
+        用于只在最外层查找关键字
+    --
+    '''
+    chars = list(sql)
+    depth = 0
+    i = 0
+    n = len(sql)
+    while i < n:
+        c = sql[i]
+        if c in '\'"`':
+            end = i + 1
+            while end < n and sql[end] != c:
+                end += 2 if sql[end] == '\\' and c != '`' else 1
+            end = min(end, n - 1)
+            chars[i:end + 1] = ' ' * (end + 1 - i)
+            i = end + 1
+            continue
+        if sql.startswith('/*', i):
+            end = sql.find('*/', i + 2)
+            end = n - 1 if end < 0 else end + 1
+            chars[i:end + 1] = ' ' * (end + 1 - i)
+            i = end + 1
+            continue
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            chars[i] = ' '
+        if depth > 0:
+            chars[i] = ' '
+        i += 1
+    return ''.join(chars)
+
+
+def injectLimit(sql, maxRows):
+    ''' SELECT语句最外层没有LIMIT时添加 LIMIT maxRows+1（多取的一行用于判断是否超限，UNION时限制整个结果）；
+        最外层已有的LIMIT行数更大时改为maxRows+1。子查询中的LIMIT不影响
+    --
+    '''
+    if maxRows is None or not _SELECT.match(sql):
+        return sql
+    top = _topLevel(sql).rstrip()
+    if _NO_LIMIT.search(top):
+        return sql
+    limit = int(maxRows) + 1
+    m = _TAIL_LIMIT.search(top)
+    if m is None:
+        return '{} LIMIT {}'.format(sql.rstrip(), limit)
+    count = m.group(2)
+    if count.isdigit() and int(count) > limit:
+        return sql[:m.start(2)] + str(limit) + sql[m.end(2):]
+    return sql
+
+
+def streamingCursor(conn):
+    ''' 连接对应的不缓冲游标类型（pymysql的SSDictCursor或SSCursor），边读边计数，超限时不会已经把整个结果读到内存。
+        不是pymysql连接（或没有安装pymysql）时返回None，使用连接默认的游标
+    --
+    '''
+    if SSCursor is None:
+        return None
+    cursorClass = getattr(rawConnection(conn), 'cursorclass', None)
+    if not isinstance(cursorClass, type):
+        return None
+    return SSDictCursor if issubclass(cursorClass, DictCursorMixin) else SSCursor
+
+
+def _rowSize(row):
+    ''' 估算一行解码后的大小（字节）
+    --
+    '''
+    size = 0
+    for v in (row.values() if isinstance(row, dict) else row):
+        if isinstance(v, (str, bytes, bytearray)):
+            size += len(v)
+        else:
+            size += 8
+    return size
+
+
+def fetchLimited(cursor, orm, sql, maxRows, maxBytes, truncate, abort = None):
+    ''' 分批读取结果，超过maxRows/maxBytes时截断（truncate为True，结果的truncated为True）或者抛出ResultTooLargeError，
+        并记录语句指纹的最大结果
+    --
+        @param abort: 超限时调用，丢弃不缓冲游标上剩余的结果（中止语句、关闭游标）
+    '''
+    res = ResultList(orm)
+    size = 0
+    limited = False
+    while not limited:
+        rows = cursor.fetchmany(FETCH_BATCH)
+        if not rows:
+            break
+        for row in rows:
+            rowSize = _rowSize(row)
+            if (maxRows is not None and len(res) >= maxRows) or (maxBytes is not None and size + rowSize > maxBytes):
+                limited = True
+                break
+            res.append(row)
+            size += rowSize
+    if limited and abort is not None:
+        abort()
+
+    fp = fingerprint(sql)
+    with _lock:
+        peak = _peaks.get(fp)
+        if peak is None:
+            peak = _peaks[fp] = {'rows': 0, 'bytes': 0, 'calls': 0, 'limited': 0}
+        peak['rows'] = max(peak['rows'], len(res) + (1 if limited else 0))
+        peak['bytes'] = max(peak['bytes'], size)
+        peak['calls'] += 1
+        if limited:
+            peak['limited'] += 1
+
+    if limited:
+        if not truncate:
+            raise ResultTooLargeError('查询结果超过限制（maxRows={}, maxBytes={}）：{}'.format(maxRows, maxBytes, fp), len(res), size)
+        res.truncated = True
+    return res
+
+
+def withinLimit(rows, maxRows, maxBytes):
+    ''' 已经在内存中的结果（如本地镜像的结果）是否不超过maxRows/maxBytes
+    --
+    '''
+    if maxRows is not None and len(rows) > maxRows:
+        return False
+    return maxBytes is None or sum(_rowSize(row) for row in rows) <= maxBytes
+
+
+def resultPeaks():
+    ''' 按最大行数从大到小返回各语句指纹的最大结果，用于找出可能返回大量数据的调用
+    --
+        @example
+            for r in resultPeaks()[:10]:
+                print(r['rows'], r['bytes'], r['limited'], r['fingerprint'])
+    '''
+    with _lock:
+        items = [dict(v, fingerprint=k) for k, v in _peaks.items()]
+    return sorted(items, key=lambda r: (-r['rows'], -r['bytes']))
+
+
+def clearResultPeaks():
+    with _lock:
+        _peaks.clear()
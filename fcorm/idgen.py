@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+from .errors import wrapError
+
+__all__ = ['HiLoGenerator', 'SnowflakeGenerator']
+
+_log = logging.getLogger()
+
+
+class HiLoGenerator(object):
+    def __init__(self, conn, name, blockSize = 1000, tableName = 'fcorm_sequence', start = 1):
+        ''' 号段主键生成器，每次访问序列表预留blockSize个ID，用完再取下一段。序列表结构：
+                CREATE TABLE `fcorm_sequence` (
+                    `name` varchar(100) NOT NULL COMMENT '序列名',
+                    `next_value` bigint(20) NOT NULL COMMENT '下一段的起始值',
+                    PRIMARY KEY (`name`)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+            多个进程共用同一个序列时ID唯一，但不保证全局递增
+        --
+            @example
+                stuOrm.setPrimaryGenerator(HiLoGenerator(pool, 'student', blockSize=5000))
+                stuOrm.insertDictList(students)     # 一次取够所有ID
+
+            @param conn: 访问序列表的连接、连接池或者返回新连接的函数。分配号段时会提交事务，不要使用Orm手动提交模式下的连接
+            @param name: 序列名
+            @param blockSize: 每次预留的ID数
+            @param tableName: 序列表名
+            @param start: 序列不存在时的起始值
+        '''
+        self.conn = conn
+        self.name = name
+        self.blockSize = blockSize
+        self.tableName = tableName
+        self.start = start
+        # 当前号段 [next, max)
+        self._next = 0
+        self._max = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        return self.take(1)[0]
+
+    def take(self, n):
+        ''' 取n个ID，当前号段不够时一次访问序列表预留剩余所需的ID（至少blockSize个）
+        --
+        '''
+        ids = []
+        with self._lock:
+            while len(ids) < n:
+                if self._next >= self._max:
+                    self._allocate(max(self.blockSize, n - len(ids)))
+                k = min(n - len(ids), self._max - self._next)
+                ids.extend(range(self._next, self._next + k))
+                self._next += k
+        return ids
+
+    def _connection(self):
+        if hasattr(self.conn, 'cursor'):
+            return self.conn
+        if hasattr(self.conn, 'connection'):
+            return self.conn.connection()
+        return self.conn()
+
+    def _allocate(self, size):
+        ''' 预留size个ID：UPDATE ... SET next_value = LAST_INSERT_ID(next_value + size)，UPDATE的行锁保证并发唯一，
+            新的next_value由OK包返回（cursor.lastrowid），不需要再查询LAST_INSERT_ID()；加上提交共两次往返
+        --
+        '''
+        conn = self._connection()
+        cursor = conn.cursor()
+        try:
+            sql = 'UPDATE `{}` SET `next_value` = LAST_INSERT_ID(`next_value` + %s) WHERE `name` = %s'.format(self.tableName)
+            if not cursor.execute(sql, [size, self.name]):
+                # 序列不存在，创建后重试
+                cursor.execute('INSERT IGNORE INTO `{}`(`name`, `next_value`) VALUES(%s, %s)'.format(self.tableName), [self.name, self.start])
+                cursor.execute(sql, [size, self.name])
+            high = cursor.lastrowid
+            if not high:
+                raise Exception('没有取得号段，请检查序列表！')
+            conn.commit()
+        except Exception as e:
+            _log.error(e)
+            try:
+                conn.rollback()
+            except Exception as e2:
+                _log.error(e2)
+            raise wrapError(e, 'HiLoGenerator allocate error; name:{}'.format(self.name))
+        finally:
+            cursor.close()
+            if conn is not self.conn:
+                conn.close()
+        self._next = high - size
+        self._max = high
+
+
+class SnowflakeGenerator(object):
+    # 机器号和序号的位数
+    WORKER_BITS = 10
+    SEQUENCE_BITS = 12
+
+    def __init__(self, workerId, epoch = 1288834974657, maxLag = 1):
+        ''' 雪花算法主键生成器：41位毫秒时间戳 | 10位机器号 | 12位序号，不访问数据库。
+            ID中的时间戳不会超过当前时间：一毫秒内的4096个序号用完时等到下一毫秒；时钟回拨时等待时钟追上上次的时间，
+            因此进程重启后（时钟没有回拨到重启前）也不会与之前的ID重复。回拨超过maxLag秒时抛出异常，不长时间阻塞。
+            预留序号时加锁：读时钟、与上次的序号比较、序号用完或时钟回拨时等待必须一起完成；
+            无锁的计数器在追上当前时间时要替换计数器，持有旧计数器的线程可能发出重复的ID，而在GIL下无锁也不会更快。
+            锁内只有几次整数运算，批量写入通过take(n)每批只加一次锁
+        --
+            @example
+                stuOrm.setPrimaryGenerator(SnowflakeGenerator(workerId=3))
+
+            @param workerId: 机器号 0~1023，同时运行的进程必须不同
+            @param epoch: 起始时间（毫秒时间戳）
+            @param maxLag: 时钟回拨时最多等待的秒数
+        '''
+        if not 0 <= workerId < (1 << self.WORKER_BITS):
+            raise Exception('机器号必须在0~{}之间！'.format((1 << self.WORKER_BITS) - 1))
+        self.workerId = workerId
+        self.epoch = epoch
+        self.maxLag = maxLag
+        self._workerPart = workerId << self.SEQUENCE_BITS
+        self._lock = threading.Lock()
+        # 上一个发出的序号：(毫秒 - epoch) << 12 | 毫秒内序号
+        self._last = -1
+
+    def _nowMs(self):
+        return int(time.time() * 1000) - self.epoch
+
+    def _waitUntil(self, ms):
+        ''' 等到当前时间不早于ms（相对epoch的毫秒）
+        --
+        '''
+        now = self._nowMs()
+        while now < ms:
+            time.sleep((ms - now) / 1000.0)
+            now = self._nowMs()
+
+    def _reserve(self, n):
+        ''' 预留n个连续的序号，返回第一个；最后一个序号的毫秒不晚于当前时间
+        --
+        '''
+        with self._lock:
+            now = self._nowMs()
+            back = (self._last >> self.SEQUENCE_BITS) - now
+            if back > self.maxLag * 1000:
+                raise Exception('系统时钟回拨{}毫秒，超过{}秒，停止生成ID！'.format(back, self.maxLag))
+            first = max(self._last + 1, now << self.SEQUENCE_BITS)
+            last = first + n - 1
+            self._waitUntil(last >> self.SEQUENCE_BITS)
+            self._last = last
+        return first
+
+    def _toId(self, seq):
+        mask = (1 << self.SEQUENCE_BITS) - 1
+        return ((seq >> self.SEQUENCE_BITS) << (self.WORKER_BITS + self.SEQUENCE_BITS)) | self._workerPart | (seq & mask)
+
+    def __call__(self):
+        return self._toId(self._reserve(1))
+
+    def take(self, n):
+        ''' 取n个ID，只加一次锁
+        --
+        '''
+        if n <= 0:
+            return []
+        toId = self._toId
+        first = self._reserve(n)
+        return [toId(seq) for seq in range(first, first + n)]
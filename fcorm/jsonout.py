@@ -0,0 +1,158 @@
+import datetime
+import decimal
+import json
+
+__all__ = ['JSONFetch']
+
+try:
+    from pymysql.cursors import Cursor, SSCursor
+except ImportError:
+    Cursor = SSCursor = None
+
+_dumps = json.JSONEncoder(ensure_ascii=False).encode
+_fallback = json.JSONEncoder(ensure_ascii=False, default=str).encode
+
+
+def _encodeNumber(v):
+    return str(v)
+
+
+def _encodeQuoted(v):
+    # 与json.dumps(default=str)一致：'2020-01-01 10:00:00'
+    return '"' + str(v) + '"'
+
+
+def _encodeBytes(v):
+    try:
+        return _dumps(v.decode('utf-8'))
+    except UnicodeDecodeError:
+        return _fallback(v)
+
+
+# 常见类型的快速编码，其他类型使用json.dumps(default=str)
+_ENCODERS = {
+    str: _dumps,
+    int: _encodeNumber,
+    float: _dumps,
+    decimal.Decimal: _encodeNumber,
+    datetime.datetime: _encodeQuoted,
+    datetime.date: _encodeQuoted,
+    datetime.time: _encodeQuoted,
+    datetime.timedelta: _encodeQuoted,
+    bytes: _encodeBytes,
+    bool: lambda v: 'true' if v else 'false',
+    type(None): lambda v: 'null'
+}
+
+
+class JSONFetch(object):
+    # 每次从游标读取的行数
+    FETCH_BATCH = 1000
+
+    def __init__(self, jsonLines = False, writer = None, chunkRows = 1000):
+        ''' 把查询结果直接编码为JSON字节，不经过字典和json.dumps，作为Orm._execute的fetch参数使用
+        --
+            @param jsonLines: True输出JSON Lines（每行一个对象），False输出数组
+            @param writer: 分块写出的目标，有write方法的对象或者函数；None表示返回整个bytes
+            @param chunkRows: 每块的行数
+        '''
+        self.jsonLines = jsonLines
+        self.writer = writer
+        self.chunkRows = chunkRows
+        # 不构造字典的游标，写出时使用不缓冲的游标，边读边写
+        self.cursorClass = SSCursor if writer is not None else Cursor
+        # 已经写出的字节数，写出过数据后出错不再重试
+        self.written = 0
+        self._write = None
+        if writer is not None:
+            self._write = writer.write if hasattr(writer, 'write') else writer
+
+    def _names(self, cursor):
+        ''' 字段名，与DictCursor相同：多表连接时重复的字段名为"表名.字段名"
+        --
+        '''
+        fields = getattr(getattr(cursor, '_result', None), 'fields', None)
+        if fields:
+            columns = [(f.table_name, f.name) for f in fields]
+        else:
+            columns = [(None, d[0]) for d in cursor.description or []]
+        names = []
+        for table, name in columns:
+            if name in names and table:
+                name = table + '.' + name
+            names.append(name)
+        return names
+
+    def _prefixes(self, names):
+        ''' 每个字段的前缀，每个结果集只计算一次：'{"sid":'、',"name":'...
+        --
+        '''
+        return [('{' if i == 0 else ',') + _dumps(str(name)) + ':' for i, name in enumerate(names)]
+
+    def _encodeRows(self, rows, prefixes, parts):
+        ''' 编码一组行（元组或字典）追加到parts，数组格式每行前加','，JSON Lines格式每行后加换行
+        --
+        '''
+        encoders = _ENCODERS
+        append = parts.append
+        jsonLines = self.jsonLines
+        empty = '{}' if not prefixes else None
+        for row in rows:
+            if not jsonLines:
+                append(',')
+            if empty is not None:
+                append(empty)
+            else:
+                for prefix, v in zip(prefixes, row.values() if isinstance(row, dict) else row):
+                    append(prefix)
+                    encode = encoders.get(type(v))
+                    append(encode(v) if encode is not None else _fallback(v))
+                append('}')
+            if jsonLines:
+                append('\n')
+
+    def __call__(self, cursor):
+        ''' 读取游标中的所有行并编码；有writer时返回写出的字节数，否则返回bytes
+        --
+        '''
+        prefixes = self._prefixes(self._names(cursor))
+        write = self._write
+        size = self.chunkRows if write is not None else self.FETCH_BATCH
+        chunks = []
+        total = 0
+        first = True
+
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                break
+            parts = []
+            if first:
+                if isinstance(rows[0], dict):
+                    # 字典游标按字典的键（多表连接时重名字段为"表名.字段名"）
+                    prefixes = self._prefixes(list(rows[0].keys()))
+                self._encodeRows(rows, prefixes, parts)
+                if not self.jsonLines:
+                    # 第一行前的','换成'['
+                    parts[0] = '['
+                first = False
+            else:
+                self._encodeRows(rows, prefixes, parts)
+            data = ''.join(parts).encode('utf-8')
+            if write is None:
+                chunks.append(data)
+            else:
+                write(data)
+                total += len(data)
+                self.written = total
+
+        if self.jsonLines:
+            tail = b''
+        else:
+            tail = b'[]' if first else b']'
+        if write is None:
+            chunks.append(tail)
+            return b''.join(chunks)
+        if tail:
+            write(tail)
+        return total + len(tail)
@@ -0,0 +1,79 @@
+import itertools
+import json
+import logging
+from .constant import JSON_TABLE, TEMP_TABLE
+
+__all__ = ['InSpill', 'largeInSQL', 'createSpill', 'dropSpill']
+
+_log = logging.getLogger()
+
+# 临时表序号
+_counter = itertools.count(1)
+
+# 临时表每条INSERT写入的值数
+INSERT_BATCH = 5000
+
+
+class InSpill(object):
+    __slots__ = ('name', 'values', 'columnType')
+
+    def __init__(self, values, columnType, name = None):
+        ''' 需要写入临时表的IN列表，作为参数占位，执行前由Orm取出并建表
+        --
+            @param name: 临时表名，默认自动生成；replayWorkload按记录的表名重建
+        '''
+        self.name = name or '_fcorm_in_{}'.format(next(_counter))
+        self.values = values
+        self.columnType = columnType
+
+    def __repr__(self):
+        return 'InSpill({}, {} values)'.format(self.name, len(self.values))
+
+
+def _columnType(values):
+    ''' 根据值推断列类型，整数为BIGINT，其他为VARCHAR
+    --
+    '''
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return 'BIGINT'
+    size = max([len(str(v)) for v in values] + [1])
+    return 'VARCHAR({})'.format(size)
+
+
+def largeInSQL(key, sign, values, method):
+    ''' 把大IN列表改写为子查询
+        JSON_TABLE: key IN (SELECT `v` FROM JSON_TABLE(%s, '$[*]' COLUMNS(`v` 类型 PATH '$')) `_in`)，参数为JSON数组
+        TEMP_TABLE: key IN (SELECT `v` FROM `临时表`)，参数为InSpill
+    --
+        @return: (条件, 参数列表)
+    '''
+    values = list(dict.fromkeys(values))
+    columnType = _columnType(values)
+    if method == JSON_TABLE:
+        sub = "SELECT `v` FROM JSON_TABLE(%s, '$[*]' COLUMNS(`v` {} PATH '$')) `_in`".format(columnType)
+        return ' {} {} ({}) '.format(key, sign, sub), [json.dumps(values, default=str, ensure_ascii=False)]
+    if method == TEMP_TABLE:
+        spill = InSpill(values, columnType)
+        return ' {} {} (SELECT `v` FROM `{}`) '.format(key, sign, spill.name), [spill]
+    raise Exception('不支持的大IN列表处理方式：{}'.format(method))
+
+
+def createSpill(cursor, spill):
+    ''' 创建临时表并写入值
+    --
+    '''
+    cursor.execute('CREATE TEMPORARY TABLE `{}` (`v` {} NULL, KEY (`v`))'.format(spill.name, spill.columnType))
+    values = spill.values
+    for i in range(0, len(values), INSERT_BATCH):
+        chunk = values[i:i + INSERT_BATCH]
+        cursor.execute('INSERT INTO `{}` (`v`) VALUES {}'.format(spill.name, ', '.join(['(%s)'] * len(chunk))), chunk)
+
+
+def dropSpill(cursor, spill):
+    ''' 删除临时表
+    --
+    '''
+    try:
+        cursor.execute('DROP TEMPORARY TABLE IF EXISTS `{}`'.format(spill.name))
+    except Exception as e:
+        _log.error('drop temporary table error: {}'.format(e))
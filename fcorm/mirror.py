@@ -0,0 +1,491 @@
+import datetime
+import decimal
+import logging
+import re
+import sqlite3
+import threading
+import time
+from .result import ResultList
+from .subquery import SubQuery
+
+__all__ = ['SQLiteMirror']
+
+_log = logging.getLogger()
+
+# MySQL字段类型 -> 镜像中的比较方式，不在其中的类型（FLOAT、TIME、BLOB、JSON、SET等）的条件回退到MySQL
+_FAMILIES = {
+    'tinyint': 'int', 'smallint': 'int', 'mediumint': 'int', 'int': 'int', 'integer': 'int', 'bigint': 'int', 'year': 'int',
+    'double': 'real', 'real': 'real',
+    'decimal': 'decimal', 'numeric': 'decimal',
+    'char': 'text', 'varchar': 'text', 'tinytext': 'text', 'text': 'text', 'mediumtext': 'text', 'longtext': 'text',
+    'enum': 'enum',
+    'datetime': 'datetime', 'timestamp': 'datetime',
+    'date': 'date'
+}
+# SQLite中的列类型（类型亲和性）
+_AFFINITY = {'int': 'INTEGER', 'real': 'REAL', 'decimal': 'REAL', 'text': 'TEXT', 'enum': 'TEXT', 'datetime': 'TEXT', 'date': 'TEXT'}
+# 各比较方式支持的运算符；不区分大小写的字符串和ENUM只支持相等比较（排序规则与SQLite不同）
+_RANGE_OPS = ('=', '<>', '!=', '<', '>', '<=', '>=', 'IN', 'NOT IN', 'BETWEEN', 'NOT BETWEEN')
+_EQUAL_OPS = ('=', '<>', '!=', 'IN', 'NOT IN')
+# float能精确保存并保持大小顺序的十进制有效位数
+_DECIMAL_DIGITS = 15
+
+_INTEGER = re.compile(r'^\s*[+-]?\d+\s*$')
+_NUMBER = re.compile(r'^\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*$')
+_DATETIME = re.compile(r'^\d{4}-\d{2}-\d{2}( \d{2}:\d{2}:\d{2}(\.\d{1,6})?)?$')
+_ORDER = re.compile(r'\s*`([^`]+)`(?:\.`([^`]+)`)?\s+(ASC|DESC)\s*(,|$)', re.I)
+
+
+class _Inexact(Exception):
+    ''' 条件或值在SQLite中的结果可能与MySQL不同，回退到MySQL
+    '''
+    pass
+
+
+def _inferFamily(values):
+    ''' 没有表结构时按查询到的值推断字段的比较方式，值的类型不一致时返回None
+    --
+    '''
+    families = set()
+    for v in values:
+        if v is None:
+            continue
+        if isinstance(v, bool) or isinstance(v, int):
+            families.add('int')
+        elif isinstance(v, float):
+            families.add('real')
+        elif isinstance(v, decimal.Decimal):
+            families.add('decimal')
+        elif isinstance(v, str):
+            families.add('text')
+        elif isinstance(v, datetime.datetime):
+            families.add('datetime')
+        elif isinstance(v, datetime.date):
+            families.add('date')
+        else:
+            return None
+    return families.pop() if len(families) == 1 else None
+
+
+def _decimalToFloat(v):
+    ''' DECIMAL转float，有效位数超过float能精确表示的范围时抛出_Inexact
+    --
+    '''
+    if not v.is_finite() or len(v.normalize().as_tuple().digits) > _DECIMAL_DIGITS:
+        raise _Inexact('decimal {}'.format(v))
+    return float(v)
+
+
+class SQLiteMirror(object):
+    def __init__(self, indexes = None, changeColumn = None, maxStaleness = 60, fullReloadInterval = 3600, caseSensitive = False):
+        ''' 把读多写少的小表（如course、teacher）加载到进程内的SQLite中，selectByExample/selectByPrimaeyKey
+            直接从内存返回，不再访问数据库。返回的是从MySQL读到的原始行（的副本），类型与直接查询一致；SQLite中只保存用于比较的值。
+            只有能得到与MySQL完全一致结果的条件在镜像中执行：字段类型取自Orm的表结构（建议先loadSchema，
+            否则按查询到的值推断），参数按字段类型转换（如INT字段的'1'转换为1）；LIKE、子查询、其他表的字段、
+            末尾有空格的字符串、超过15位有效数字的DECIMAL、FLOAT/TIME/BLOB等类型的条件自动回退到MySQL
+        --
+            @example
+                courseOrm = Orm(db, 'course', 'cid').setMirror(SQLiteMirror(indexes=['tid'], changeColumn='updated_at', maxStaleness=5))
+                courseOrm.selectByPrimaeyKey(1)                             # 内存
+                courseOrm.selectByExample(Example().andEqualTo({'tid': 1}))  # SQLite
+                courseOrm.selectByPrimaeyKey(1, usePrimary=True)            # MySQL
+
+            @param indexes: SQLite中建立索引的字段，元素为字段名或字段名元组（联合索引），主键自动建立索引
+            @param changeColumn: 修改时间等递增字段，设置后超过maxStaleness时只拉取该字段大于等于上次最大值的行；
+                            不设置则每次全量重新加载
+            @param maxStaleness: 最大允许的数据延迟（秒），查询时超过则先刷新
+            @param fullReloadInterval: 全量重新加载的间隔（秒），增量拉取无法发现其他进程删除的行
+            @param caseSensitive: 字符串字段是否使用区分大小写的*_bin排序规则。默认按*_ci处理：字段中的值都是
+                            可见ASCII字符时才在镜像中比较，并且只支持相等比较；否则该字段的条件回退到MySQL
+        '''
+        self.orm = None
+        self.indexes = indexes or []
+        self.changeColumn = changeColumn
+        self.maxStaleness = maxStaleness
+        self.fullReloadInterval = fullReloadInterval
+        self.caseSensitive = caseSensitive
+        # 统计：hits 从镜像返回，fallbacks 回退到MySQL，reloads 全量加载次数，pulls 增量拉取次数
+        self.stats = {'hits': 0, 'fallbacks': 0, 'reloads': 0, 'pulls': 0}
+        self._lock = threading.RLock()
+        self._refreshLock = threading.Lock()
+        self._db = None
+        self._columns = []
+        # {字段名: 比较方式}，以及可以在镜像中比较的字段
+        self._families = {}
+        self._exact = set()
+        # {_rid: 原始行}
+        self._rows = {}
+        # {主键值元组: _rid}
+        self._keyIndex = {}
+        # 查询结果中是否包含主键字段
+        self._hasKeys = False
+        self._nextRid = 1
+        self._watermark = None
+        self._loadedAt = 0
+        self._reloadedAt = 0
+        self._needReload = True
+
+    def bind(self, orm):
+        ''' 绑定数据来源的Orm，由Orm.setMirror调用
+        --
+        '''
+        self.orm = orm
+        return self
+
+    def markStale(self):
+        ''' 本进程写入了数据，下次查询前全量重新加载
+        --
+        '''
+        self._needReload = True
+
+    def _fetch(self, sql, values = None):
+        ''' 读取数据，不受setResultLimit限制（否则镜像会被截断或者加载失败）
+        --
+        '''
+        return self.orm._execute(sql, values, fetch=lambda cursor: list(cursor.fetchall()))
+
+    def _storeValue(self, family, v):
+        ''' 字段值转换为SQLite中保存的值，不能精确比较时抛出_Inexact
+        --
+        '''
+        if v is None:
+            return None
+        if family == 'int' and isinstance(v, int):
+            return int(v)
+        if family in ('real', 'decimal') and isinstance(v, (int, float, decimal.Decimal)) and not isinstance(v, bool):
+            return _decimalToFloat(v) if isinstance(v, decimal.Decimal) else float(v)
+        if family in ('text', 'enum') and isinstance(v, str):
+            return self._text(v)
+        if family == 'datetime' and isinstance(v, datetime.datetime):
+            return v.isoformat(' ')
+        if family == 'date' and isinstance(v, datetime.date) and not isinstance(v, datetime.datetime):
+            return v.isoformat()
+        raise _Inexact('{} value {!r}'.format(family, v))
+
+    def _text(self, v):
+        ''' 字符串：末尾有空格时（PAD SPACE与NO PAD排序规则结果不同）、不区分大小写时有非可见ASCII字符时不能精确比较
+        --
+        '''
+        if v.endswith(' ') or any(c < ' ' for c in v):
+            raise _Inexact('trailing space or control character')
+        if self.caseSensitive:
+            return v
+        if any(c > '~' for c in v):
+            raise _Inexact('non-ASCII text')
+        return v.upper()
+
+    def _storeRow(self, row, columns, families, exact):
+        ''' 一行转换为SQLite中保存的值；不能精确保存的字段从exact中移除，之后该字段的条件回退到MySQL
+        --
+        '''
+        values = []
+        for c in columns:
+            v = None
+            if c in exact:
+                try:
+                    v = self._storeValue(families[c], row.get(c))
+                except _Inexact:
+                    exact.discard(c)
+            values.append(v)
+        return values
+
+    def _paramValue(self, column, v):
+        ''' 查询参数按字段类型转换，与MySQL的隐式转换一致；不能精确比较时抛出_Inexact
+        --
+        '''
+        if column not in self._exact:
+            raise _Inexact('column {}'.format(column))
+        family = self._families[column]
+        if v is None:
+            return None
+        if family in ('int', 'real', 'decimal'):
+            if isinstance(v, str):
+                if _INTEGER.match(v):
+                    v = int(v)
+                elif _NUMBER.match(v):
+                    v = decimal.Decimal(v.strip())
+                else:
+                    raise _Inexact('{} param {!r}'.format(family, v))
+            if isinstance(v, bool):
+                v = int(v)
+            if isinstance(v, decimal.Decimal):
+                v = int(v) if v.is_finite() and v == v.to_integral_value() and abs(v) < 2 ** 63 else _decimalToFloat(v)
+            if isinstance(v, int) and abs(v) < 2 ** 63:
+                return v
+            if isinstance(v, float) and v == v and abs(v) != float('inf'):
+                return v
+            raise _Inexact('{} param {!r}'.format(family, v))
+        if family in ('text', 'enum'):
+            if not isinstance(v, str):
+                raise _Inexact('{} param {!r}'.format(family, v))
+            return self._text(v)
+        if isinstance(v, str):
+            if not _DATETIME.match(v):
+                raise _Inexact('{} param {!r}'.format(family, v))
+            if '.' in v:
+                # 补齐到6位小数，兼容只接受3或6位小数的fromisoformat
+                v = v + '0' * (26 - len(v))
+            v = datetime.datetime.fromisoformat(v)
+        if isinstance(v, datetime.datetime):
+            if family == 'date' and v.time() == datetime.time():
+                return v.date().isoformat()
+            return v.isoformat(' ')
+        if isinstance(v, datetime.date):
+            return v.isoformat() if family == 'date' else datetime.datetime.combine(v, datetime.time()).isoformat(' ')
+        raise _Inexact('{} param {!r}'.format(family, v))
+
+    def _column(self, key):
+        ''' 条件中的字段名，其他表的字段抛出_Inexact
+        --
+        '''
+        if '.' in key:
+            table, key = key.split('.', 1)
+            if table != self.orm.tableName:
+                raise _Inexact('column {}.{}'.format(table, key))
+        if key not in self._exact:
+            raise _Inexact('column {}'.format(key))
+        return key
+
+    def _condition(self, key, value, op):
+        ''' 编译单个条件为SQLite语句
+        --
+        '''
+        if key is None or isinstance(value, SubQuery):
+            raise _Inexact('subquery')
+        column = self._column(key)
+        op = op.upper()
+        if op not in (_RANGE_OPS if self._ordered(column) else _EQUAL_OPS):
+            raise _Inexact('{} on {}'.format(op, column))
+        if op in ('IN', 'NOT IN'):
+            if not value:
+                raise _Inexact('empty IN')
+            return '"{}" {} ({})'.format(column, op, ', '.join(['?'] * len(value))), [self._paramValue(column, v) for v in value]
+        if op in ('BETWEEN', 'NOT BETWEEN'):
+            return '"{}" {} ? AND ?'.format(column, op), [self._paramValue(column, v) for v in value]
+        return '"{}" {} ?'.format(column, op), [self._paramValue(column, value)]
+
+    def _ordered(self, column):
+        ''' 字段的大小顺序在SQLite与MySQL中是否一致
+        --
+        '''
+        family = self._families.get(column)
+        return family in ('int', 'real', 'decimal', 'datetime', 'date') or (family == 'text' and self.caseSensitive)
+
+    def _compile(self, example):
+        ''' 编译Example为SQLite条件，不能精确执行时抛出_Inexact
+        --
+        '''
+        if not example.where:
+            raise _Inexact('empty example')
+        parts = []
+        values = []
+        for i, w in enumerate(example.where):
+            if isinstance(w, tuple):
+                s, v = self._condition(*w)
+            else:
+                s, v = self._compile(w)
+                s = '(' + s + ')'
+            if i:
+                parts.append(example.orAnd[i - 1].upper())
+            parts.append(s)
+            values.extend(v)
+        return ' '.join(parts), values
+
+    def _orderBy(self, orderByStr):
+        ''' 编译Orm.orderByClause生成的排序
+        --
+        '''
+        orderByStr = orderByStr.strip()
+        if not orderByStr:
+            return ''
+        if not orderByStr.upper().startswith('ORDER BY'):
+            raise _Inexact(orderByStr)
+        rest = orderByStr[len('ORDER BY'):]
+        items = []
+        pos = 0
+        while pos < len(rest):
+            m = _ORDER.match(rest, pos)
+            if m is None:
+                raise _Inexact(orderByStr)
+            column = self._column(m.group(1) + '.' + m.group(2) if m.group(2) else m.group(1))
+            if not self._ordered(column):
+                raise _Inexact('ORDER BY {}'.format(column))
+            items.append('"{}" {}'.format(column, m.group(3).upper()))
+            pos = m.end()
+        return 'ORDER BY ' + ', '.join(items)
+
+    def reload(self):
+        ''' 全量加载
+        --
+        '''
+        orm = self.orm
+        rows = self._fetch('SELECT * FROM `{}`'.format(orm.tableName))
+        if rows:
+            columns = list(rows[0].keys())
+        else:
+            columns = list(orm.schema.columns) if orm.schema else []
+        types = orm.schema.types if orm.schema else {}
+        families = {}
+        for c in columns:
+            if c in types:
+                families[c] = _FAMILIES.get(types[c].lower())
+            else:
+                families[c] = _inferFamily(row.get(c) for row in rows)
+        exact = set(c for c in columns if families[c] is not None)
+
+        db = sqlite3.connect(':memory:', check_same_thread=False)
+        columnsStr = ''.join(', "{}" {}'.format(c, _AFFINITY.get(families[c], '')) for c in columns)
+        db.execute('CREATE TABLE "{}" (_rid INTEGER PRIMARY KEY{})'.format(orm.tableName, columnsStr))
+
+        allRows = {}
+        stored = []
+        for rid, row in enumerate(rows, 1):
+            allRows[rid] = row
+            stored.append([rid] + self._storeRow(row, columns, families, exact))
+        sql = 'INSERT INTO "{}" VALUES (?{})'.format(orm.tableName, ', ?' * len(columns))
+        db.executemany(sql, stored)
+
+        keys = orm._primaryKeys()
+        hasKeys = all(k in exact for k in keys)
+        keyIndex = {}
+        if hasKeys:
+            positions = [columns.index(k) + 1 for k in keys]
+            for values in stored:
+                keyIndex[tuple(values[i] for i in positions)] = values[0]
+        indexes = ([tuple(keys)] if hasKeys else []) + [(i,) if isinstance(i, str) else tuple(i) for i in self.indexes]
+        for n, index in enumerate(indexes):
+            if all(c in columns for c in index):
+                db.execute('CREATE INDEX "_idx{}" ON "{}" ({})'.format(n, orm.tableName, ', '.join('"{}"'.format(c) for c in index)))
+        db.commit()
+
+        with self._lock:
+            old = self._db
+            self._db = db
+            self._columns = columns
+            self._families = families
+            self._exact = exact
+            self._rows = allRows
+            self._keyIndex = keyIndex
+            self._hasKeys = hasKeys
+            self._nextRid = len(rows) + 1
+            self._watermark = self._maxWatermark(rows, None)
+            self._loadedAt = self._reloadedAt = time.monotonic()
+            self._needReload = False
+            self.stats['reloads'] += 1
+        if old is not None:
+            old.close()
+
+    def pull(self):
+        ''' 增量拉取changeColumn大于等于上次最大值的行
+        --
+        '''
+        orm = self.orm
+        if self._watermark is None:
+            return self.reload()
+        rows = self._fetch('SELECT * FROM `{}` WHERE `{}` >= %s'.format(orm.tableName, self.changeColumn), [self._watermark])
+        if not self._hasKeys or any(set(row.keys()) != set(self._columns) for row in rows):
+            # 表结构变化，或者没有可用的主键无法定位要替换的行
+            return self.reload()
+        keys = orm._primaryKeys()
+        columns = self._columns
+        exact = set(self._exact)
+        stored = [self._storeRow(row, columns, self._families, exact) for row in rows]
+        if not all(k in exact for k in keys):
+            # 新的主键值不能精确比较，无法维护主键索引
+            return self.reload()
+        with self._lock:
+            positions = [columns.index(k) for k in keys]
+            sql = 'INSERT OR REPLACE INTO "{}" VALUES (?{})'.format(orm.tableName, ', ?' * len(columns))
+            for row, values in zip(rows, stored):
+                key = tuple(values[i] for i in positions)
+                rid = self._keyIndex.get(key)
+                if rid is None:
+                    rid = self._nextRid
+                    self._nextRid += 1
+                    self._keyIndex[key] = rid
+                self._rows[rid] = row
+                self._db.execute(sql, [rid] + values)
+            self._db.commit()
+            self._exact = exact
+            self._watermark = self._maxWatermark(rows, self._watermark)
+            self._loadedAt = time.monotonic()
+            self.stats['pulls'] += 1
+
+    def _maxWatermark(self, rows, current):
+        if not self.changeColumn:
+            return None
+        values = [row[self.changeColumn] for row in rows if row.get(self.changeColumn) is not None]
+        if current is not None:
+            values.append(current)
+        return max(values) if values else None
+
+    def _refreshNeeded(self):
+        ''' 需要的刷新方式：reload、pull或者None
+        --
+        '''
+        now = time.monotonic()
+        if self._db is None or self._needReload or now - self._reloadedAt >= self.fullReloadInterval:
+            return 'reload'
+        if now - self._loadedAt >= self.maxStaleness:
+            return 'pull' if self.changeColumn else 'reload'
+        return None
+
+    def _ensureFresh(self):
+        if self._refreshNeeded() is None:
+            return
+        with self._refreshLock:
+            # 等待锁期间其他线程可能已经刷新
+            how = self._refreshNeeded()
+            if how == 'reload':
+                self.reload()
+            elif how == 'pull':
+                self.pull()
+
+    def selectByPrimaryKey(self, primaryValues):
+        ''' 根据主键查询，镜像不可用时返回False（调用方回退到MySQL）
+        --
+        '''
+        try:
+            self._ensureFresh()
+        except Exception as e:
+            _log.error('mirror refresh error: {}'.format(e))
+            self.stats['fallbacks'] += 1
+            return False
+        with self._lock:
+            try:
+                if not self._hasKeys:
+                    raise _Inexact('primary key')
+                key = tuple(self._paramValue(k, v) for k, v in zip(self.orm._primaryKeys(), primaryValues))
+            except _Inexact as e:
+                _log.debug('mirror fallback: {}'.format(e))
+                self.stats['fallbacks'] += 1
+                return False
+            rid = self._keyIndex.get(key)
+            row = self._rows.get(rid) if rid is not None else None
+        self.stats['hits'] += 1
+        return dict(row) if row is not None else None
+
+    def select(self, example, orderByStr = ''):
+        ''' 在SQLite中执行Example的条件，返回ResultList；不能得到与MySQL一致结果的条件或镜像不可用时返回None（调用方回退到MySQL）
+        --
+            @param example: Example对象
+            @param orderByStr: Orm.orderByClause生成的排序
+        '''
+        try:
+            self._ensureFresh()
+        except Exception as e:
+            _log.error('mirror refresh error: {}'.format(e))
+            self.stats['fallbacks'] += 1
+            return None
+        with self._lock:
+            try:
+                whereStr, values = self._compile(example)
+                sql = 'SELECT _rid FROM "{}" WHERE {} {}'.format(self.orm.tableName, whereStr, self._orderBy(orderByStr))
+                rids = self._db.execute(sql, values).fetchall()
+            except (_Inexact, sqlite3.Error) as e:
+                _log.debug('mirror fallback: {}'.format(e))
+                self.stats['fallbacks'] += 1
+                return None
+            rows = [dict(self._rows[r[0]]) for r in rids]
+        self.stats['hits'] += 1
+        return ResultList(self.orm, rows)
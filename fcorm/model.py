@@ -0,0 +1,241 @@
+import logging
+from fcutils import pers
+from .errors import wrapError
+
+__all__ = ['Model']
+
+_log = logging.getLogger()
+
+
+class _ModelMeta(type):
+    def __new__(mcs, name, bases, namespace):
+        ''' 根据__fields__生成__slots__
+        --
+        '''
+        fields = namespace.get('__fields__')
+        if fields is not None:
+            namespace['__slots__'] = tuple(fields)
+            namespace['_fieldSet'] = frozenset(fields)
+        else:
+            namespace.setdefault('__slots__', ())
+        return super(_ModelMeta, mcs).__new__(mcs, name, bases, namespace)
+
+
+class Model(object, metaclass=_ModelMeta):
+    ''' 声明式模型，字段使用__slots__存储，并记录被修改的字段，save()只更新修改过的字段
+    --
+        @example
+            class Student(Model):
+                __fields__ = ('sid', 'name', 'age')
+
+            Student.bind(Orm(db, 'student', 'sid'))
+            s = Student.get(1)
+            s.age = 19
+            s.save()                    # UPDATE `student` SET `age`=%s WHERE `sid`=%s
+            s.save()                    # 没有修改，不执行语句
+            s.sid = 100
+            s.save()                    # UPDATE `student` SET `sid`=%s WHERE `sid`=%s，条件使用读取时的主键
+
+            s2 = Student(name='王五', age=20)
+            s2.save()                   # INSERT，自增主键写回s2.sid
+
+            for s in Student.select(Example().andLessThan({'age': 20})):
+                s.age += 1
+            Student.saveAll(students)   # 修改字段相同的模型合并为一条UPDATE
+    '''
+    # _key: 读取/保存时的主键值，UPDATE条件使用它，修改主键字段后仍能定位到原来的行
+    __slots__ = ('_dirty', '_persisted', '_key')
+    # 绑定的Orm
+    __orm__ = None
+    # 字段名
+    __fields__ = None
+    _fieldSet = frozenset()
+    # saveAll时每条UPDATE包含的最大模型数
+    __batchSize__ = 500
+
+    def __init__(self, **kwargs):
+        ''' 新建一个未保存的模型，传入的字段视为已修改，保存时只写入这些字段
+        --
+        '''
+        for f in self.__fields__:
+            object.__setattr__(self, f, None)
+        object.__setattr__(self, '_dirty', set())
+        object.__setattr__(self, '_persisted', False)
+        object.__setattr__(self, '_key', None)
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+    def __setattr__(self, name, value):
+        if name in self._fieldSet:
+            if not self._persisted or getattr(self, name) != value:
+                self._dirty.add(name)
+        elif name not in ('_dirty', '_persisted', '_key'):
+            raise AttributeError('{}没有字段{}'.format(type(self).__name__, name))
+        object.__setattr__(self, name, value)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, self.toDict())
+
+    @classmethod
+    def bind(cls, orm):
+        ''' 绑定Orm
+        --
+        '''
+        cls.__orm__ = orm
+        return cls
+
+    @classmethod
+    def fromRow(cls, row):
+        ''' 从查询结果构造模型，视为已保存且没有修改
+        --
+        '''
+        obj = cls.__new__(cls)
+        setter = object.__setattr__
+        get = row.get
+        for f in cls.__fields__:
+            setter(obj, f, get(f))
+        setter(obj, '_dirty', set())
+        setter(obj, '_persisted', True)
+        setter(obj, '_key', obj.primaryValue() if cls.__orm__ is not None else None)
+        return obj
+
+    @classmethod
+    def get(cls, primaryValue):
+        ''' 根据主键查询，不存在返回None
+        --
+        '''
+        row = cls.__orm__.selectByPrimaeyKey(primaryValue)
+        return cls.fromRow(row) if row else None
+
+    @classmethod
+    def select(cls, example = None):
+        ''' 根据Example条件查询，不传条件则查询所有
+        --
+        '''
+        rows = cls.__orm__.selectAll() if example is None else cls.__orm__.selectByExample(example)
+        fromRow = cls.fromRow
+        return [fromRow(row) for row in rows]
+
+    def toDict(self):
+        return {f: getattr(self, f) for f in self.__fields__}
+
+    def dirtyFields(self):
+        ''' 修改过的字段
+        --
+        '''
+        return set(self._dirty)
+
+    def primaryValue(self):
+        ''' 主键值，联合主键返回元组
+        --
+        '''
+        keys = self.__orm__._primaryKeys()
+        if len(keys) == 1:
+            return getattr(self, keys[0])
+        return tuple(getattr(self, k) for k in keys)
+
+    def save(self):
+        ''' 保存：未保存的模型执行INSERT，已保存的模型只UPDATE修改过的字段，没有修改则不执行语句
+        --
+            @return: INSERT返回自增ID（主键生成器生成的主键回写到模型），UPDATE返回影响行数，没有修改返回0
+        '''
+        orm = self.__orm__
+        data = {f: getattr(self, f) for f in self._dirty}
+        if not self._persisted:
+            lastId = orm.insertOne(data)
+            self._setGeneratedKey(data, lastId)
+            object.__setattr__(self, '_persisted', True)
+            object.__setattr__(self, '_key', self.primaryValue())
+            self._dirty.clear()
+            return lastId
+        if not data:
+            return 0
+        res = orm.updateByPrimaryKey(data, self._key)
+        object.__setattr__(self, '_key', self.primaryValue())
+        self._dirty.clear()
+        return res
+
+    def _setGeneratedKey(self, data, lastId = None):
+        ''' INSERT之后回写主键：主键生成器生成的主键由insert写入data，自增主键取lastrowid
+        --
+            @param data: 传给insert的字典
+            @param lastId: 自增主键的lastrowid
+        '''
+        keys = self.__orm__._primaryKeys()
+        if len(keys) != 1:
+            return
+        key = data.get(keys[0])
+        if key:
+            object.__setattr__(self, keys[0], key)
+        elif getattr(self, keys[0]) is None and lastId:
+            object.__setattr__(self, keys[0], lastId)
+
+    @classmethod
+    def saveAll(cls, models):
+        ''' 批量保存。未保存的模型按写入字段分组批量INSERT（回写主键生成器生成的主键，不回写自增主键）；
+            已保存的模型按修改字段分组，每组合并为UPDATE ... SET `a` = CASE ... END。
+            修改了主键的模型不能批量更新（CASE按主键匹配），需要单独save()
+        --
+            @return: 影响行数之和（INSERT按模型数计算）
+        '''
+        orm = cls.__orm__
+        inserts = {}
+        updates = {}
+        keys = orm._primaryKeys()
+        for m in models:
+            if m._persisted and any(k in m._dirty for k in keys):
+                raise Exception('修改了主键的模型不能批量更新，请单独save()：{}'.format(m))
+        for m in models:
+            if not m._persisted:
+                inserts.setdefault(frozenset(m._dirty), []).append(m)
+            elif m._dirty:
+                updates.setdefault(frozenset(m._dirty), []).append(m)
+
+        total = 0
+        for fields, group in inserts.items():
+            dataList = [{f: getattr(m, f) for f in fields} for m in group]
+            orm.insertDictList(dataList)
+            for m, data in zip(group, dataList):
+                m._setGeneratedKey(data)
+                object.__setattr__(m, '_persisted', True)
+                object.__setattr__(m, '_key', m.primaryValue())
+                m._dirty.clear()
+            total += len(group)
+
+        for fields, group in updates.items():
+            for i in range(0, len(group), cls.__batchSize__):
+                chunk = group[i:i + cls.__batchSize__]
+                total += cls._updateChunk(sorted(fields), chunk)
+                for m in chunk:
+                    m._dirty.clear()
+        return total
+
+    @classmethod
+    def _updateChunk(cls, fields, models):
+        ''' 一条UPDATE更新多个模型的相同字段
+        --
+        '''
+        orm = cls.__orm__
+        keys = orm._primaryKeys()
+        pkWhere = orm._primaryWhere(False)
+        pkValues = [orm._primaryValues(m._key) for m in models]
+
+        sets = []
+        values = []
+        for f in fields:
+            sets.append('`{}` = CASE {} END'.format(f, ' '.join(['WHEN ' + pkWhere + ' THEN %s'] * len(models))))
+            for m, pk in zip(models, pkValues):
+                values.extend(pk)
+                values.append(getattr(m, f))
+        if len(keys) == 1:
+            whereStr = '`{}` IN ({})'.format(keys[0], pers(len(models)))
+        else:
+            whereStr = ' OR '.join(['(' + pkWhere + ')'] * len(models))
+        for pk in pkValues:
+            values.extend(pk)
+        sql = 'UPDATE `{}` SET {} WHERE {}'.format(orm.tableName, ', '.join(sets), whereStr)
+        try:
+            return orm._execute(sql, values, fetch='rowcount', write=True)
+        except Exception as e:
+            _log.error(e)
+            raise wrapError(e, 'saveAll error; fields:{}'.format(fields))
@@ -1,5 +1,27 @@
+import json
 import logging
-from .constant import AUTO_INCREMENT_KEYS, PRIMARY_KEY
+import time
+from contextlib import nullcontext
+from .constant import AUTO_INCREMENT_KEYS, PRIMARY_KEY, JSON_TABLE, TEMP_TABLE
+from .router import ReplicaRouter
+from .result import ResultList
+from .schema import loadSchema, CACHE_TTL
+from .errors import wrapError, errorCode, CONNECTION_LOST_CODES
+from .timeout import Deadline, killQuery
+from .explain import planWarnings
+from .aggregate import Aggregate
+from .pipeline import Pipeline, currentRecorder
+from .changes import keysetWhere
+from .prefetch import PageIterator
+from .gather import gather
+from .chunked import runInChunks
+from .subquery import SubQuery
+from .largein import InSpill, createSpill, dropSpill
+from .guard import injectLimit, fetchLimited, withinLimit, streamingCursor
+from .pool import connectionIdentity
+from .jsonout import JSONFetch
+from .sqlutil import quoteKey, isIdentifier
+from .example import Example
 from fcutils import fieldStrAndPer, fieldSplit, joinList, pers, dataToStr
 
 __all__ = ['Orm']
@@ -7,7 +29,7 @@ __all__ = ['Orm']
 _log = logging.getLogger()
 
 class Orm(object):
-    def __init__(self, conn, tableName, keyProperty = PRIMARY_KEY, auto_commit = True):
+    def __init__(self, conn, tableName, keyProperty = PRIMARY_KEY, auto_commit = True, replicas = None):
         ''' 操作数据库，默认自动提交；如设置为手动提交请自己使用conn.commit()提交
         --
             测试表结构如下：
@@ -110,17 +132,48 @@ class Orm(object):
     
             @param conn: 数据库连接
             @param tableName: 表名
-            @param keyProperty: 主键字段名。可以不填，不填默认主键名为id
+            @param keyProperty: 主键字段名。可以不填，不填默认主键名为id；联合主键传字段名列表，如['sid', 'cid']
             @param auto_commit: 自动提交
+            @param replicas: 从库，可以是连接/连接池列表，也可以是ReplicaRouter（多个Orm共用时传同一个）。
+                            配置后select*方法默认走从库，写操作和手动提交模式下的所有操作走主库
         '''
         # 数据库连接
         self.conn = conn
+        # 读写分离路由
+        if replicas is None or isinstance(replicas, ReplicaRouter):
+            self.router = replicas
+        else:
+            self.router = ReplicaRouter(replicas)
         # 表名
         self.tableName = tableName
         # 主键名
         self.keyProperty = keyProperty
         # 主键策略
         self.generator = AUTO_INCREMENT_KEYS
+        # 表结构元数据，调用loadSchema后才有值
+        self.schema = None
+        # 默认超时时间（秒），None表示不限制
+        self.timeout = None
+        # 超时后执行KILL QUERY的连接
+        self.killConn = None
+        # 重试策略，None表示不重试
+        self.retryPolicy = None
+        # 执行计划采样
+        self.explainSampler = None
+        # SQLite本地镜像
+        self.mirror = None
+        # 语句记录
+        self.capture = None
+        # 合并并发的相同查询
+        self.singleFlight = None
+        # 查询结果的最大行数/估算字节数，None表示不限制
+        self.maxRows = None
+        self.maxBytes = None
+        # 超限时截断结果而不是抛出异常
+        self.truncateResult = False
+        # 超过该数量的IN列表改写为子查询，None表示不改写
+        self.largeInThreshold = None
+        self.largeInMethod = JSON_TABLE
         # 多表连接
         self.joinStr = ''
         # 查询字段
@@ -141,12 +194,234 @@ class Orm(object):
         ''' 设置表的主键生成策略，不设置则默认使用数据库自增主键
         --
             @param generator: 主键生成策略，默认自增。可传入一个方法，需要主键时自动调用该方法。
-                            该方法不能传入参数，如果需要传参，请在外部调用后存入data
+                            该方法不能传入参数，如果需要传参，请在外部调用后存入data。
+                            有take(n)方法的生成器（HiLoGenerator、SnowflakeGenerator）在批量写入时一次取出所有ID
         '''
-        if isinstance(generator, function):
+        if callable(generator):
             self.generator = generator
         return self
 
+    def _useGenerator(self):
+        ''' 是否需要生成主键：设置了主键生成策略并且是单字段主键，联合主键需要在data中传入
+        --
+        '''
+        return self.generator != AUTO_INCREMENT_KEYS and not isinstance(self.keyProperty, (list, tuple))
+
+    def _generateKeys(self, n):
+        ''' 生成n个主键
+        --
+        '''
+        if hasattr(self.generator, 'take'):
+            return self.generator.take(n)
+        return [self.generator() for _ in range(n)]
+
+    def setTimeout(self, timeout, killConn = None):
+        ''' 设置默认超时时间。SELECT语句添加MAX_EXECUTION_TIME提示，其他语句设置连接的读写超时；
+            传入killConn时，超时后通过它执行KILL QUERY。超时抛出QueryTimeoutError
+        --
+            @param timeout: 超时时间（秒），None表示不限制
+            @param killConn: 执行KILL QUERY的连接，可以是连接、连接池或者返回新连接的函数，不能是本Orm使用的连接
+        '''
+        self.timeout = timeout
+        self.killConn = killConn
+        return self
+
+    def setRetryPolicy(self, policy):
+        ''' 设置重试策略，死锁、锁等待超时、连接断开时自动重试，见RetryPolicy
+        --
+            @param policy: RetryPolicy，None表示不重试
+        '''
+        self.retryPolicy = policy
+        return self
+
+    def setExplainSampler(self, sampler):
+        ''' 设置执行计划采样，对部分语句形状执行EXPLAIN并报告全表扫描等问题，见ExplainSampler
+        --
+            @param sampler: ExplainSampler，None表示关闭
+        '''
+        self.explainSampler = sampler
+        return self
+
+    def setResultLimit(self, maxRows = None, maxBytes = None, truncate = False):
+        ''' 限制查询结果的大小，防止误查大表占满内存。SELECT最外层没有LIMIT时自动添加LIMIT maxRows+1，
+            pymysql连接使用不缓冲的游标边读边估算解码后的大小；超限时中止语句（设置了setTimeout的killConn时KILL QUERY，
+            否则关闭游标丢弃剩余结果），抛出ResultTooLargeError，truncate为True时截断并设置结果的truncated。
+            设置后会按语句指纹记录最大结果，见resultPeaks。selectAll/selectByExample/selectAllBySQL也可以单独传入限制
+        --
+            @example
+                stuOrm.setResultLimit(maxRows=10000, maxBytes=50 * 1024 * 1024)
+                stuOrm.selectAll()                      # 超过1万行抛出ResultTooLargeError
+                stuOrm.selectAll(maxRows=100000)        # 单次调用放宽限制
+
+            @param maxRows: 最大行数
+            @param maxBytes: 最大估算字节数（字符串按长度，其他值按8字节计算）。不是pymysql的连接使用默认的缓冲游标，
+                            数据已经全部读到客户端，只有maxRows生成的LIMIT能减少传输
+            @param truncate: 超限时截断结果
+        '''
+        self.maxRows = maxRows
+        self.maxBytes = maxBytes
+        self.truncateResult = truncate
+        return self
+
+    def setCapture(self, capture):
+        ''' 记录本Orm执行的语句（参数、耗时、连接ID、相对时间），用于压测回放，见WorkloadCapture、replayWorkload
+        --
+            @param capture: WorkloadCapture，None表示关闭。本Orm的提交和回滚也会记录；手动提交模式下
+                            自己调用conn.commit()/rollback()后请调用capture.recordEnd(conn, True/False)
+        '''
+        self.capture = capture
+        return self
+
+    def setSingleFlight(self, flight):
+        ''' 合并并发的相同查询。自动提交模式下的查询（usePrimary=True或写后读窗口内的除外）按最终的SQL和参数合并，
+            相同的查询正在执行时等待并共享它的结果或异常，本Orm的写操作之后不再共享之前开始的查询，见SingleFlight
+        --
+            @param flight: SingleFlight，None表示关闭
+        '''
+        self.singleFlight = flight
+        return self
+
+    def setLargeInThreshold(self, threshold, method = JSON_TABLE):
+        ''' 设置大IN列表的阈值。andInValues/andNotInValues等的值超过阈值时不再展开为 IN (%s, %s, ...)，
+            执行时改写为子查询：
+            JSON_TABLE: 整个列表作为一个JSON参数，IN (SELECT `v` FROM JSON_TABLE(...))，需要MySQL 8.0.4+
+            TEMP_TABLE: 在执行语句的连接上创建会话临时表并分批写入，IN (SELECT `v` FROM 临时表)，执行后删除临时表
+        --
+            @example
+                stuOrm.setLargeInThreshold(1000, TEMP_TABLE)
+                stuOrm.selectByExample(Example().andInValues('sid', sids))    # sids有10万个
+
+            @param threshold: 阈值，None表示不改写
+            @param method: JSON_TABLE或者TEMP_TABLE；值不全是整数时列类型为VARCHAR，注意字符集排序规则需要与比较的字段兼容
+        '''
+        if method not in (JSON_TABLE, TEMP_TABLE):
+            raise Exception('不支持的大IN列表处理方式：{}'.format(method))
+        self.largeInThreshold = threshold
+        self.largeInMethod = method
+        return self
+
+    def _whereBuilder(self, example):
+        ''' 编译Example条件，按setLargeInThreshold的设置改写大IN列表
+        --
+        '''
+        if self.largeInThreshold is None:
+            return example.whereBuilder()
+        return example.whereBuilder((self.largeInThreshold, self.largeInMethod))
+
+    def setMirror(self, mirror):
+        ''' 设置SQLite本地镜像，自动提交模式下未设置查询字段/多表连接/分组的selectByExample、selectByPrimaeyKey
+            从镜像返回（usePrimary=True时除外），本Orm的写操作会让镜像在下次查询前重新加载，见SQLiteMirror
+        --
+            @param mirror: SQLiteMirror，None表示关闭
+        '''
+        self.mirror = mirror.bind(self) if mirror is not None else None
+        return self
+
+    def _useMirror(self, usePrimary):
+        ''' 本次查询是否可以使用本地镜像
+        --
+        '''
+        return (self.mirror is not None and not usePrimary and self.auto_commit and self.properties == ' * '
+                and not self.joinStr and not self.groupByStr and not self.havingStr and currentRecorder() is None)
+
+    def pipeline(self):
+        ''' 创建使用本Orm主库连接的Pipeline，多个操作一次网络往返，见Pipeline
+        --
+            @example
+                p = stuOrm.pipeline()
+                p.add(stuOrm.selectByPrimaeyKey, 1).add(courseOrm.selectAll)
+                student, courses = p.execute()
+        '''
+        return Pipeline(self.conn)
+
+    def gather(self, thunks, pool, maxWorkers = 4, cancelOnError = True):
+        ''' 并发执行多个互不相关的查询，每个任务使用连接池中的一个连接，按传入顺序返回结果。
+            进程内的总并发数可以通过setMaxConcurrency限制
+        --
+            @example
+                pool = PooledDB(pymysql, 10, host='localhost', user='root', passwd='pwd', db='test')
+                total, adults, courses = stuOrm.gather([
+                    lambda o: o.selectAggregateByExample([Aggregate('COUNT', alias='n')]),
+                    lambda o: o.selectByExample(Example().andGreaterThanOrEqualTo({'age': 18})),
+                    lambda o: Orm(o.conn, 'course', 'cid').selectAll()
+                ], pool, maxWorkers=3)
+
+            @param thunks: 任务列表，每个任务是接收一个Orm参数的函数，参数是本Orm使用任务连接的副本
+            @param pool: 连接池（有connection()方法）或者返回新连接的函数
+            @param maxWorkers: 最大并发数
+            @param cancelOnError: 出错时取消还未开始的任务
+        '''
+        return gather(self, thunks, pool, maxWorkers, cancelOnError)
+
+    def loadSchema(self, cacheFile = None, refresh = False, ttl = CACHE_TTL):
+        ''' 从information_schema读取表结构（进程内只读取一次，可缓存到磁盘）。读取后：
+            1. 主键以表结构为准，支持联合主键
+            2. 未设置查询字段且没有多表连接时，使用明确的字段列表代替【SELECT *】
+            3. 新增和更新前检查字段是否存在
+            4. 根据主键的增删查使用预先生成的语句
+        --
+            @example
+                studyOrm = Orm(db, 'study').loadSchema('/tmp/fcorm_schema.json')
+                studyOrm.selectByPrimaeyKey((1, 1))
+                studyOrm.selectByPrimaeyKey({'sid':1, 'cid':1})
+
+            @param cacheFile: 磁盘缓存文件
+            @param refresh: 强制重新读取
+            @param ttl: 磁盘缓存的有效期（秒），None表示不过期
+        '''
+        self.schema = loadSchema(self.conn, self.tableName, cacheFile, refresh, ttl)
+        if len(self.schema.primaryKey) == 1:
+            self.keyProperty = self.schema.primaryKey[0]
+        elif self.schema.primaryKey:
+            self.keyProperty = list(self.schema.primaryKey)
+        return self
+
+    def _primaryKeys(self):
+        ''' 主键字段列表
+        --
+        '''
+        if isinstance(self.keyProperty, (list, tuple)):
+            return list(self.keyProperty)
+        return [self.keyProperty]
+
+    def _primaryValues(self, primaryValue):
+        ''' 把主键值转换为与主键字段顺序一致的列表，联合主键可以传元组/列表或字典
+        --
+        '''
+        keys = self._primaryKeys()
+        if isinstance(primaryValue, dict):
+            values = [primaryValue.get(k) for k in keys]
+        elif len(keys) > 1:
+            values = list(primaryValue)
+        else:
+            values = [primaryValue]
+        if len(values) != len(keys) or any(v is None for v in values):
+            raise Exception('主键值与主键{}不匹配！'.format(keys))
+        return values
+
+    def _primaryWhere(self, withTable = True):
+        ''' 主键条件 `key1`=%s AND `key2`=%s
+        --
+        '''
+        if withTable:
+            return ' AND '.join('`{}`.`{}`=%s'.format(self.tableName, k) for k in self._primaryKeys())
+        return ' AND '.join('`{}`=%s'.format(k) for k in self._primaryKeys())
+
+    def _propertiesStr(self):
+        ''' 查询字段，加载了表结构且未设置查询字段、没有多表连接时使用明确的字段列表
+        --
+        '''
+        if self.schema and self.properties == ' * ' and not self.joinStr:
+            return self.schema.templates['columns']
+        return self.properties
+
+    def _isPlain(self):
+        ''' 是否没有设置任何查询条件（查询字段/多表连接/分组/排序/去重），可以直接使用预先生成的语句
+        --
+        '''
+        return (self.properties == ' * ' and not self.joinStr and not self.groupByStr 
+                and not self.orderByStr and not self.distinct)
+
     #################################### 新增操作 ####################################
     def insertData(self, *args):
         ''' 向数据库中写入数据
@@ -189,27 +464,20 @@ class Orm(object):
         if not data:
             raise Exception('数据为空！')
 
-        cursor = self.conn.cursor()
         try:
             # 如果主键不是自增，则生成主键
-            if self.generator != AUTO_INCREMENT_KEYS:   
+            if self._useGenerator():
                 if self.keyProperty not in data or data[self.keyProperty] == 0:    # 传入的data里面没有主键或者主键值为0
                     data[self.keyProperty] = self.generator()
             
+            if self.schema:
+                self.schema.checkColumns(data.keys())
             keys, ps, values = fieldSplit(data)
             sql = 'INSERT INTO `{}`({}) VALUES({})'.format(self.tableName, keys, ps)
-            _log.info(sql)
-            cursor.execute(sql, values)
-            lastId = cursor.lastrowid
-            if self.auto_commit:
-                self.conn.commit()
-            return lastId
+            return self._execute(sql, values, fetch='lastrowid', write=True)
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('insertOne error; values:{}'.format(data))
-        finally:
-            cursor.close()
+            raise wrapError(e, 'insertOne error; values:{}'.format(data))
     
     def insertMany(self, keys, data):
         ''' 插入一组数据，注意：返回的是第一条数据的ID
@@ -225,9 +493,8 @@ class Orm(object):
         if not data:
             raise Exception('数据为空！')
 
-        cursor = self.conn.cursor()
+        dataList = []
         try:
-            dataList = []
             columns = []
             if isinstance(data, dict):
                 for k in keys:
@@ -246,7 +513,7 @@ class Orm(object):
                     for d in data:
                         dd = []
                         for k in keys:
-                            if k in data:
+                            if k in d:
                                 dd.append(dataToStr(d[k]))
                                 if sign:
                                     columns.append(k)
@@ -254,31 +521,21 @@ class Orm(object):
                         if dd:
                             dataList.append(dd)
 
-            if self.generator != AUTO_INCREMENT_KEYS: 
+            if self._useGenerator():
                 if self.keyProperty not in columns:
                     columns.append(self.keyProperty)
                     if isinstance(dataList[0], list):
-                        for data in dataList:
-                            data.append(self.generator())
+                        for data, key in zip(dataList, self._generateKeys(len(dataList))):
+                            data.append(key)
                     else:
                         dataList.append(self.generator())
 
             sql = 'INSERT INTO `{}`({}) VALUES({})'.format(self.tableName, joinList(columns), pers(len(columns)))
-            _log.info(sql)
-            if isinstance(dataList[0], list):
-                cursor.executemany(sql, dataList)
-            else:
-                cursor.execute(sql, dataList)
-            lastId = cursor.lastrowid
-            if self.auto_commit:
-                self.conn.commit()
-            return lastId
+            many = isinstance(dataList[0], list)
+            return self._execute(sql, dataList, fetch='lastrowid', write=True, many=many)
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('insertList error; values:{}'.format(dataList))
-        finally:
-            cursor.close()
+            raise wrapError(e, 'insertList error; values:{}'.format(dataList))
     
     def insertDictList(self, dataList):
         ''' 插入一组数据，注意：返回的是第一条数据的ID
@@ -291,43 +548,157 @@ class Orm(object):
         if not dataList or not dataList[0]:
             raise Exception('数据为空！')
 
-        cursor = self.conn.cursor()
         try:
             values = []
             keys = ''
             ps = ''
 
+            if self._useGenerator():   # 如果主键不是自增，则生成主键
+                missing = [data for data in dataList if self.keyProperty not in data or data[self.keyProperty] == 0]
+                for data, key in zip(missing, self._generateKeys(len(missing))):
+                    data[self.keyProperty] = key
+
             for data in dataList:
-                if self.keyProperty not in data or data[self.keyProperty] == 0:    # 没有主键
-                    if self.generator != AUTO_INCREMENT_KEYS:   # 如果主键不是自增，则生成主键
-                        data[self.keyProperty] = self.generator
+                if self.schema:
+                    self.schema.checkColumns(data.keys())
                 keys, ps, vs = fieldSplit(data)
                 values.append(vs)
             
             sql = 'INSERT INTO `{}`({}) VALUES({})'.format(self.tableName, keys, ps)
-            _log.info(sql)
-            cursor.executemany(sql, values)
-            lastId = cursor.lastrowid
-            if self.auto_commit:
-                self.conn.commit()
-            return lastId
+            return self._execute(sql, values, fetch='lastrowid', write=True, many=True)
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('insertDictList error; values:{}'.format(dataList))
-        finally:
-            cursor.close()
+            raise wrapError(e, 'insertDictList error; values:{}'.format(dataList))
+
+    def copyByExample(self, targetTable, example = None, columns = None, mapping = None, chunkSize = None, pause = 0, progress = None):
+        ''' 在数据库中把符合条件的数据复制到另一个表：INSERT INTO target (...) SELECT ... FROM 本表 WHERE ...，数据不经过客户端
+        --
+            @example
+                # 字段相同的归档表
+                stuOrm.copyByExample('student_archive', Example().andLessThan({'age': 10}))
+                # 只复制部分字段，name写入目标表的stu_name
+                stuOrm.copyByExample('student_name', example, columns=['sid', 'name'], mapping={'name': 'stu_name'})
+
+            @param targetTable: 目标表名
+            @param example: 条件，None表示所有数据
+            @param columns: 复制的字段，不填时使用表结构中的字段（需要loadSchema），没有表结构时复制所有字段（两个表字段顺序需要一致）
+            @param mapping: 字段名映射 {本表字段: 目标表字段}，不在其中的字段名称相同
+            @param chunkSize: 按主键范围分批复制，每批一个事务；None表示一条语句复制
+            @param pause: 分批时每批之后暂停的秒数
+            @param progress: 分批时的进度回调progress(已复制行数, 当前主键)
+            @return: 复制的行数
+        '''
+        def execute(whereStr, values):
+            sql = self._copySQL(targetTable, whereStr, columns, mapping)
+            return self._execute(sql, values or None, fetch='rowcount', write=True)
+
+        try:
+            if chunkSize:
+                return runInChunks(self, example, execute, chunkSize, pause, progress=progress)
+            whereStr, values = self._whereBuilder(example) if example is not None else ('', None)
+            return execute(whereStr, values)
+        except Exception as e:
+            _log.error(e)
+            raise wrapError(e, 'copyByExample error; values:{}'.format(example))
+
+    def moveByExample(self, targetTable, example, columns = None, mapping = None, chunkSize = None, pause = 0, progress = None):
+        ''' 在数据库中把符合条件的数据移动到另一个表，在一个事务中执行，出错全部回滚：
+            1. SELECT 主键 ... WHERE 条件 FOR UPDATE 锁定要移动的行
+            2. 按锁定的主键集合INSERT ... SELECT，再按同一个主键集合DELETE，
+               READ COMMITTED下两条语句之间新插入的符合条件的行不会被删除
+            参数见copyByExample，分批时每批一个事务
+        --
+            @example
+                stuOrm.moveByExample('student_archive', Example().andLessThan({'age': 10}), chunkSize=5000)
+
+            @return: 移动的行数
+        '''
+        if not example:
+            raise Exception('未传入删除条件！')
+        if not self.auto_commit:
+            raise Exception('moveByExample需要自动提交模式！')
+        if currentRecorder() is not None:
+            # 记录时查询没有结果，会跳过INSERT和DELETE
+            raise Exception('moveByExample需要先查询锁定的主键，不支持pipeline！')
+
+        keys = self._primaryKeys()
+
+        def execute(whereStr, values):
+            try:
+                sql = 'SELECT {} FROM `{}` WHERE {} FOR UPDATE'.format(
+                    ', '.join(quoteKey(k) for k in keys), self.tableName, whereStr)
+                rows = self._execute(sql, values, fetch=lambda cursor: cursor.fetchall(), usePrimary=True, commit=False)
+                if not rows:
+                    self._endTransaction(self.conn, True)
+                    return 0
+                keyWhere, keyValues = self._keySetWhere(rows)
+                sql = self._copySQL(targetTable, keyWhere, columns, mapping)
+                num = self._execute(sql, keyValues, fetch='rowcount', write=True, commit=False)
+                sql = 'DELETE FROM `{}` WHERE {}'.format(self.tableName, keyWhere)
+                self._execute(sql, keyValues, fetch='rowcount', write=True, commit=False)
+                self._endTransaction(self.conn, True)
+                return num
+            except Exception:
+                try:
+                    self._endTransaction(self.conn, False)
+                except Exception as e2:
+                    _log.error(e2)
+                raise
+
+        try:
+            if chunkSize:
+                return runInChunks(self, example, execute, chunkSize, pause, progress=progress)
+            whereStr, values = self._whereBuilder(example)
+            return execute(whereStr, values)
+        except Exception as e:
+            _log.error(e)
+            raise wrapError(e, 'moveByExample error; values:{}'.format(example))
+
+    def _keySetWhere(self, rows):
+        ''' 查询到的主键集合对应的条件，单字段主键使用IN（按setLargeInThreshold改写），联合主键使用(k1, k2) IN ((...), ...)
+        --
+            @param rows: 只包含主键字段的查询结果，字典或元组
+        '''
+        keys = self._primaryKeys()
+        keyValues = [[row[k] for k in keys] if isinstance(row, dict) else list(row) for row in rows]
+        if len(keys) == 1:
+            return self._whereBuilder(Example().andInValues(keys[0], [v[0] for v in keyValues]))
+        rowStr = '(' + ', '.join(['%s'] * len(keys)) + ')'
+        whereStr = '({}) IN ({})'.format(', '.join(quoteKey(k) for k in keys), ', '.join([rowStr] * len(keyValues)))
+        return whereStr, [v for kv in keyValues for v in kv]
+
+    def _copySQL(self, targetTable, whereStr, columns, mapping):
+        ''' 生成INSERT ... SELECT语句
+        --
+        '''
+        if columns is None:
+            if self.schema:
+                columns = self.schema.columns
+            elif mapping:
+                raise Exception('使用mapping时需要传入columns或者先loadSchema！')
+        whereStr = 'WHERE ' + whereStr if whereStr else ''
+        if columns is None:
+            return 'INSERT INTO `{}` SELECT * FROM `{}` {}'.format(targetTable, self.tableName, whereStr)
+        mapping = mapping or {}
+        return 'INSERT INTO `{}`({}) SELECT {} FROM `{}` {}'.format(
+            targetTable, ', '.join(quoteKey(mapping.get(c, c)) for c in columns),
+            ', '.join(quoteKey(c) for c in columns), self.tableName, whereStr)
 
     #################################### 更新操作 ####################################
     def updateByPrimaryKey(self, data, primaryValue = None, keys = None):
         ''' 根据主键更新数据
         --
             @param data: 要更新的数据，字典格式
-            @param primaryValue: 主键值，为None则从data中寻找主键
+            @param primaryValue: 主键值，为None则从data中寻找主键；联合主键传元组/列表或字典
             @param keys: 更新哪些列，如果此项有值则只更新data中指定的列，多余的列不会被更新
         '''
         if not primaryValue:
-            primaryValue = data.pop(self.keyProperty, None)
+            if isinstance(self.keyProperty, (list, tuple)):
+                primaryValue = {k: data.pop(k, None) for k in self.keyProperty}
+                if None in primaryValue.values():
+                    primaryValue = None
+            else:
+                primaryValue = data.pop(self.keyProperty, None)
         
         if not primaryValue:
             raise Exception('未传入主键值！')
@@ -342,22 +713,16 @@ class Orm(object):
                     data2[k] = data[k]
             data = data2
 
-        cursor = self.conn.cursor()
         try:
+            if self.schema:
+                self.schema.checkColumns(data.keys())
             fieldStr, values = fieldStrAndPer(data)
-            values.append(primaryValue)
-            sql = 'UPDATE `{}` SET {} WHERE `{}`=%s'.format(self.tableName, fieldStr, self.keyProperty)
-            _log.info(sql)
-            res = cursor.execute(sql, values)
-            if self.auto_commit:
-                self.conn.commit()
-            return res
+            values.extend(self._primaryValues(primaryValue))
+            sql = 'UPDATE `{}` SET {} WHERE {}'.format(self.tableName, fieldStr, self._primaryWhere(False))
+            return self._execute(sql, values, fetch='rowcount', write=True)
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('updateByPrimaryKey error; values:{}'.format(data))
-        finally:
-            cursor.close()
+            raise wrapError(e, 'updateByPrimaryKey error; values:{}'.format(data))
     
     def updateByExample(self, data, example, keys = None):
         ''' 根据Example条件更新
@@ -379,23 +744,48 @@ class Orm(object):
                     data2[k] = data[k]
             data = data2
 
-        cursor = self.conn.cursor()
         try:
-            whereStr, values1 = example.whereBuilder()
+            if self.schema:
+                self.schema.checkColumns(data.keys())
+            whereStr, values1 = self._whereBuilder(example)
             fieldStr, values2 = fieldStrAndPer(data)
             values2.extend(values1)
             sql = 'UPDATE `{}` SET {} WHERE {}'.format(self.tableName, fieldStr, whereStr)
-            _log.info(sql)
-            res = cursor.execute(sql, values2)
-            if self.auto_commit:
-                self.conn.commit()
-            return res
+            return self._execute(sql, values2, fetch='rowcount', write=True)
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('updateByExample error; values:{}'.format(data))
-        finally:
-            cursor.close()
+            raise wrapError(e, 'updateByExample error; values:{}'.format(data))
+
+    def updateByExampleInChunks(self, data, example, keys = None, chunkSize = 1000, pause = 0, maxLatency = None, maxLag = None, since = None, progress = None):
+        ''' 按主键范围分批更新，每批是一个单独的短事务，参数见deleteByExampleInChunks
+        --
+            @param data: 要更新的数据，字典格式
+            @param example: 更新条件
+            @param keys: 更新哪些列，如果此项有值则只更新data中指定的列，多余的列不会被更新
+            @return: 更新的行数
+        '''
+        if not example:
+            raise Exception('未传入更新条件！')
+        
+        if not data:
+            raise Exception('数据为空！')
+
+        if keys:
+            data = {k: data[k] for k in keys if k in data}
+
+        def execute(whereStr, values):
+            fieldStr, allValues = fieldStrAndPer(data)
+            allValues.extend(values)
+            sql = 'UPDATE `{}` SET {} WHERE {}'.format(self.tableName, fieldStr, whereStr)
+            return self._execute(sql, allValues, fetch='rowcount', write=True)
+
+        try:
+            if self.schema:
+                self.schema.checkColumns(data.keys())
+            return runInChunks(self, example, execute, chunkSize, pause, maxLatency, maxLag, since, progress)
+        except Exception as e:
+            _log.error(e)
+            raise wrapError(e, 'updateByExampleInChunks error; values:{}'.format(data))
         
     #################################### 查询操作 ####################################
     def orderByClause(self, key, clause = 'DESC'):
@@ -509,118 +899,164 @@ class Orm(object):
             self.properties = joinList(arr, prefix='', suffix='')
         return self
 
-    def selectAll(self):
+    def selectAll(self, usePrimary = False, timeout = None, maxRows = None, maxBytes = None):
         ''' 查询所有
         --
+            @param usePrimary: 配置了从库时强制走主库
+            @param timeout: 超时时间（秒），不填使用setTimeout设置的默认值；超时抛出QueryTimeoutError
+            @param maxRows, maxBytes: 结果大小限制，不填使用setResultLimit的设置
         '''
-        cursor = self.conn.cursor()
-
         try:
             strDict = {
                 'distinctStr':self.distinct,
-                'propertiesStr': self.properties,
+                'propertiesStr': self._propertiesStr(),
                 'tableName': self.tableName,
                 'joinStr': self.joinStr,
                 'groupByStr': self.groupByStr,
                 'orderByStr': self.orderByStr
             }
             sql = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} {groupByStr} {orderByStr}'''.format(**strDict)
-            _log.info(sql)
-            cursor.execute(sql)
-            res = cursor.fetchall()
-            if self.auto_commit:
-                self.conn.commit()
-            return res
+            return self._execute(sql, usePrimary=usePrimary, timeout=timeout, maxRows=maxRows, maxBytes=maxBytes)
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('selectAll error; ')
-        finally:
-            cursor.close()
+            raise wrapError(e, 'selectAll error; ')
 
-    def selectByPrimaeyKey(self, primaryValue):
+    def selectByPrimaeyKey(self, primaryValue, usePrimary = False, timeout = None):
         ''' 根据主键查询
         --
-            @param primaryValue: 主键值
+            @param primaryValue: 主键值，联合主键传元组/列表或字典
+            @param usePrimary: 配置了从库时强制走主库
+            @param timeout: 超时时间（秒），不填使用setTimeout设置的默认值；超时抛出QueryTimeoutError
         '''
-        cursor = self.conn.cursor()
-
         try:
-            strDict = {
-                'distinctStr':self.distinct,
-                'propertiesStr': self.properties,
-                'tableName': self.tableName,
-                'joinStr': self.joinStr,
-                'whereStr':'`{}`.`{}`=%s'.format(self.tableName, self.keyProperty),
-                'groupByStr': self.groupByStr,
-                'orderByStr': self.orderByStr
-            }
-            sql = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
-                WHERE {whereStr} {groupByStr} {orderByStr}
-                '''.format(**strDict)
-            _log.info(sql)
-            cursor.execute(sql, primaryValue)
-            res = cursor.fetchone()
-            if self.auto_commit:
-                self.conn.commit()
-            return res
+            values = self._primaryValues(primaryValue)
+            if self._useMirror(usePrimary):
+                res = self.mirror.selectByPrimaryKey(values)
+                if res is not False:
+                    return res
+            if self.schema and self._isPlain():
+                sql = self.schema.templates['selectByPrimaryKey']
+            else:
+                strDict = {
+                    'distinctStr':self.distinct,
+                    'propertiesStr': self._propertiesStr(),
+                    'tableName': self.tableName,
+                    'joinStr': self.joinStr,
+                    'whereStr': self._primaryWhere(),
+                    'groupByStr': self.groupByStr,
+                    'orderByStr': self.orderByStr
+                }
+                sql = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
+                    WHERE {whereStr} {groupByStr} {orderByStr}
+                    '''.format(**strDict)
+            return self._execute(sql, values, fetch='one', usePrimary=usePrimary, timeout=timeout)
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('selectByPrimaeyKey error; values:{}'.format(primaryValue))
-        finally:
-            cursor.close()
+            raise wrapError(e, 'selectByPrimaeyKey error; values:{}'.format(primaryValue))
     
-    def selectByExample(self, example):
+    def selectByExample(self, example, usePrimary = False, timeout = None, maxRows = None, maxBytes = None):
         ''' 根据Example条件进行查询
         --
+            @param usePrimary: 配置了从库时强制走主库
+            @param timeout: 超时时间（秒），不填使用setTimeout设置的默认值；超时抛出QueryTimeoutError
+            @param maxRows, maxBytes: 结果大小限制，不填使用setResultLimit的设置
         '''
-        cursor = self.conn.cursor()
-
         try:
-            whereStr, values = example.whereBuilder()
-            strDict = {
-                'distinctStr':self.distinct,
-                'propertiesStr': self.properties,
-                'tableName': self.tableName,
-                'joinStr': self.joinStr,
-                'whereStr': whereStr,
-                'groupByStr': self.groupByStr,
-                'orderByStr': self.orderByStr
-            }
-            sql = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
-                WHERE {whereStr} {groupByStr} {orderByStr}
-                '''.format(**strDict)
-            _log.info(sql)
-            cursor.execute(sql, values)
-            res = cursor.fetchall()
+            if self._useMirror(usePrimary):
+                res = self.mirror.select(example, self.orderByStr)
+                # 超过结果限制时由MySQL查询按setResultLimit的方式截断或报错
+                if res is not None and withinLimit(res, self.maxRows if maxRows is None else maxRows,
+                                                   self.maxBytes if maxBytes is None else maxBytes):
+                    return res
+            sql, values = self._selectByExampleSQL(example)
+            res = self._execute(sql, values, usePrimary=usePrimary, timeout=timeout, maxRows=maxRows, maxBytes=maxBytes)
             # if res and len(res) == 1:
             #     res = res[0]
-            if self.auto_commit:
-                self.conn.commit()
             return res
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('selectByExample error; values:{}'.format(example))
-        finally:
-            cursor.close()
+            raise wrapError(e, 'selectByExample error; values:{}'.format(example))
+
+    def selectJSONByExample(self, example, jsonLines = False, writer = None, chunkRows = 1000, usePrimary = False, timeout = None):
+        ''' 根据Example条件进行查询，结果直接编码为JSON（UTF-8字节），不构造字典，日期时间输出为'YYYY-MM-DD HH:MM:SS'，
+            Decimal输出为数字。不使用本地镜像和setResultLimit的设置
+        --
+            @example
+                body = stuOrm.selectJSONByExample(Example().andEqualTo({'age': 18}))
+                # b'[{"sid":1,"name":"张三","age":18},...]'
+
+                # 边读边写，使用pymysql的SSCursor，大结果不需要全部读到内存
+                stuOrm.selectJSONByExample(ex, jsonLines=True, writer=response.write)
+
+            @param jsonLines: True输出JSON Lines（每行一个对象），False输出数组
+            @param writer: 分块写出的目标，有write方法的对象或者函数；None表示返回整个bytes
+            @param chunkRows: 每次写出的行数
+            @param usePrimary: 配置了从库时强制走主库
+            @param timeout: 超时时间（秒），不填使用setTimeout设置的默认值；超时抛出QueryTimeoutError
+            @return: 没有writer时返回bytes，否则返回写出的字节数
+        '''
+        try:
+            sql, values = self._selectByExampleSQL(example)
+            return self._execute(sql, values, fetch=JSONFetch(jsonLines, writer, chunkRows), usePrimary=usePrimary, timeout=timeout)
+        except Exception as e:
+            _log.error(e)
+            raise wrapError(e, 'selectJSONByExample error; values:{}'.format(example))
+
+    def _selectByExampleSQL(self, example):
+        ''' 生成selectByExample的语句和参数
+        --
+        '''
+        whereStr, values = self._whereBuilder(example)
+        strDict = {
+            'distinctStr':self.distinct,
+            'propertiesStr': self._propertiesStr(),
+            'tableName': self.tableName,
+            'joinStr': self.joinStr,
+            'whereStr': whereStr,
+            'groupByStr': self.groupByStr,
+            'orderByStr': self.orderByStr
+        }
+        sql = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
+            WHERE {whereStr} {groupByStr} {orderByStr}
+            '''.format(**strDict)
+        return sql, values
+
+    def explainByExample(self, example, rowsThreshold = 10000, usePrimary = False):
+        ''' 查看selectByExample的执行计划（EXPLAIN FORMAT=JSON）
+        --
+            @example
+                plan, warnings = stuOrm.explainByExample(Example().andLike('name', '%三'))
+                # warnings: ['full table scan on student']
+
+            @param rowsThreshold: 预估扫描行数超过该值时给出警告
+            @return: (执行计划, 问题列表)
+        '''
+        try:
+            sql, values = self._selectByExampleSQL(example)
+            plan = self._execute('EXPLAIN FORMAT=JSON ' + sql, values, fetch='one', usePrimary=usePrimary)
+            if isinstance(plan, dict):
+                plan = list(plan.values())
+            plan = json.loads(plan[0])
+            return plan, planWarnings(plan, rowsThreshold)
+        except Exception as e:
+            _log.error(e)
+            raise wrapError(e, 'explainByExample error; values:{}'.format(example))
     
-    def selectTransactByExample(self, transactProperties, example, transactName = '', transact = 'COUNT'):
+    def selectTransactByExample(self, transactProperties, example, transactName = '', transact = 'COUNT', usePrimary = False, timeout = None):
         ''' 根据Example条件聚合查询
         --
             @param transactProperties: 统计字段
             @param example: 条件
             @param transactName: 重命名统计字段
             @param transact: 使用哪个函数，默认COUNT。可选SUM，MAX，MIN等
+            @param usePrimary: 配置了从库时强制走主库
+            @param timeout: 超时时间（秒），不填使用setTimeout设置的默认值；超时抛出QueryTimeoutError
         '''
-        cursor = self.conn.cursor()
-
         try:
-            whereStr, values = example.whereBuilder()
+            whereStr, values = self._whereBuilder(example)
             strDict = {
                 'distinctStr':self.distinct,
-                'propertiesStr': self.properties,
+                'propertiesStr': self._propertiesStr(),
                 'countStr': '{}({}) {}'.format(transact, transactProperties, transactName),
                 'tableName': self.tableName,
                 'joinStr': self.joinStr,
@@ -631,37 +1067,29 @@ class Orm(object):
             sql = '''SELECT {distinctStr} {propertiesStr} , {countStr} FROM {tableName} {joinStr} 
                 WHERE {whereStr} {groupByStr} {orderByStr}
                 '''.format(**strDict)
-            _log.info(sql)
-            cursor.execute(sql, values)
-            res = cursor.fetchall()
-            if self.auto_commit:
-                self.conn.commit()
-            return res
+            return self._execute(sql, values, usePrimary=usePrimary, timeout=timeout)
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('selectTransactByExample error; values:{}'.format(transactProperties))
-        finally:
-            cursor.close()
+            raise wrapError(e, 'selectTransactByExample error; values:{}'.format(transactProperties))
     
-    def selectGroupHavingByExample(self, transactProperties, example, transactName = '', transact = 'COUNT'):
+    def selectGroupHavingByExample(self, transactProperties, example, transactName = '', transact = 'COUNT', usePrimary = False, timeout = None):
         ''' 根据Example条件聚合查询
         --
             @param transactProperties: 统计字段
             @param example: 条件
             @param transactName: 重命名统计字段
             @param transact: 使用哪个函数，默认COUNT。可选SUM，MAX，MIN等
+            @param usePrimary: 配置了从库时强制走主库
+            @param timeout: 超时时间（秒），不填使用setTimeout设置的默认值；超时抛出QueryTimeoutError
         '''
         if not self.groupByStr:
             return False
 
-        cursor = self.conn.cursor()
-
         try:
-            whereStr, values = example.whereBuilder()
+            whereStr, values = self._whereBuilder(example)
             strDict = {
                 'distinctStr':self.distinct,
-                'propertiesStr': self.properties,
+                'propertiesStr': self._propertiesStr(),
                 'countStr': '{}({}) {}'.format(transact, transactProperties, transactName),
                 'tableName': self.tableName,
                 'joinStr': self.joinStr,
@@ -675,30 +1103,89 @@ class Orm(object):
             sql = '''SELECT {distinctStr} {propertiesStr} , {countStr} FROM {tableName} {joinStr} 
                 WHERE {whereStr} {groupByStr} {havingStr} {orderByStr}
                 '''.format(**strDict)
-            _log.info(sql)
-            cursor.execute(sql, values)
-            res = cursor.fetchall()
-            if self.auto_commit:
-                self.conn.commit()
-            return res
+            return self._execute(sql, values, usePrimary=usePrimary, timeout=timeout)
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('selectGroupHavingByExample error; values:{}'.format(transactProperties))
-        finally:
-            cursor.close()
+            raise wrapError(e, 'selectGroupHavingByExample error; values:{}'.format(transactProperties))
     
-    def selectPageAll(self, page = 1, pageNum = 10):
-        ''' 分页查询
+    def selectAggregateByExample(self, aggregates, example = None, groupBy = None, withRollup = False, usePrimary = False, timeout = None):
+        ''' 多个聚合一次查询完成，只扫描一次数据
         --
+            @example
+                studyOrm.selectAggregateByExample([
+                    ('COUNT', '*', 'num'),
+                    ('AVG', 'result', 'avgResult'),
+                    ('MAX', 'result', 'maxResult'),
+                    Aggregate('COUNT', '*', 'passed', when=Example().andGreaterThanOrEqualTo({'result':60}))
+                ], groupBy=['cid'], withRollup=True)
+                # [{'cid': 1, 'num': 2, 'avgResult': Decimal('85.0000'), 'maxResult': 90, 'passed': 2},
+                #  {'cid': None, 'num': 2, 'avgResult': Decimal('85.0000'), 'maxResult': 90, 'passed': 2}]
+
+            @param aggregates: 聚合项列表，元素为Aggregate、(函数, 字段, 别名)元组或者Aggregate参数字典
+            @param example: 条件，None表示不加条件
+            @param groupBy: 分组字段列表，分组字段同时作为查询字段
+            @param withRollup: 是否添加WITH ROLLUP汇总行
+            @param usePrimary: 配置了从库时强制走主库
+            @param timeout: 超时时间（秒），不填使用setTimeout设置的默认值；超时抛出QueryTimeoutError
         '''
-        cursor = self.conn.cursor()
+        if not aggregates:
+            raise Exception('未传入聚合项！')
+
+        try:
+            columns = []
+            values = []
+            for key in groupBy or []:
+                columns.append(quoteKey(key))
+            for spec in aggregates:
+                s, v = Aggregate.of(spec).build()
+                columns.append(s)
+                values.extend(v)
+
+            whereStr = ''
+            if example is not None:
+                s, v = self._whereBuilder(example)
+                whereStr = 'WHERE ' + s
+                values.extend(v)
+
+            groupByStr = ''
+            if groupBy:
+                groupByStr = 'GROUP BY ' + ', '.join(quoteKey(k) for k in groupBy)
+                if withRollup:
+                    groupByStr += ' WITH ROLLUP'
+
+            havingStr = ''
+            if groupBy and self.havingStr:
+                havingStr = 'HAVING ' + self.havingStr
+                values.extend(self.havingValues)
 
+            strDict = {
+                'columnsStr': ', '.join(columns),
+                'tableName': self.tableName,
+                'joinStr': self.joinStr,
+                'whereStr': whereStr,
+                'groupByStr': groupByStr,
+                'havingStr': havingStr,
+                'orderByStr': self.orderByStr
+            }
+            sql = '''SELECT {columnsStr} FROM {tableName} {joinStr} 
+                {whereStr} {groupByStr} {havingStr} {orderByStr}
+                '''.format(**strDict)
+            return self._execute(sql, values, usePrimary=usePrimary, timeout=timeout)
+        except Exception as e:
+            _log.error(e)
+            raise wrapError(e, 'selectAggregateByExample error; values:{}'.format(aggregates))
+    
+    def selectPageAll(self, page = 1, pageNum = 10, usePrimary = False, timeout = None):
+        ''' 分页查询
+        --
+            @param usePrimary: 配置了从库时强制走主库
+            @param timeout: 超时时间（秒），不填使用setTimeout设置的默认值；超时抛出QueryTimeoutError
+        '''
         startId = (page - 1) * pageNum
 
         try:
             strDict = {
-                'propertiesStr': '`{}`.`{}`'.format(self.tableName, self.keyProperty),
+                'propertiesStr': '`{}`.`{}`'.format(self.tableName, self._primaryKeys()[0]),
                 'tableName': self.tableName,
                 'joinStr': self.joinStr,
                 'groupByStr': self.groupByStr,
@@ -708,51 +1195,31 @@ class Orm(object):
             sql = '''SELECT COUNT(`{propertiesStr}`) num FROM {tableName} {joinStr} 
                     {groupByStr} {orderByStr}
                     '''.format(**strDict)
-            _log.info(sql)
-            cursor.execute(sql)
-            numRes = cursor.fetchone()
-            num = numRes['num']
+            with self._pinReplica():
+                numRes = self._execute(sql, fetch='one', usePrimary=usePrimary, timeout=timeout)
+                num = numRes['num']
 
-            if num == 0 or num < startId:
-                return num, []
-            
-            strDict = {
-                'distinctStr':self.distinct,
-                'propertiesStr': self.properties,
-                'tableName': self.tableName,
-                'joinStr': self.joinStr,
-                'groupByStr': self.groupByStr,
-                'orderByStr': self.orderByStr,
-                'limitStr':'LIMIT {}, {}'.format(startId, pageNum)
-            }
-            sql = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
-                    {groupByStr} {orderByStr} {limitStr}
-                    '''.format(**strDict)
-            _log.info(sql)
-            cursor.execute(sql)
-            res = cursor.fetchall()
-            if self.auto_commit:
-                self.conn.commit()
+                if num == 0 or num < startId:
+                    return num, []
+                
+                res = self._selectPage(None, page, pageNum, usePrimary, timeout)
             return num, res
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('selectPageAll error')
-        finally:
-            cursor.close()
+            raise wrapError(e, 'selectPageAll error')
 
-    def selectPageByExample(self, example, page = 1, pageNum = 10):
+    def selectPageByExample(self, example, page = 1, pageNum = 10, usePrimary = False, timeout = None):
         ''' 根据Example条件分页查询
         --
+            @param usePrimary: 配置了从库时强制走主库
+            @param timeout: 超时时间（秒），不填使用setTimeout设置的默认值；超时抛出QueryTimeoutError
         '''
-        cursor = self.conn.cursor()
-
         startId = (page - 1) * pageNum
 
         try:
-            whereStr, values = example.whereBuilder()
+            whereStr, values = self._whereBuilder(example)
             strDict = {
-                'propertiesStr': '`{}`.`{}`'.format(self.tableName, self.keyProperty),
+                'propertiesStr': '`{}`.`{}`'.format(self.tableName, self._primaryKeys()[0]),
                 'tableName': self.tableName,
                 'joinStr': self.joinStr,
                 'whereStr': whereStr,
@@ -763,63 +1230,141 @@ class Orm(object):
             sql = '''SELECT COUNT({propertiesStr}) num FROM {tableName} {joinStr} 
                     WHERE {whereStr} {groupByStr} {orderByStr}
                     '''.format(**strDict)
-            _log.info(sql)
-            cursor.execute(sql, values)
-            numRes = cursor.fetchone()
-            num = numRes['num']
+            with self._pinReplica():
+                numRes = self._execute(sql, values, fetch='one', usePrimary=usePrimary, timeout=timeout)
+                num = numRes['num']
 
-            if num == 0 or num < startId:
-                return num, []
-            
-            strDict = {
-                'distinctStr':self.distinct,
-                'propertiesStr': self.properties,
-                'tableName': self.tableName,
-                'joinStr': self.joinStr,
-                'whereStr': whereStr,
-                'groupByStr': self.groupByStr,
-                'orderByStr': self.orderByStr,
+                if num == 0 or num < startId:
+                    return num, []
                 
-                'limitStr':'LIMIT {}, {}'.format(startId, pageNum)
-            }
-            sql = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
-                    WHERE {whereStr} {groupByStr} {orderByStr} {limitStr}
-                    '''.format(**strDict)
-            _log.info(sql)
-            cursor.execute(sql, values)
-            res = cursor.fetchall()
-            if self.auto_commit:
-                self.conn.commit()
+                res = self._selectPage(example, page, pageNum, usePrimary, timeout)
             return num, res
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('selectPageByExample error; values:{}'.format(example))
-        finally:
-            cursor.close()
+            raise wrapError(e, 'selectPageByExample error; values:{}'.format(example))
+
+    def _pinReplica(self):
+        ''' 分页查询的总数和数据使用同一个从库
+        --
+        '''
+        return self.router.pinned() if self.router else nullcontext()
+
+    def _selectPage(self, example, page, pageNum, usePrimary = False, timeout = None):
+        ''' 查询某一页的数据（不查询总数），example为None表示查询所有
+        --
+        '''
+        whereStr, values = self._whereBuilder(example) if example is not None else ('', None)
+        strDict = {
+            'distinctStr':self.distinct,
+            'propertiesStr': self._propertiesStr(),
+            'tableName': self.tableName,
+            'joinStr': self.joinStr,
+            'whereStr': 'WHERE ' + whereStr if whereStr else '',
+            'groupByStr': self.groupByStr,
+            'orderByStr': self.orderByStr,
+            'limitStr':'LIMIT {}, {}'.format((page - 1) * pageNum, pageNum)
+        }
+        sql = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
+                {whereStr} {groupByStr} {orderByStr} {limitStr}
+                '''.format(**strDict)
+        return self._execute(sql, values, usePrimary=usePrimary, timeout=timeout)
+
+    def iterPagesByExample(self, example = None, pageNum = 100, pool = None, readAhead = 1, usePrimary = False, timeout = None):
+        ''' 逐页迭代查询结果。处理当前页时，后台线程使用连接池中的另一个连接预先查询后面的页，
+            最多预先查询readAhead页。提前结束迭代时请调用close()或者使用with，停止后台查询并归还连接。
+            后台连接看不到本Orm连接中未提交的数据
+        --
+            @example
+                pool = PooledDB(pymysql, 5, host='localhost', user='root', passwd='pwd', db='test')
+                with stuOrm.orderByClause('sid', 'ASC').iterPagesByExample(example, pageNum=500, pool=pool) as pages:
+                    for rows in pages:
+                        handle(rows)
+
+            @param example: 查询条件，None表示查询所有
+            @param pageNum: 每页数据量
+            @param pool: 连接池（有connection()方法）或者返回新连接的函数
+            @param readAhead: 最多预先查询的页数
+            @param usePrimary: 配置了从库时强制走主库
+            @param timeout: 每页查询的超时时间（秒）
+            @return: PageIterator，每次迭代返回一页（ResultList）
+        '''
+        if pool is None:
+            raise Exception('未传入连接池！')
+        return PageIterator(self, example, pageNum, pool, readAhead, usePrimary, timeout)
+
+    def pullChanges(self, watermarkColumn, since = None, batchSize = 1000, example = None, usePrimary = False, timeout = None):
+        ''' 增量拉取水位字段（如updated_at或者递增主键）大于同步位置的数据，按(水位字段, 主键)排序，
+            主键用于区分水位相同的数据，不会遗漏或重复。每批数据处理完（取下一批之前）保存同步位置，
+            中断后从最后保存的位置继续。水位字段为NULL的数据不会被拉取
+        --
+            @example
+                checkpoint = FileCheckpoint('/data/student.ckpt')
+                for row in stuOrm.pullChanges('updated_at', since=checkpoint, batchSize=500):
+                    sync(row)
+
+            @param watermarkColumn: 水位字段
+            @param since: 同步位置，可以是FileCheckpoint/TableCheckpoint（自动读取和保存），
+                        也可以是(水位值, 主键值...)元组；None表示从头开始
+            @param batchSize: 每批数据量
+            @param example: 附加条件
+            @param usePrimary: 配置了从库时强制走主库
+            @param timeout: 每批查询的超时时间（秒）
+        '''
+        checkpoint = since if hasattr(since, 'save') else None
+        position = checkpoint.load() if checkpoint else since
+        keys = [watermarkColumn] + self._primaryKeys()
+        cursorStr, order = keysetWhere(keys)
+        orderByStr = ' ORDER BY ' + ', '.join('`{}` ASC'.format(k) for k in keys)
+
+        while True:
+            try:
+                whereList = ['`{}` IS NOT NULL'.format(watermarkColumn)]
+                values = []
+                if position is not None:
+                    whereList.append('(' + cursorStr + ')')
+                    values.extend(position[i] for i in order)
+                if example is not None:
+                    s, v = self._whereBuilder(example)
+                    whereList.append('(' + s + ')')
+                    values.extend(v)
+                whereStr = ' WHERE ' + ' AND '.join(whereList)
+                sql = 'SELECT {} FROM `{}` {} {} LIMIT {}'.format(self._propertiesStr(), self.tableName, whereStr, orderByStr, int(batchSize))
+                rows = self._execute(sql, values or None, usePrimary=usePrimary, timeout=timeout)
+            except Exception as e:
+                _log.error(e)
+                raise wrapError(e, 'pullChanges error; position:{}'.format(position))
+
+            for row in rows:
+                yield row
+            if not rows:
+                return
+            last = rows[-1]
+            position = tuple(last[k] for k in keys)
+            if checkpoint:
+                checkpoint.save(position)
+            if len(rows) < batchSize:
+                return
 
     #################################### 删除操作 ####################################
     def deleteByPrimaryKey(self, primaryValue):
         ''' 根据主键删除 
+        --
+            @param primaryValue: 主键值，联合主键传元组/列表或字典
         '''
         
         if not primaryValue:
             raise Exception('未传入主键值！')
 
-        cursor = self.conn.cursor()
         try:
-            sql = 'DELETE FROM `{}` WHERE `{}`=%s'.format(self.tableName, self.keyProperty)
-            _log.info(sql)
-            res = cursor.execute(sql, primaryValue)
-            if self.auto_commit:
-                self.conn.commit()
-            return res
+            values = self._primaryValues(primaryValue)
+            if self.schema:
+                sql = self.schema.templates['deleteByPrimaryKey']
+            else:
+                sql = 'DELETE FROM `{}` WHERE {}'.format(self.tableName, self._primaryWhere(False))
+            return self._execute(sql, values, fetch='rowcount', write=True)
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('deleteByPrimaryKey error; values:{}'.format(primaryValue))
-        finally:
-            cursor.close()
+            raise wrapError(e, 'deleteByPrimaryKey error; values:{}'.format(primaryValue))
             
     def deleteByExample(self, example):
         ''' 根据Example条件删除数据
@@ -827,68 +1372,81 @@ class Orm(object):
         if not example:
             raise Exception('未传入更新条件！')
 
-        cursor = self.conn.cursor()
         try:
-            whereStr, values = example.whereBuilder()
+            whereStr, values = self._whereBuilder(example)
             sql = 'DELETE FROM `{}` WHERE {}'.format(self.tableName, whereStr)
-            _log.info(sql)
-            res = cursor.execute(sql, values)
-            if self.auto_commit:
-                self.conn.commit()
-            return res
+            return self._execute(sql, values, fetch='rowcount', write=True)
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('deleteByExample error; values:{}'.format(example))
-        finally:
-            cursor.close()
+            raise wrapError(e, 'deleteByExample error; values:{}'.format(example))
+
+    def deleteByExampleInChunks(self, example, chunkSize = 1000, pause = 0, maxLatency = None, maxLag = None, since = None, progress = None):
+        ''' 按主键范围分批删除，每批是一个单独的短事务，避免长时间锁定大量行、从库延迟和undo日志膨胀。
+            只支持单字段主键和自动提交模式，分批规则见runInChunks
+        --
+            @example
+                checkpoint = FileCheckpoint('/data/purge_student.ckpt')
+                stuOrm.deleteByExampleInChunks(Example().andLessThan({'age': 10}), chunkSize=5000, pause=0.1,
+                                               maxLatency=0.5, maxLag=3, since=checkpoint,
+                                               progress=lambda n, key: print(n, key))
+
+            @param example: 删除条件
+            @param chunkSize: 每批最多删除的行数
+            @param pause: 每批之后暂停的秒数
+            @param maxLatency: 每批语句的目标耗时（秒），超过时减小分批大小
+            @param maxLag: 允许的最大从库复制延迟（秒），超过时等待
+            @param since: 从哪个主键之后开始，或者FileCheckpoint/TableCheckpoint（中断后从最后保存的位置继续）
+            @param progress: 进度回调progress(已删除行数, 当前主键)
+            @return: 删除的行数
+        '''
+        if not example:
+            raise Exception('未传入删除条件！')
+
+        def execute(whereStr, values):
+            sql = 'DELETE FROM `{}` WHERE {}'.format(self.tableName, whereStr)
+            return self._execute(sql, values, fetch='rowcount', write=True)
+
+        try:
+            return runInChunks(self, example, execute, chunkSize, pause, maxLatency, maxLag, since, progress)
+        except Exception as e:
+            _log.error(e)
+            raise wrapError(e, 'deleteByExampleInChunks error; values:{}'.format(example))
 
     #################################### 原生SQL操作 ####################################
-    def selectOneBySQL(self, sql, values = None):
+    def selectOneBySQL(self, sql, values = None, usePrimary = False, timeout = None):
         ''' 查询单个
         --
+            @param usePrimary: 配置了从库时强制走主库
+            @param timeout: 超时时间（秒），不填使用setTimeout设置的默认值；超时抛出QueryTimeoutError
         '''
-        cursor = self.conn.cursor()
-
         try:
-            _log.info(sql)
-            if values:
-                cursor.execute(sql, values)
-            else:
-                cursor.execute(sql)
-            res = cursor.fetchone()
-            if self.auto_commit:
-                self.conn.commit()
-            return res
+            return self._execute(sql, values or None, fetch='one', usePrimary=usePrimary, timeout=timeout)
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('selectOneBySQL error; sql:{} values:{}'.format(sql, values))
-        finally:
-            cursor.close()
+            raise wrapError(e, 'selectOneBySQL error; sql:{} values:{}'.format(sql, values))
     
-    def selectAllBySQL(self, sql, values = None):
+    def selectAllBySQL(self, sql, values = None, usePrimary = False, timeout = None, maxRows = None, maxBytes = None):
         ''' 查询所有
         --
+            @param usePrimary: 配置了从库时强制走主库
+            @param timeout: 超时时间（秒），不填使用setTimeout设置的默认值；超时抛出QueryTimeoutError
+            @param maxRows, maxBytes: 结果大小限制，不填使用setResultLimit的设置
         '''
-        cursor = self.conn.cursor()
+        try:
+            return self._execute(sql, values or None, usePrimary=usePrimary, timeout=timeout, maxRows=maxRows, maxBytes=maxBytes)
+        except Exception as e:
+            _log.error(e)
+            raise wrapError(e, 'selectAllBySQL error; sql:{} values:{}'.format(sql, values))
 
+    def selectJSONBySQL(self, sql, values = None, jsonLines = False, writer = None, chunkRows = 1000, usePrimary = False, timeout = None):
+        ''' 查询所有，结果直接编码为JSON，参数见selectJSONByExample
+        --
+        '''
         try:
-            _log.info(sql)
-            if values:
-                cursor.execute(sql, values)
-            else:
-                cursor.execute(sql)
-            res = cursor.fetchall()
-            if self.auto_commit:
-                self.conn.commit()
-            return res
+            return self._execute(sql, values or None, fetch=JSONFetch(jsonLines, writer, chunkRows), usePrimary=usePrimary, timeout=timeout)
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('selectAllBySQL error; sql:{} values:{}'.format(sql, values))
-        finally:
-            cursor.close()
+            raise wrapError(e, 'selectJSONBySQL error; sql:{} values:{}'.format(sql, values))
 
     def executeBySQL(self, sql, values = None):
         ''' 根据sql进行更新删除或者新增操作， 不能用于执行查询操作，因为不会返回查询结果，查询使用selectAllBySQL或者selectOneBySQL
@@ -897,28 +1455,282 @@ class Orm(object):
             @param values: 参数
             @rerturn: 失败返回-1
         '''
-        cursor = self.conn.cursor()
         try:
-            _log.info(sql)
-            if values:
-                cursor.execute(sql, values)
-            else:
-                cursor.execute(sql)
+            return self._execute(sql, values or None, fetch='lastrowid', write=True)
+        except Exception as e:
+            _log.error(e)
+            raise wrapError(e, 'executeBySQL error; sql:{} values:{}'.format(sql, values))
+    
+    #################################### 子查询 ####################################
+    def subQuery(self, example = None, properties = None, correlation = None):
+        ''' 生成本表的子查询，作为外层Example的条件值，整个条件在数据库中一次执行。
+            使用本Orm的多表连接/去重/分组/HAVING设置，不使用排序
+        --
+            @example
+                studyOrm = Orm(db, 'study')
+                # 有不及格成绩的学生：`sid` IN (SELECT `sid` FROM `study` WHERE `result` < %s)
+                stuOrm.selectByExample(Example().andInSubquery('sid', studyOrm.subQuery(Example().andLessThan({'result': 60}), 'sid')))
+
+                # 关联子查询：EXISTS (SELECT 1 FROM `study` WHERE `study`.`sid`=`student`.`sid`)
+                stuOrm.selectByExample(Example().andNotExists(studyOrm.subQuery(properties='1', correlation='`study`.`sid`=`student`.`sid`')))
+
+                # 标量子查询：`age` > (SELECT AVG(`age`) FROM `student`)
+                stuOrm.selectByExample(Example().andGreaterThan({'age': stuOrm.subQuery(properties='AVG(`age`)')}))
+
+            @param example: 子查询条件
+            @param properties: 查询的列，字段名（字段 或 表名.字段，自动加反引号）、字段名列表或表达式（如'1'、'AVG(`age`)'，原样拼接）；
+                            不填使用setSelectProperties的设置
+            @param correlation: 与外层表关联的条件，原样拼接，如'`study`.`sid`=`student`.`sid`'
+            @return: SubQuery
+        '''
+        if properties is None:
+            propertiesStr = self._propertiesStr()
+        elif isinstance(properties, (list, tuple)):
+            for p in properties:
+                if not isIdentifier(p):
+                    raise Exception('子查询字段名不合法：{}'.format(p))
+            propertiesStr = ', '.join(quoteKey(p) for p in properties)
+        elif isIdentifier(properties):
+            propertiesStr = quoteKey(properties)
+        else:
+            propertiesStr = properties
 
-            res = cursor.lastrowid
-            if self.auto_commit:
-                self.conn.commit()
+        whereList = []
+        values = []
+        if example is not None:
+            s, v = self._whereBuilder(example)
+            whereList.append('(' + s + ')')
+            values.extend(v)
+        if correlation:
+            whereList.append(correlation)
+        havingStr = ''
+        if self.havingStr:
+            havingStr = 'HAVING ' + self.havingStr
+        strDict = {
+            'distinctStr': self.distinct,
+            'propertiesStr': propertiesStr,
+            'tableName': self.tableName,
+            'joinStr': self.joinStr,
+            'whereStr': 'WHERE ' + ' AND '.join(whereList) if whereList else '',
+            'groupByStr': self.groupByStr,
+            'havingStr': havingStr
+        }
+        sql = 'SELECT {distinctStr} {propertiesStr} FROM `{tableName}` {joinStr} {whereStr} {groupByStr} {havingStr}'.format(**strDict)
+        if self.havingStr:
+            values.extend(self.havingValues)
+        return SubQuery(' '.join(sql.split()), values)
+
+    
+    #################################### 执行 ####################################
+    def _execute(self, sql, values = None, fetch = 'all', write = False, usePrimary = False, many = False, timeout = None, maxRows = None, maxBytes = None, commit = None):
+        ''' 执行SQL。配置了从库时，查询在自动提交模式下路由到从库；写操作、手动提交模式（显式事务）、
+            usePrimary以及写后读窗口内的查询走主库。设置了重试策略时，可重试的错误按退避时间重试，
+            设置了SingleFlight时合并并发的相同查询
+        --
+            @param sql: sql语句
+            @param values: 参数，None表示无参数
+            @param fetch: 返回值，all: fetchall（ResultList），one: fetchone，rowcount: 影响行数，lastrowid: 最后写入的ID，
+                        或者函数fetch(cursor)，直接读取游标（函数有cursorClass属性时使用该类型的游标，如JSONFetch）
+            @param write: 是否为写操作
+            @param usePrimary: 强制走主库
+            @param many: 使用executemany批量执行
+            @param timeout: 超时时间（秒），None使用默认超时时间
+            @param maxRows: 最大行数，None使用setResultLimit的设置
+            @param maxBytes: 最大估算字节数，None使用setResultLimit的设置
+            @param commit: 执行后是否提交，None按auto_commit；False用于多条语句组成的事务（不提交、不重试）
+        '''
+        recorder = currentRecorder()
+        if recorder is not None:
+            return recorder.record(self, sql, values, fetch, write, many)
+
+        flight = self.singleFlight
+        if flight is not None and not write and not many and fetch in ('all', 'one') and not usePrimary \
+                and self.auto_commit and not (self.router and self.router.isSticky()):
+            # 共用SingleFlight的Orm可能连接不同的库，键中包含连接的库标识
+            key = (connectionIdentity(self.conn), fetch, sql, tuple(values) if isinstance(values, list) else values, maxRows, maxBytes)
+            try:
+                hash(key)
+            except TypeError:
+                key = None
+            if key is not None:
+                return flight.do(key, lambda: self._executeRetry(sql, values, fetch, write, usePrimary, many, timeout, maxRows, maxBytes, commit),
+                                 self, timeout)
+
+        res = self._executeRetry(sql, values, fetch, write, usePrimary, many, timeout, maxRows, maxBytes, commit)
+        if write and flight is not None:
+            flight.markWrite()
+        return res
+
+    def _executeRetry(self, sql, values, fetch, write, usePrimary, many, timeout, maxRows = None, maxBytes = None, commit = None):
+        ''' 执行SQL，设置了重试策略时按退避时间重试，参数见_execute
+        --
+        '''
+        policy = self.retryPolicy
+        attempt = 0
+        while True:
+            try:
+                res = self._executeOnce(sql, values, fetch, write, usePrimary, many, timeout, maxRows, maxBytes, commit)
+                if attempt:
+                    policy.record('recovered')
+                return res
+            except Exception as e:
+                if not policy or not self.auto_commit or commit is False or not policy.isRetryable(e, write) or getattr(fetch, 'written', 0):
+                    raise
+                if attempt >= policy.maxRetries:
+                    policy.record('failed')
+                    raise
+                policy.record('retries', errorCode(e))
+                delay = policy.delay(attempt)
+                _log.warning('retry {} after {:.3f}s: {}'.format(attempt + 1, delay, e))
+                time.sleep(delay)
+                attempt += 1
+
+    def _executeOnce(self, sql, values, fetch, write, usePrimary, many, timeout, maxRows = None, maxBytes = None, commit = None):
+        ''' 执行一次SQL，参数见_execute
+        --
+        '''
+        replica = None
+        conn = self.conn
+        if not write and not usePrimary and self.auto_commit and self.router and not self.router.isSticky():
+            replica = self.router.acquire()
+            if replica:
+                conn = replica.connection()
+
+        # TEMP_TABLE方式改写的大IN列表，执行前建临时表
+        spills = None
+        if not many and isinstance(values, list) and any(isinstance(v, InSpill) for v in values):
+            spills = [v for v in values if isinstance(v, InSpill)]
+            values = [v for v in values if not isinstance(v, InSpill)]
+
+        # 记录到WorkloadCapture的是调用方生成的语句，不包含下面自动添加的LIMIT和超时提示
+        callerSql = sql
+        if maxRows is None:
+            maxRows = self.maxRows
+        if maxBytes is None:
+            maxBytes = self.maxBytes
+        limited = fetch == 'all' and (maxRows is not None or maxBytes is not None)
+        if limited:
+            sql = injectLimit(sql, maxRows)
+
+        if timeout is None:
+            timeout = self.timeout
+        deadline = Deadline(conn, sql, timeout, self.killConn) if timeout else nullcontext()
+        rawSql = sql
+        if timeout:
+            sql = deadline.sql
+
+        _log.info(sql)
+        cursor = None
+        try:
+            cursorClass = getattr(fetch, 'cursorClass', None) if callable(fetch) else None
+            if limited:
+                cursorClass = streamingCursor(conn)
+            cursor = conn.cursor(cursorClass) if cursorClass else conn.cursor()
+            if spills:
+                for spill in spills:
+                    createSpill(cursor, spill)
+            startedAt = time.perf_counter()
+            with deadline:
+                if many:
+                    res = cursor.executemany(sql, values)
+                elif values is None:
+                    res = cursor.execute(sql)
+                else:
+                    res = cursor.execute(sql, values)
+
+                if fetch == 'all' and limited:
+                    abort = self._abortResult(conn, cursor) if cursorClass else None
+                    res = fetchLimited(cursor, self, rawSql, maxRows, maxBytes, self.truncateResult, abort)
+                elif fetch == 'all':
+                    res = ResultList(self, cursor.fetchall())
+                elif fetch == 'one':
+                    res = cursor.fetchone()
+                elif fetch == 'lastrowid':
+                    res = cursor.lastrowid
+                elif callable(fetch):
+                    res = fetch(cursor)
+
+            if self.capture is not None:
+                self.capture.record(conn, callerSql, values, time.perf_counter() - startedAt, write, many, spills)
+            if self.explainSampler and not many:
+                self.explainSampler.observe(conn, rawSql, values)
+            if self.auto_commit if commit is None else commit:
+                self._endTransaction(conn, True)
+            if write and self.router:
+                self.router.markWrite()
+            if write and self.mirror is not None:
+                self.mirror.markStale()
             return res
+        except Exception as e:
+            if errorCode(e) in CONNECTION_LOST_CODES:
+                self._reconnect(conn)
+            else:
+                try:
+                    self._endTransaction(conn, False)
+                except Exception as e2:
+                    _log.error(e2)
+            raise
+        finally:
+            if cursor is not None:
+                cursor.close()
+                if spills:
+                    # 结果超过限制时游标已经被中止关闭，不缓冲游标也不能在读完结果前执行语句，用新游标删除临时表
+                    self._dropSpills(conn, spills)
+            if replica:
+                replica.release(conn)
+                self.router.release(replica)
+
+    def _dropSpills(self, conn, spills):
+        ''' 删除TEMP_TABLE方式建的临时表，临时表留在连接池的连接上会一直占用
+        --
+        '''
+        try:
+            cursor = conn.cursor()
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('executeBySQL error; sql:{} values:{}'.format(sql, values))
+            return
+        try:
+            for spill in spills:
+                dropSpill(cursor, spill)
         finally:
             cursor.close()
-    
-    #################################### 子查询 ####################################
 
-    
+    def _abortResult(self, conn, cursor):
+        ''' 不缓冲游标超过结果限制时丢弃剩余结果：有killConn时先KILL QUERY中止语句，再关闭游标
+            （pymysql关闭不缓冲游标时读完并丢弃剩余的行，不占用内存）
+        --
+        '''
+        def abort():
+            if self.killConn is not None:
+                killQuery(self.killConn, conn.thread_id())
+            try:
+                cursor.close()
+            except Exception as e:
+                # 被KILL QUERY中止的语句在读取剩余结果时返回1317
+                _log.info('discard result: {}'.format(e))
+        return abort
+
+    def _endTransaction(self, conn, commit):
+        ''' 提交或回滚，并记录到WorkloadCapture，回放时在同一位置提交或回滚
+        --
+        '''
+        if commit:
+            conn.commit()
+        else:
+            conn.rollback()
+        if self.capture is not None:
+            self.capture.recordEnd(conn, commit)
+
+    def _reconnect(self, conn):
+        ''' 连接断开后重连（pymysql的ping(reconnect=True)）
+        --
+        '''
+        try:
+            if hasattr(conn, 'ping'):
+                conn.ping(reconnect=True)
+        except Exception as e:
+            _log.error('reconnect error: {}'.format(e))
+
     #################################### 清除关闭 ####################################
     def autoCommit(self, auto_commit = True):
         ''' 打开/关闭自动提交
@@ -0,0 +1,159 @@
+import re
+from decimal import Decimal
+from functools import lru_cache
+from .sqlutil import isIdentifier
+
+__all__ = ['parseWhere']
+
+# 词法规则，一次扫描完成分词
+_TOKEN = re.compile(r'''\s*(?:
+     (?P<str>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    |(?P<num>-?\d+(?:\.\d+)?(?![^\s()=<>!,'"]))
+    |(?P<op><>|!=|>=|<=|=|<|>)
+    |(?P<lp>\()
+    |(?P<rp>\))
+    |(?P<comma>,)
+    |(?P<word>(?:`[^`]*`|[^\s()=<>!,'"`])+)
+)''', re.X)
+_SPACE = re.compile(r'\s*')
+_ESCAPE = re.compile(r'\\(.)')
+_KEYWORDS = ('AND', 'OR', 'NOT', 'IN', 'LIKE', 'BETWEEN')
+
+# 解析结果缓存的大小
+CACHE_SIZE = 1024
+
+
+def _tokenize(whereStr):
+    ''' 分词，返回[(类型, 值)]
+    --
+    '''
+    tokens = []
+    pos = 0
+    end = len(whereStr)
+    while True:
+        pos = _SPACE.match(whereStr, pos).end()
+        if pos >= end:
+            break
+        m = _TOKEN.match(whereStr, pos)
+        if not m:
+            raise Exception('where条件解析失败，无法识别：{}'.format(whereStr[pos:]))
+        kind = m.lastgroup
+        text = m.group(kind)
+        if kind == 'str':
+            q = text[0]
+            value = _ESCAPE.sub(r'\1', text[1:-1].replace(q + q, q))
+        elif kind == 'num':
+            # 小数使用Decimal，不丢失精度
+            value = Decimal(text) if '.' in text else int(text)
+        elif kind == 'word' and text.upper() in _KEYWORDS:
+            kind, value = 'kw', text.upper()
+        else:
+            value = text
+        tokens.append((kind, value))
+        pos = m.end()
+    return tokens
+
+
+class _Parser(object):
+    ''' 递归下降解析
+        expr      := term ((AND | OR) term)*
+        term      := '(' expr ')' | condition
+        condition := key op value
+                   | key [NOT] IN '(' value (',' value)* ')'
+                   | key [NOT] LIKE value
+                   | key [NOT] BETWEEN value AND value
+    '''
+    def __init__(self, whereStr):
+        self.whereStr = whereStr
+        self.tokens = _tokenize(whereStr)
+        self.pos = 0
+
+    def parse(self):
+        node = self._expr()
+        if self.pos != len(self.tokens):
+            self._error()
+        return node
+
+    def _peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def _next(self):
+        token = self._peek()
+        if token[0] is None:
+            self._error()
+        self.pos += 1
+        return token
+
+    def _expect(self, kind, value = None):
+        token = self._next()
+        if token[0] != kind or (value is not None and token[1] != value):
+            self.pos -= 1
+            self._error()
+        return token[1]
+
+    def _error(self):
+        raise Exception('where条件解析失败，位置{}：{}'.format(self.pos, self.whereStr))
+
+    def _expr(self):
+        items = [('AND', self._term())]
+        while self._peek() in (('kw', 'AND'), ('kw', 'OR')):
+            items.append((self._next()[1], self._term()))
+        return tuple(items)
+
+    def _term(self):
+        if self._peek()[0] == 'lp':
+            self._next()
+            node = self._expr()
+            self._expect('rp')
+            return node
+        return self._condition()
+
+    def _condition(self):
+        key = self._expect('word').replace('`', '')
+        if not isIdentifier(key):
+            self.pos -= 1
+            raise Exception('where条件解析失败，字段名不合法：{}'.format(key))
+        kind, value = self._next()
+        if kind == 'op':
+            return (key, self._value(), '<>' if value == '!=' else value)
+        if kind != 'kw':
+            self.pos -= 1
+            self._error()
+        sign = value
+        if sign == 'NOT':
+            sign = 'NOT ' + self._expect('kw')
+        if sign.endswith('IN'):
+            self._expect('lp')
+            values = [self._value()]
+            while self._peek()[0] == 'comma':
+                self._next()
+                values.append(self._value())
+            self._expect('rp')
+            return (key, tuple(values), sign)
+        if sign.endswith('LIKE'):
+            return (key, self._value(), sign)
+        if sign.endswith('BETWEEN'):
+            v1 = self._value()
+            self._expect('kw', 'AND')
+            return (key, (v1, self._value()), sign)
+        self.pos -= 1
+        self._error()
+
+    def _value(self):
+        kind, value = self._next()
+        if kind not in ('str', 'num', 'word'):
+            self.pos -= 1
+            self._error()
+        return value
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parseWhere(whereStr):
+    ''' 解析where条件字符串，结果按字符串缓存（LRU）
+    --
+        @return: ((连接符, 条件), ...)，条件为(key, value, sign)或者嵌套的条件组；返回值不可修改。
+                字段名只能是 字段 或 表名.字段；没有引号的数字转换为int/Decimal，其他值为字符串
+    '''
+    return _Parser(whereStr).parse()
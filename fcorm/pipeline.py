@@ -0,0 +1,170 @@
+import logging
+import threading
+from .result import ResultList
+from .errors import wrapError
+from .largein import InSpill
+
+__all__ = ['Pipeline']
+
+_log = logging.getLogger()
+
+# 当前线程正在记录语句的Pipeline
+_local = threading.local()
+# pymysql的server_status中表示连接上有未结束事务的标志位（SERVER_STATUS_IN_TRANS）
+SERVER_STATUS_IN_TRANS = 1
+
+
+def currentRecorder():
+    ''' 当前线程正在记录语句的Pipeline，没有则为None
+    --
+    '''
+    return getattr(_local, 'recorder', None)
+
+
+class _Statement(object):
+    __slots__ = ('orm', 'sql', 'values', 'fetch', 'write')
+
+    def __init__(self, orm, sql, values, fetch, write):
+        self.orm = orm
+        self.sql = sql
+        self.values = values
+        self.fetch = fetch
+        self.write = write
+
+
+class Pipeline(object):
+    def __init__(self, conn):
+        ''' 把多个Orm操作合并为一次多语句请求，只有一次网络往返。
+            连接需要开启多语句：pymysql.connect(..., client_flag=pymysql.constants.CLIENT.MULTI_STATEMENTS)
+            Orm都是自动提交模式时，有写操作的pipeline在一个事务中执行并提交；
+            有Orm关闭了自动提交时，语句在调用方的事务中执行，由调用方提交
+        --
+            @example
+                p = Pipeline(db)
+                p.add(stuOrm.selectByExample, Example().andLike('name', '张%'))
+                p.add(courseOrm.selectByPrimaeyKey, 1)
+                p.add(stuOrm.updateByPrimaryKey, {'age': 20}, 1)
+                students, course, updated = p.execute()
+
+            @param conn: 执行语句的数据库连接
+        '''
+        self.conn = conn
+        self.statements = []
+        # add正在记录的方法不支持pipeline的原因，以及该方法第一条语句的位置
+        self._unsupported = None
+        self._start = 0
+
+    def add(self, method, *args, **kwargs):
+        ''' 添加一个Orm操作，只记录语句不执行。只支持执行一条语句的方法，
+            不支持分页查询和executemany批量写入
+        --
+            @param method: Orm的方法，如stuOrm.selectByExample
+            @param args, kwargs: 方法的参数
+        '''
+        n = self._start = len(self.statements)
+        self._unsupported = None
+        _local.recorder = self
+        try:
+            method(*args, **kwargs)
+            if len(self.statements) != n + 1:
+                self._unsupported = '没有执行语句'
+        except Exception:
+            # 记录语句之前的错误（如参数不合法）原样抛出；记录之后出错说明方法需要语句的结果，不支持pipeline
+            if self._unsupported is None and len(self.statements) == n:
+                raise
+            if self._unsupported is None:
+                self._unsupported = '方法需要语句的执行结果'
+        finally:
+            _local.recorder = None
+        if self._unsupported is not None:
+            del self.statements[n:]
+            raise Exception('{} 不支持pipeline！{}'.format(getattr(method, '__name__', method), self._unsupported))
+        return self
+
+    def record(self, orm, sql, values, fetch, write, many):
+        ''' 由Orm._execute调用，记录语句
+        --
+        '''
+        if many:
+            self._unsupported = '不支持executemany'
+        elif isinstance(values, list) and any(isinstance(v, InSpill) for v in values):
+            self._unsupported = '不支持TEMP_TABLE方式的大IN列表'
+        elif len(self.statements) > self._start:
+            self._unsupported = '只支持执行一条语句的方法'
+        if self._unsupported is not None:
+            raise Exception(self._unsupported)
+        self.statements.append(_Statement(orm, sql.strip(), values, fetch, write))
+        return None
+
+    def execute(self):
+        ''' 发送所有语句，按添加顺序返回结果。有写操作时所有语句在一个事务中执行，出错则全部回滚
+        --
+        '''
+        statements = self.statements
+        self.statements = []
+        if not statements:
+            return []
+
+        write = any(s.write for s in statements)
+        autoCommit = all(s.orm.auto_commit for s in statements)
+        # 已有未提交的事务时START TRANSACTION会隐式提交它
+        if write and autoCommit and getattr(self.conn, 'server_status', 0) & SERVER_STATUS_IN_TRANS:
+            raise Exception('连接上有未提交的事务，pipeline不能开启新事务！')
+        begin = write and autoCommit
+        cursor = self.conn.cursor()
+        try:
+            sqls = []
+            for s in statements:
+                sqls.append(s.sql if s.values is None else cursor.mogrify(s.sql, s.values))
+            if begin:
+                sqls.insert(0, 'START TRANSACTION')
+            sql = ';\n'.join(sqls)
+            _log.info(sql)
+
+            cursor.execute(sql)
+            if begin:
+                cursor.nextset()
+            results = []
+            for i, s in enumerate(statements):
+                if i:
+                    cursor.nextset()
+                if s.fetch == 'all':
+                    results.append(ResultList(s.orm, cursor.fetchall()))
+                elif s.fetch == 'one':
+                    results.append(cursor.fetchone())
+                elif s.fetch == 'lastrowid':
+                    results.append(cursor.lastrowid)
+                elif callable(s.fetch):
+                    results.append(s.fetch(cursor))
+                else:
+                    results.append(cursor.rowcount)
+            if autoCommit:
+                self.conn.commit()
+            if write:
+                self._afterWrite(statements)
+            return results
+        except Exception as e:
+            _log.error(e)
+            try:
+                self.conn.rollback()
+            except Exception as e2:
+                _log.error(e2)
+            raise wrapError(e, 'pipeline error')
+        finally:
+            cursor.close()
+
+    def _afterWrite(self, statements):
+        ''' 与Orm._execute写操作之后相同：主库写后读窗口、镜像失效、SingleFlight失效
+        --
+        '''
+        orms = []
+        for s in statements:
+            if s.write and not any(s.orm is o for o in orms):
+                orms.append(s.orm)
+        for orm in orms:
+            if orm.router:
+                orm.router.markWrite()
+            if orm.mirror is not None:
+                orm.mirror.markStale()
+            if orm.singleFlight is not None:
+                orm.singleFlight.markWrite()
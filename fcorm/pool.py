@@ -0,0 +1,63 @@
+import copy
+
+__all__ = ['borrow', 'giveBack', 'copyOnConnection', 'rawConnection', 'connectionIdentity']
+
+
+def borrow(source):
+    ''' 从连接来源获取一个连接
+    --
+        @param source: 连接池（有connection()方法，如DBUtils的PooledDB）或者返回新连接的函数
+    '''
+    if hasattr(source, 'cursor'):
+        raise Exception('需要传入连接池或者返回新连接的函数，不能是单个连接！')
+    if hasattr(source, 'connection'):
+        return source.connection()
+    return source()
+
+
+def giveBack(source, conn):
+    ''' 归还连接，连接池的连接放回池中，函数创建的连接直接关闭
+    --
+    '''
+    conn.close()
+
+
+def copyOnConnection(orm, conn):
+    ''' 在另一个线程中使用的Orm副本，所有语句都在conn上执行。
+        与连接或调用线程相关的共享状态（从库路由、SingleFlight、本地镜像）不复制
+    --
+        @param orm: 原Orm，查询字段/多表连接/排序等设置保持一致
+        @param conn: 副本使用的连接
+    '''
+    res = copy.copy(orm)
+    res.conn = conn
+    res.router = None
+    res.singleFlight = None
+    res.mirror = None
+    res.havingValues = list(orm.havingValues)
+    return res
+
+
+def rawConnection(conn):
+    ''' 连接池包装的连接对应的驱动连接：DBUtils的PooledDedicatedDBConnection._con -> SteadyDBConnection._con -> pymysql连接，
+        PooledSharedDBConnection._con -> SharedDBConnection.con -> ...，不是包装的连接原样返回
+    --
+    '''
+    for _ in range(4):
+        inner = getattr(conn, '_con', None) or getattr(conn, 'con', None)
+        if inner is None:
+            return conn
+        conn = inner
+    return conn
+
+
+def connectionIdentity(conn):
+    ''' 连接的数据库标识：pymysql连接为(主机, 端口, 库名)，同一个库的不同连接（如连接池中的连接）相同；
+        取不到时为连接对象本身的id
+    --
+    '''
+    raw = rawConnection(conn)
+    host = getattr(raw, 'host', None)
+    if isinstance(host, str):
+        return (host, getattr(raw, 'port', None), getattr(raw, 'db', None))
+    return ('id', id(conn))
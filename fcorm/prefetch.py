@@ -0,0 +1,150 @@
+import logging
+import queue
+import threading
+from .pool import borrow, giveBack, copyOnConnection
+from .timeout import killQuery
+from .errors import wrapError
+
+__all__ = ['PageIterator']
+
+_log = logging.getLogger()
+
+# 队列中表示已经没有下一页
+_END = object()
+
+
+class _Failure(object):
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+
+
+class PageIterator(object):
+    def __init__(self, orm, example, pageNum, pool, readAhead = 1, usePrimary = False, timeout = None):
+        ''' 分页迭代器，调用方处理第N页时，后台线程使用单独的连接查询后面的页，处理和查询互相重叠。
+            一般通过Orm.iterPagesByExample创建
+        --
+            @param orm: Orm，使用它当前的查询字段/多表连接/排序等设置；后台查询不使用从库路由、SingleFlight和本地镜像
+            @param example: 查询条件，None表示查询所有
+            @param pageNum: 每页数据量
+            @param pool: 后台线程使用的连接池或者返回新连接的函数
+            @param readAhead: 最多预先查询的页数，限制内存占用
+            @param usePrimary: 配置了从库时强制走主库
+            @param timeout: 每页查询的超时时间（秒）
+        '''
+        if readAhead < 1:
+            raise Exception('readAhead必须大于0！')
+        self.orm = orm
+        self.example = example
+        self.pageNum = pageNum
+        self.pool = pool
+        self.usePrimary = usePrimary
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=readAhead)
+        self._cancel = threading.Event()
+        self._thread = None
+        self._done = False
+        # 后台线程正在查询的连接，close时用于KILL QUERY
+        self._lock = threading.Lock()
+        self._active = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='fcorm-prefetch', daemon=True)
+            self._thread.start()
+        item = self._queue.get()
+        if item is _END:
+            self._finish()
+            raise StopIteration
+        if isinstance(item, _Failure):
+            self._finish()
+            raise item.error
+        # 结果上的prefetch等操作使用原Orm，后台线程的连接用完即归还
+        item.orm = self.orm
+        return item
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        ''' 取消迭代，停止后台查询并归还连接。
+            后台线程正在查询时，Orm设置了killConn（见Orm.setTimeout）则通过它KILL QUERY立即中止，
+            否则等待这次查询执行完（最长为每页查询的超时时间）
+        --
+        '''
+        self._cancel.set()
+        with self._lock:
+            conn = self._active
+            if conn is not None and self.orm.killConn is not None and hasattr(conn, 'thread_id'):
+                killQuery(self.orm.killConn, conn.thread_id())
+        self._finish()
+
+    cancel = close
+
+    def _finish(self):
+        self._done = True
+        if self._thread is None:
+            return
+        # 清空队列，让阻塞在put上的后台线程退出
+        while self._thread.is_alive():
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._thread.join(0.05)
+        self._thread = None
+
+    def _put(self, item):
+        ''' 放入队列，队列满时等待；已取消返回False
+        --
+        '''
+        while not self._cancel.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        conn = None
+        page = 1
+        try:
+            conn = borrow(self.pool)
+            orm = copyOnConnection(self.orm, conn)
+            while True:
+                # 检查取消和登记连接在同一把锁内，close要么看到正在查询的连接，要么后台线程看到已取消
+                with self._lock:
+                    if self._cancel.is_set():
+                        return
+                    self._active = conn
+                try:
+                    rows = orm._selectPage(self.example, page, self.pageNum, self.usePrimary, self.timeout)
+                finally:
+                    with self._lock:
+                        self._active = None
+                if rows and not self._put(rows):
+                    return
+                if len(rows) < self.pageNum:
+                    break
+                page += 1
+            self._put(_END)
+        except Exception as e:
+            _log.error(e)
+            self._put(_Failure(wrapError(e, 'iterPagesByExample error; page:{}'.format(page))))
+        finally:
+            if conn is not None:
+                try:
+                    giveBack(self.pool, conn)
+                except Exception as e:
+                    _log.error(e)
@@ -0,0 +1,64 @@
+from fcutils import pers
+
+__all__ = ['ResultList']
+
+
+class ResultList(list):
+    def __init__(self, orm, rows = ()):
+        ''' 查询结果，在list的基础上支持批量预加载关联数据
+        --
+            @param orm: 产生结果的Orm，预加载时使用它的连接
+            @param rows: 查询结果
+        '''
+        super(ResultList, self).__init__(rows)
+        self.orm = orm
+        # 是否因为超过maxRows/maxBytes被截断
+        self.truncated = False
+
+    def prefetch(self, tableName, key, then = None, attr = None, one = False, chunkSize = 1000):
+        ''' 批量预加载关联表的数据，每层关联只执行 ceil(外键数/chunkSize) 次IN查询，避免N+1查询
+        --
+            @example
+                # 每个学生附带study列表，每条study附带对应的course
+                stuOrm.selectByExample(ex).prefetch('study', 'sid', then=('course', 'cid'))
+                # [{'sid': 1, 'name': '张三', 'age': 18, 'study': [{'sid': 1, 'cid': 1, 'result': 90, 'course': [{'cid': 1, ...}]}]}]
+
+                # 关联字段名不同，并且只关联一条
+                courseOrm.selectAll().prefetch('teacher', ('tid', 'tid'), one=True)
+
+            @param tableName: 关联表名
+            @param key: 关联字段，字段名相同时传字符串，否则传(本表字段, 关联表字段)
+            @param then: 下一层关联，传prefetch的位置参数元组或关键字参数字典
+            @param attr: 关联数据存放在哪个字段，默认为关联表名
+            @param one: 为True时只存放第一条关联数据（没有则为None），否则存放列表
+            @param chunkSize: 每次IN查询的最大外键数
+        '''
+        if isinstance(key, (tuple, list)):
+            parentKey, childKey = key
+        else:
+            parentKey = childKey = key
+        attr = attr or tableName
+
+        keys = list({row[parentKey] for row in self if row.get(parentKey) is not None})
+        children = ResultList(self.orm)
+        for i in range(0, len(keys), chunkSize):
+            chunk = keys[i:i + chunkSize]
+            sql = 'SELECT * FROM `{}` WHERE `{}` IN ({})'.format(tableName, childKey, pers(len(chunk)))
+            children.extend(self.orm._execute(sql, chunk))
+
+        if then:
+            if isinstance(then, dict):
+                children.prefetch(**then)
+            else:
+                children.prefetch(*then)
+
+        index = {}
+        for child in children:
+            index.setdefault(child[childKey], []).append(child)
+        for row in self:
+            found = index.get(row.get(parentKey), [])
+            if one:
+                row[attr] = found[0] if found else None
+            else:
+                row[attr] = found
+        return self
@@ -0,0 +1,65 @@
+import logging
+import random
+import threading
+from .errors import DEADLOCK_CODES, LOCK_WAIT_CODES, CONNECTION_LOST_CODES, QueryTimeoutError, errorCode
+
+__all__ = ['RetryPolicy']
+
+_log = logging.getLogger()
+
+
+class RetryPolicy(object):
+    def __init__(self, maxRetries = 3, baseDelay = 0.05, maxDelay = 2, retryWrites = True):
+        ''' 重试策略。死锁、锁等待超时、连接断开时按指数退避（带随机抖动）重试
+            1. 查询：以上错误都会重试
+            2. 写操作：retryWrites为True时只重试死锁和锁等待超时（语句已被数据库回滚）；
+               连接断开时无法确定是否已执行，不重试
+            3. 手动提交模式（显式事务）下不重试，因为事务中之前的语句已经失效
+        --
+            @example
+                policy = RetryPolicy(maxRetries=5)
+                stuOrm.setRetryPolicy(policy)
+                ...
+                print(policy.stats)
+                # {'retries': 2, 'recovered': 1, 'failed': 0, 'codes': {1213: 2}}
+
+            @param maxRetries: 最大重试次数
+            @param baseDelay: 首次重试的最大等待时间（秒）
+            @param maxDelay: 单次等待的上限（秒）
+            @param retryWrites: 是否重试写操作
+        '''
+        self.maxRetries = maxRetries
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.retryWrites = retryWrites
+        # 统计：retries 重试次数，recovered 重试后成功的调用数，failed 重试后仍失败的调用数，codes 每个错误码的重试次数
+        self.stats = {'retries': 0, 'recovered': 0, 'failed': 0, 'codes': {}}
+        self._lock = threading.Lock()
+
+    def isRetryable(self, e, write):
+        ''' 判断异常是否可以重试
+        --
+        '''
+        if isinstance(e, QueryTimeoutError):
+            return False
+        code = errorCode(e)
+        if code in DEADLOCK_CODES or code in LOCK_WAIT_CODES:
+            return not write or self.retryWrites
+        if code in CONNECTION_LOST_CODES:
+            return not write
+        return False
+
+    def delay(self, attempt):
+        ''' 第attempt次重试前的等待时间
+        --
+        '''
+        return random.uniform(0, min(self.maxDelay, self.baseDelay * (2 ** attempt)))
+
+    def record(self, key, code = None):
+        ''' 记录统计
+        --
+        '''
+        with self._lock:
+            self.stats[key] += 1
+            if code is not None:
+                self.stats['codes'][code] = self.stats['codes'].get(code, 0) + 1
@@ -0,0 +1,247 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from .constant import ROUND_ROBIN, LEAST_OUTSTANDING
+
+__all__ = ['ReplicaRouter']
+
+_log = logging.getLogger()
+
+# 复制状态语句，MySQL 8.0.22+为SHOW REPLICA STATUS，8.4删除了SHOW SLAVE STATUS
+STATUS_SQLS = ('SHOW REPLICA STATUS', 'SHOW SLAVE STATUS')
+# 复制延迟字段，8.0.22+为Seconds_Behind_Source
+LAG_COLUMNS = ('Seconds_Behind_Source', 'Seconds_Behind_Master')
+
+# pinned中表示使用主库
+_PRIMARY = object()
+
+
+class _Replica(object):
+    def __init__(self, source):
+        ''' 单个从库，可以是数据库连接，也可以是连接池（有connection()方法，如DBUtils的PooledDB）
+        --
+        '''
+        self.source = source
+        # 是否为连接池
+        self.isPool = hasattr(source, 'connection') and not hasattr(source, 'cursor')
+        # 未完成的请求数
+        self.outstanding = 0
+        # 复制延迟（秒），None表示未知
+        self.lag = None
+        # 上次检查延迟的时间
+        self.lagCheckedAt = 0
+        # 上次检查延迟失败的原因，None表示成功
+        self.error = None
+        # 可用的复制状态语句
+        self.statusSQL = None
+
+    def connection(self):
+        ''' 获取一个可用的连接
+        --
+        '''
+        if self.isPool:
+            return self.source.connection()
+        return self.source
+
+    def release(self, conn):
+        ''' 归还连接，连接池的连接会被放回池中
+        --
+        '''
+        if self.isPool:
+            conn.close()
+
+
+class ReplicaRouter(object):
+    def __init__(self, replicas, balance = ROUND_ROBIN, stickyWindow = 0, maxLag = None, lagCheckInterval = 5):
+        ''' 读写分离路由，查询语句分发到从库，写操作和显式事务中的语句走主库
+        --
+            @example
+                router = ReplicaRouter([replica1, replica2], balance=LEAST_OUTSTANDING, stickyWindow=2, maxLag=5)
+                stuOrm = Orm(db, 'student', 'sid', replicas=router)
+                stuOrm.selectAll()                          # 从库
+                stuOrm.selectAll(usePrimary=True)           # 主库
+                stuOrm.insertOne({'name':'王五', 'age':20})
+                stuOrm.selectAll()                          # 写后2秒内仍然走主库
+
+            @param replicas: 从库列表，元素可以是数据库连接或连接池
+            @param balance: 负载均衡策略，ROUND_ROBIN轮询，LEAST_OUTSTANDING最少未完成请求
+            @param stickyWindow: 写后读主库的时间窗口（秒），0表示不开启
+            @param maxLag: 最大允许的复制延迟（秒），超过的从库会被暂时剔除；None表示不检查
+            @param lagCheckInterval: 复制延迟的检查间隔（秒）
+        '''
+        if balance not in (ROUND_ROBIN, LEAST_OUTSTANDING):
+            raise Exception('不支持的负载均衡策略：{}'.format(balance))
+        self.replicas = [_Replica(r) for r in replicas]
+        self.balance = balance
+        self.stickyWindow = stickyWindow
+        self.maxLag = maxLag
+        self.lagCheckInterval = lagCheckInterval
+        # 轮询位置
+        self._next = 0
+        self._lock = threading.Lock()
+        # 每个线程最后一次写操作的时间、固定使用的从库
+        self._local = threading.local()
+        # 上次报告没有可用从库的时间
+        self._warnedAt = 0
+
+    def markWrite(self):
+        ''' 记录当前线程的写操作时间，用于写后读主库
+        --
+        '''
+        if self.stickyWindow:
+            self._local.lastWrite = time.monotonic()
+
+    def isSticky(self):
+        ''' 当前线程是否处于写后读主库的时间窗口内
+        --
+        '''
+        if not self.stickyWindow:
+            return False
+        lastWrite = getattr(self._local, 'lastWrite', None)
+        return lastWrite is not None and time.monotonic() - lastWrite < self.stickyWindow
+
+    @contextmanager
+    def pinned(self):
+        ''' with中当前线程的查询固定使用同一个从库（没有可用从库时都使用主库），如分页查询的总数和数据
+        --
+            @example
+                with router.pinned():
+                    num = stuOrm.selectOneBySQL('SELECT COUNT(*) num FROM student')
+                    rows = stuOrm.selectAllBySQL('SELECT * FROM student LIMIT 10')
+        '''
+        if getattr(self._local, 'pinned', None) is not None:
+            # 嵌套时使用外层固定的从库
+            yield
+            return
+        replica = self.acquire()
+        self._local.pinned = replica or _PRIMARY
+        try:
+            yield
+        finally:
+            self._local.pinned = None
+            if replica:
+                self.release(replica)
+
+    def acquire(self):
+        ''' 选择一个从库并占用，没有可用从库时返回None（调用方应使用主库）
+        --
+        '''
+        pinned = getattr(self._local, 'pinned', None)
+        if pinned is not None:
+            if pinned is _PRIMARY:
+                return None
+            with self._lock:
+                pinned.outstanding += 1
+            return pinned
+
+        candidates = [r for r in self.replicas if self._healthy(r)]
+        if not candidates:
+            self._warnUnavailable()
+            return None
+        with self._lock:
+            if self.balance == LEAST_OUTSTANDING:
+                replica = min(candidates, key=lambda r: r.outstanding)
+            else:
+                replica = candidates[self._next % len(candidates)]
+                self._next += 1
+            replica.outstanding += 1
+        return replica
+
+    def release(self, replica):
+        ''' 释放从库的占用
+        --
+        '''
+        with self._lock:
+            replica.outstanding -= 1
+
+    def _warnUnavailable(self):
+        ''' 所有从库都被剔除时报告原因，每个检查间隔最多一次
+        --
+        '''
+        now = time.monotonic()
+        if not self.replicas or now - self._warnedAt < self.lagCheckInterval:
+            return
+        self._warnedAt = now
+        _log.warning('no replica available, reading from primary: {}'.format(self.status()))
+
+    def status(self):
+        ''' 各从库的状态：复制延迟、检查失败的原因和未完成的请求数
+        --
+            @return: [{'lag': 延迟（秒）, 'error': 失败原因, 'outstanding': 未完成请求数}]
+        '''
+        return [{'lag': r.lag, 'error': r.error, 'outstanding': r.outstanding} for r in self.replicas]
+
+    def currentLag(self):
+        ''' 立即检查所有从库，返回最大的复制延迟（秒），都未知时返回None
+        --
+        '''
+        lags = []
+        for replica in self.replicas:
+            replica.lagCheckedAt = time.monotonic()
+            replica.lag = self._checkLag(replica)
+            if replica.lag is not None:
+                lags.append(replica.lag)
+        return max(lags) if lags else None
+
+    def _healthy(self, replica):
+        ''' 复制延迟是否在允许范围内，超过检查间隔时重新检查
+        --
+        '''
+        if self.maxLag is None:
+            return True
+        now = time.monotonic()
+        if now - replica.lagCheckedAt >= self.lagCheckInterval:
+            replica.lagCheckedAt = now
+            replica.lag = self._checkLag(replica)
+        return replica.lag is not None and replica.lag <= self.maxLag
+
+    def _checkLag(self, replica):
+        ''' 查询从库的复制延迟，复制未运行或查询失败时返回None（从库被剔除），失败原因记录在replica.error
+        --
+        '''
+        conn = None
+        cursor = None
+        try:
+            conn = replica.connection()
+            cursor = conn.cursor()
+            status = self._replicaStatus(replica, cursor)
+            if not status:
+                replica.error = 'replication is not configured'
+                return None
+            if isinstance(status, dict):
+                row = status
+            else:
+                row = dict(zip([d[0] for d in cursor.description], status))
+            for column in LAG_COLUMNS:
+                if column in row:
+                    lag = row[column]
+                    replica.error = None if lag is not None else 'replication is not running'
+                    return lag
+            replica.error = 'no lag column in replica status'
+            return None
+        except Exception as e:
+            replica.error = str(e)
+            _log.error('check replica lag error: {}'.format(e))
+            return None
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if conn is not None:
+                replica.release(conn)
+
+    def _replicaStatus(self, replica, cursor):
+        ''' 读取复制状态，先使用SHOW REPLICA STATUS，不支持时使用SHOW SLAVE STATUS
+        --
+        '''
+        sqls = [replica.statusSQL] if replica.statusSQL else STATUS_SQLS
+        for i, sql in enumerate(sqls):
+            try:
+                cursor.execute(sql)
+            except Exception as e:
+                if i == len(sqls) - 1:
+                    raise
+                _log.info('{} not supported: {}'.format(sql, e))
+                continue
+            replica.statusSQL = sql
+            return cursor.fetchone()
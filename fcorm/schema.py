@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import threading
+import time
+
+__all__ = ['TableSchema', 'loadSchema', 'clearSchemaCache']
+
+_log = logging.getLogger()
+
+# 进程内缓存 {(库名, 表名): TableSchema}
+_cache = {}
+_lock = threading.Lock()
+
+# 磁盘缓存的默认有效期（秒）
+CACHE_TTL = 3600
+
+
+class TableSchema(object):
+    def __init__(self, database, tableName, columns, types, primaryKey, autoIncrement = None, uniqueKeys = None, indexes = None):
+        ''' 表结构元数据
+        --
+            @param database: 库名
+            @param tableName: 表名
+            @param columns: 字段名列表，按表中顺序
+            @param types: {字段名: 类型}
+            @param primaryKey: 主键字段列表，联合主键有多个
+            @param autoIncrement: 自增字段名
+            @param uniqueKeys: 唯一索引 {索引名: [字段名]}
+            @param indexes: 普通索引 {索引名: [字段名]}
+        '''
+        self.database = database
+        self.tableName = tableName
+        self.columns = columns
+        self.types = types
+        self.primaryKey = primaryKey
+        self.autoIncrement = autoIncrement
+        self.uniqueKeys = uniqueKeys or {}
+        self.indexes = indexes or {}
+        self.columnSet = frozenset(columns)
+        self.templates = self._render()
+
+    def _render(self):
+        ''' 预先生成常用语句模板
+        --
+        '''
+        t = '`{}`'.format(self.tableName)
+        columns = ', '.join('{}.`{}`'.format(t, c) for c in self.columns)
+        pkWhere = ' AND '.join('{}.`{}`=%s'.format(t, k) for k in self.primaryKey)
+        templates = {
+            'columns': columns,
+            'pkWhere': pkWhere
+        }
+        if self.primaryKey:
+            templates['selectByPrimaryKey'] = 'SELECT {} FROM {} WHERE {}'.format(columns, t, pkWhere)
+            templates['deleteByPrimaryKey'] = 'DELETE FROM {} WHERE {}'.format(t, pkWhere)
+        return templates
+
+    def checkColumns(self, keys):
+        ''' 检查字段是否都存在，不存在则抛出异常
+        --
+        '''
+        unknown = [k for k in keys if k not in self.columnSet]
+        if unknown:
+            raise Exception('表{}中没有字段：{}'.format(self.tableName, unknown))
+
+    def toDict(self):
+        return {
+            'database': self.database,
+            'tableName': self.tableName,
+            'columns': self.columns,
+            'types': self.types,
+            'primaryKey': self.primaryKey,
+            'autoIncrement': self.autoIncrement,
+            'uniqueKeys': self.uniqueKeys,
+            'indexes': self.indexes
+        }
+
+    @classmethod
+    def fromDict(cls, d):
+        return cls(**d)
+
+
+def _query(conn, sql, values = None):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, values)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def _readSchema(conn, database, tableName):
+    ''' 从information_schema读取表结构
+    --
+    '''
+    rows = _query(conn, '''SELECT COLUMN_NAME name, DATA_TYPE type, COLUMN_KEY columnKey, EXTRA extra
+        FROM information_schema.COLUMNS WHERE TABLE_SCHEMA=%s AND TABLE_NAME=%s ORDER BY ORDINAL_POSITION''', [database, tableName])
+    if not rows:
+        raise Exception('表{}.{}不存在！'.format(database, tableName))
+    columns = [r['name'] for r in rows]
+    types = {r['name']: r['type'] for r in rows}
+    autoIncrement = None
+    for r in rows:
+        if 'auto_increment' in (r['extra'] or '').lower():
+            autoIncrement = r['name']
+
+    primaryKey = []
+    uniqueKeys = {}
+    indexes = {}
+    rows = _query(conn, '''SELECT INDEX_NAME indexName, NON_UNIQUE nonUnique, COLUMN_NAME name
+        FROM information_schema.STATISTICS WHERE TABLE_SCHEMA=%s AND TABLE_NAME=%s ORDER BY INDEX_NAME, SEQ_IN_INDEX''', [database, tableName])
+    for r in rows:
+        if r['indexName'] == 'PRIMARY':
+            primaryKey.append(r['name'])
+        elif int(r['nonUnique']) == 0:
+            uniqueKeys.setdefault(r['indexName'], []).append(r['name'])
+        else:
+            indexes.setdefault(r['indexName'], []).append(r['name'])
+    return TableSchema(database, tableName, columns, types, primaryKey, autoIncrement, uniqueKeys, indexes)
+
+
+def _readFile(cacheFile):
+    if not cacheFile or not os.path.exists(cacheFile):
+        return {}
+    try:
+        with open(cacheFile, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        _log.warning('read schema cache error: {}'.format(e))
+        return {}
+
+
+def _writeFile(cacheFile, data):
+    tmp = cacheFile + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, cacheFile)
+
+
+def loadSchema(conn, tableName, cacheFile = None, refresh = False, ttl = CACHE_TTL):
+    ''' 读取表结构，每个表在进程内只读取一次
+    --
+        @param conn: 数据库连接
+        @param tableName: 表名
+        @param cacheFile: 磁盘缓存文件（json），启动时优先从文件中读取，避免每次启动都查询information_schema
+        @param refresh: 强制重新读取
+        @param ttl: 磁盘缓存的有效期（秒），超过后重新读取并更新文件，避免表结构变更后一直使用旧的缓存；None表示不过期
+    '''
+    database = getattr(conn, 'db', None)
+    if isinstance(database, bytes):
+        database = database.decode('utf-8')
+    if not database:
+        database = _query(conn, 'SELECT DATABASE() db')[0]['db']
+    key = (database, tableName)
+    with _lock:
+        if not refresh and key in _cache:
+            return _cache[key]
+        fileKey = '{}.{}'.format(database, tableName)
+        fileData = _readFile(cacheFile)
+        entry = fileData.get(fileKey)
+        if not refresh and entry is not None and _fresh(entry, ttl):
+            entry = dict(entry)
+            entry.pop('cachedAt', None)
+            schema = TableSchema.fromDict(entry)
+        else:
+            schema = _readSchema(conn, database, tableName)
+            if cacheFile:
+                fileData[fileKey] = dict(schema.toDict(), cachedAt=time.time())
+                _writeFile(cacheFile, fileData)
+        _cache[key] = schema
+        return schema
+
+
+def _fresh(entry, ttl):
+    ''' 磁盘缓存是否在有效期内，没有缓存时间的旧文件视为过期
+    --
+    '''
+    if ttl is None:
+        return True
+    cachedAt = entry.get('cachedAt')
+    return cachedAt is not None and time.time() - cachedAt < ttl
+
+
+def clearSchemaCache():
+    ''' 清空进程内的表结构缓存
+    --
+    '''
+    with _lock:
+        _cache.clear()
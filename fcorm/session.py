@@ -0,0 +1,236 @@
+import weakref
+from .result import ResultList
+from .pipeline import Pipeline
+
+__all__ = ['Session', 'Row']
+
+# 返回本对象以便链式调用的方法（以及所有set开头的设置方法）
+_CHAINS = ('orderByClause', 'groupByClause', 'havingByExample', 'join', 'leftJoin', 'rightJoin', 'setDistinct',
+           'setSelectProperties', 'clear', 'autoCommit')
+# 不修改数据的方法，其他未覆盖的方法都视为写操作
+_READS = ('selectJSONByExample', 'selectTransactByExample', 'selectGroupHavingByExample', 'selectAggregateByExample',
+          'selectOneBySQL', 'selectAllBySQL', 'selectJSONBySQL', 'explainByExample', 'iterPagesByExample', 'pullChanges',
+          'subQuery', 'loadSchema', 'close', '_primaryKeys', '_primaryValues', '_primaryWhere', '_propertiesStr',
+          '_isPlain', '_whereBuilder', '_selectByExampleSQL')
+# 只修改本表的写操作，使本表失效；其他写操作（如copyByExample、moveByExample、gather、_execute）清空整个会话
+_TABLE_WRITES = ('insertData', 'insertOne', 'insertMany', 'insertDictList', 'updateByExampleInChunks',
+                 'deleteByExampleInChunks')
+
+
+class Row(dict):
+    ''' 可以被弱引用的行（dict本身不支持弱引用）
+    '''
+    __slots__ = ('__weakref__',)
+
+
+class Session(object):
+    def __init__(self):
+        ''' 工作单元，在一次请求内按(表名, 主键)对查询结果去重：
+            1. 根据主键查询时，已经加载过的行直接从内存返回
+            2. 不同查询返回的同一行使用同一个对象（用最新查询到的数据更新）
+            3. 通过会话执行的写操作会使对应的行失效：按主键更新/删除只使该行失效，本表的其他写操作使整个表失效，
+               不能确定影响范围的操作（执行SQL、跨表复制、并发任务、_execute等）清空整个会话
+            映射使用弱引用，调用方不再持有的行会被自动回收；会话结束时清空
+        --
+            @example
+                with Session() as session:
+                    teacherOrm = session.wrap(Orm(db, 'teacher', 'tid'))
+                    t1 = teacherOrm.selectByPrimaeyKey(1)           # 查询数据库
+                    t2 = teacherOrm.selectByPrimaeyKey(1)           # 从内存返回，t2 is t1
+                    rows = teacherOrm.selectByExample(example)      # rows中tid=1的行 is t1
+        '''
+        self._map = weakref.WeakValueDictionary()
+        # 统计：hits 从内存返回的主键查询次数，misses 查询数据库的主键查询次数
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, exc, tb):
+        self.close()
+        return False
+
+    def wrap(self, orm):
+        ''' 返回通过本会话访问的Orm
+        --
+        '''
+        return _SessionOrm(self, orm)
+
+    def get(self, tableName, key):
+        return self._map.get((tableName, key))
+
+    def canonical(self, tableName, key, row):
+        ''' 返回(表名, 主键)对应的唯一对象，已存在时用row更新它
+        --
+        '''
+        mapKey = (tableName, key)
+        existing = self._map.get(mapKey)
+        if existing is not None:
+            if existing is not row:
+                existing.update(row)
+            return existing
+        if not isinstance(row, Row):
+            row = Row(row)
+        self._map[mapKey] = row
+        return row
+
+    def evict(self, tableName, key = None):
+        ''' 使某一行失效，key为None时使整个表失效
+        --
+        '''
+        if key is not None:
+            self._map.pop((tableName, key), None)
+            return
+        for mapKey in [k for k in list(self._map.keys()) if k[0] == tableName]:
+            self._map.pop(mapKey, None)
+
+    def close(self):
+        ''' 结束会话，清空映射
+        --
+        '''
+        self._map.clear()
+
+    clear = close
+
+
+class _SessionOrm(object):
+    def __init__(self, session, orm):
+        ''' 通过会话访问的Orm，未覆盖的方法直接调用原Orm
+        --
+        '''
+        self._session = session
+        self._orm = orm
+
+    def __getattr__(self, name):
+        attr = getattr(self._orm, name)
+        if not callable(attr) or name in _READS:
+            return attr
+        if name in _CHAINS or name.startswith('set'):
+            # 链式调用返回包装后的对象
+            def chain(*args, **kwargs):
+                attr(*args, **kwargs)
+                return self
+            return chain
+
+        session = self._session
+        if name in _TABLE_WRITES:
+            tableName = self._orm.tableName
+
+            def write(*args, **kwargs):
+                session.evict(tableName)
+                try:
+                    return attr(*args, **kwargs)
+                finally:
+                    session.evict(tableName)
+            return write
+
+        # 执行前后都清空：执行过程中其他线程可能把旧数据放回映射
+        def unknown(*args, **kwargs):
+            session.clear()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                session.clear()
+        return unknown
+
+    def _isFullRow(self):
+        ''' 查询结果是否为本表的完整行，只有完整行才能放入映射
+        --
+        '''
+        return self._orm.properties == ' * ' and not self._orm.joinStr and not self._orm.groupByStr
+
+    def _key(self, row):
+        keys = self._orm._primaryKeys()
+        try:
+            return tuple(row[k] for k in keys)
+        except KeyError:
+            return None
+
+    def _canonicalRows(self, rows):
+        if not self._isFullRow():
+            return rows
+        tableName = self._orm.tableName
+        res = ResultList(self._orm)
+        for row in rows:
+            key = self._key(row)
+            res.append(row if key is None else self._session.canonical(tableName, key, row))
+        return res
+
+    def selectByPrimaeyKey(self, primaryValue, *args, **kwargs):
+        if not self._isFullRow():
+            return self._orm.selectByPrimaeyKey(primaryValue, *args, **kwargs)
+        key = tuple(self._orm._primaryValues(primaryValue))
+        row = self._session.get(self._orm.tableName, key)
+        if row is not None:
+            self._session.stats['hits'] += 1
+            return row
+        self._session.stats['misses'] += 1
+        row = self._orm.selectByPrimaeyKey(primaryValue, *args, **kwargs)
+        if row is None:
+            return None
+        return self._session.canonical(self._orm.tableName, key, row)
+
+    def selectAll(self, *args, **kwargs):
+        return self._canonicalRows(self._orm.selectAll(*args, **kwargs))
+
+    def selectByExample(self, *args, **kwargs):
+        return self._canonicalRows(self._orm.selectByExample(*args, **kwargs))
+
+    def selectPageAll(self, *args, **kwargs):
+        num, rows = self._orm.selectPageAll(*args, **kwargs)
+        return num, self._canonicalRows(rows)
+
+    def selectPageByExample(self, *args, **kwargs):
+        num, rows = self._orm.selectPageByExample(*args, **kwargs)
+        return num, self._canonicalRows(rows)
+
+    def _evictPrimary(self, primaryValue):
+        ''' 使主键对应的行失效，主键值不完整时使整个表失效
+        --
+        '''
+        try:
+            key = tuple(self._orm._primaryValues(primaryValue))
+        except Exception:
+            key = None
+        self._session.evict(self._orm.tableName, key)
+
+    def updateByPrimaryKey(self, data, primaryValue = None, keys = None):
+        self._evictPrimary(primaryValue or {k: data.get(k) for k in self._orm._primaryKeys()})
+        return self._orm.updateByPrimaryKey(data, primaryValue, keys)
+
+    def deleteByPrimaryKey(self, primaryValue):
+        self._evictPrimary(primaryValue)
+        return self._orm.deleteByPrimaryKey(primaryValue)
+
+    def updateByExample(self, *args, **kwargs):
+        self._session.evict(self._orm.tableName)
+        return self._orm.updateByExample(*args, **kwargs)
+
+    def deleteByExample(self, *args, **kwargs):
+        self._session.evict(self._orm.tableName)
+        return self._orm.deleteByExample(*args, **kwargs)
+
+    def executeBySQL(self, *args, **kwargs):
+        # 语句可能修改任意表
+        self._session.clear()
+        return self._orm.executeBySQL(*args, **kwargs)
+
+    def pipeline(self):
+        ''' 与Orm.pipeline相同，有写操作的pipeline执行后清空会话
+        --
+        '''
+        return _SessionPipeline(self._session, self._orm.conn)
+
+
+class _SessionPipeline(Pipeline):
+    def __init__(self, session, conn):
+        super(_SessionPipeline, self).__init__(conn)
+        self._session = session
+
+    def execute(self):
+        write = any(s.write for s in self.statements)
+        try:
+            return super(_SessionPipeline, self).execute()
+        finally:
+            if write:
+                self._session.clear()
@@ -0,0 +1,359 @@
+import bisect
+import heapq
+import logging
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from .constant import PRIMARY_KEY
+from .orm import Orm
+from .example import Example
+from .subquery import SubQuery
+
+__all__ = ['ShardMap', 'ShardedOrm']
+
+_log = logging.getLogger()
+
+
+class ShardMap(object):
+    def __init__(self, shardKey, count, ranges = None):
+        ''' 分片规则，按分片键哈希或者范围分片
+        --
+            @example
+                ShardMap('sid', 4)                          # sid % 4
+                ShardMap('sid', 3, ranges=[10000, 20000])   # [, 10000) [10000, 20000) [20000, )
+
+            @param shardKey: 分片键
+            @param count: 分片数
+            @param ranges: 范围分片的分界值（升序），长度为count-1；不填则使用哈希分片
+        '''
+        if ranges is not None and len(ranges) != count - 1:
+            raise Exception('范围分片的分界值数量必须为分片数-1！')
+        self.shardKey = shardKey
+        self.count = count
+        self.ranges = ranges
+
+    def shardFor(self, value):
+        ''' 计算分片键的值所在的分片
+        --
+        '''
+        if self.ranges is not None:
+            return bisect.bisect_right(self.ranges, value)
+        if isinstance(value, int):
+            return value % self.count
+        # 字符串使用crc32，保证不同进程之间结果一致
+        return zlib.crc32(str(value).encode('utf-8')) % self.count
+
+
+class _SortKey(object):
+    ''' 多字段排序键，每个字段可以单独指定升序或降序，NULL视为最小值（与MySQL一致）
+    '''
+    __slots__ = ('values', 'desc')
+
+    def __init__(self, values, desc):
+        self.values = values
+        self.desc = desc
+
+    def __lt__(self, other):
+        for a, b, desc in zip(self.values, other.values, self.desc):
+            if a == b:
+                continue
+            if a is None:
+                less = True
+            elif b is None:
+                less = False
+            else:
+                less = a < b
+            return not less if desc else less
+        return False
+
+
+class ShardedOrm(object):
+    def __init__(self, conns, tableName, shardMap, keyProperty = PRIMARY_KEY, auto_commit = True):
+        ''' 水平分片，每个分片一个数据库连接。带分片键的操作只访问对应分片，否则并行访问所有分片并合并结果
+        --
+            @example
+                stuOrm = ShardedOrm([db0, db1], 'student', ShardMap('sid', 2), 'sid')
+                stuOrm.selectByPrimaeyKey(1)                                        # 只查询分片1
+                stuOrm.orderByClause('age').selectPageByExample(Example().andLike('name', '张%'), 2, 10)
+                stuOrm.selectTransactByExample('sid', example, 'num')               # 各分片的COUNT相加
+
+            @param conns: 各分片的数据库连接，顺序与分片编号一致
+            @param tableName: 表名
+            @param shardMap: 分片规则
+            @param keyProperty: 主键字段名
+            @param auto_commit: 自动提交
+        '''
+        if len(conns) != shardMap.count:
+            raise Exception('连接数与分片数不一致！')
+        self.tableName = tableName
+        self.keyProperty = keyProperty
+        self.shardMap = shardMap
+        self.shards = [Orm(conn, tableName, keyProperty, auto_commit) for conn in conns]
+        # 主键策略，分片键为主键且非自增时，写入前需要先生成主键才能路由
+        self.generator = None
+        # 排序字段 [(key, clause)]
+        self.orderBy = []
+        # 分组字段
+        self.groupBy = []
+        self._pool = ThreadPoolExecutor(max_workers=len(self.shards))
+
+    def setPrimaryGenerator(self, generator):
+        ''' 设置主键生成策略，分片键为主键时，写入前先生成主键再路由到分片
+        --
+        '''
+        if callable(generator):
+            self.generator = generator
+        return self
+
+    #################################### 查询条件 ####################################
+    def orderByClause(self, key, clause = 'DESC'):
+        ''' ORDER BY key clause，合并各分片结果时也按此排序
+        --
+        '''
+        self.orderBy.append((key, clause))
+        for shard in self.shards:
+            shard.orderByClause(key, clause)
+        return self
+
+    def groupByClause(self, key):
+        ''' GROUP BY key clause，合并聚合结果时也按此分组
+        --
+        '''
+        self.groupBy.append(key)
+        for shard in self.shards:
+            shard.groupByClause(key)
+        return self
+
+    def setDistinct(self):
+        ''' 设置去重，只在分片内去重
+        --
+        '''
+        for shard in self.shards:
+            shard.setDistinct()
+        return self
+
+    def setSelectProperties(self, properties):
+        ''' 设置查询的列名，排序字段需要包含在查询列中
+        --
+        '''
+        for shard in self.shards:
+            shard.setSelectProperties(list(properties) if isinstance(properties, list) else properties)
+        return self
+
+    def clear(self):
+        ''' 清除查询字段/分组字段/排序字段等
+        --
+        '''
+        self.orderBy = []
+        self.groupBy = []
+        for shard in self.shards:
+            shard.clear()
+        return self
+
+    #################################### 新增操作 ####################################
+    def insertOne(self, data):
+        ''' 写入一条数据，data中必须包含分片键
+        --
+        '''
+        return self.shards[self._shardForData(data)].insertOne(data)
+
+    def insertDictList(self, dataList):
+        ''' 批量写入，按分片分组后每个分片执行一次，返回写入的行数
+        --
+        '''
+        groups = {}
+        for data in dataList:
+            groups.setdefault(self._shardForData(data), []).append(data)
+        self._scatter(lambda orm, rows: orm.insertDictList(rows), groups)
+        return sum(len(rows) for rows in groups.values())
+
+    #################################### 更新操作 ####################################
+    def updateByPrimaryKey(self, data, primaryValue = None, keys = None):
+        ''' 根据主键更新，分片键为主键时只更新对应分片
+        --
+        '''
+        if not primaryValue:
+            primaryValue = data.pop(self.keyProperty, None)
+        return sum(self._scatter(lambda orm, _: orm.updateByPrimaryKey(dict(data), primaryValue, keys),
+                                 self._shardsForPrimary(primaryValue)))
+
+    def updateByExample(self, data, example, keys = None):
+        ''' 根据Example条件更新，返回各分片影响行数之和
+        --
+        '''
+        return sum(self._scatter(lambda orm, _: orm.updateByExample(dict(data), example, keys),
+                                 self._shardsForExample(example)))
+
+    #################################### 删除操作 ####################################
+    def deleteByPrimaryKey(self, primaryValue):
+        ''' 根据主键删除，分片键为主键时只删除对应分片
+        --
+        '''
+        return sum(self._scatter(lambda orm, _: orm.deleteByPrimaryKey(primaryValue),
+                                 self._shardsForPrimary(primaryValue)))
+
+    def deleteByExample(self, example):
+        ''' 根据Example条件删除，返回各分片影响行数之和
+        --
+        '''
+        return sum(self._scatter(lambda orm, _: orm.deleteByExample(example),
+                                 self._shardsForExample(example)))
+
+    #################################### 查询操作 ####################################
+    def selectAll(self):
+        ''' 查询所有分片，按排序字段合并
+        --
+        '''
+        results = self._scatter(lambda orm, _: orm.selectAll(), range(len(self.shards)))
+        return self._merge(results)
+
+    def selectByPrimaeyKey(self, primaryValue):
+        ''' 根据主键查询，分片键为主键时只查询对应分片
+        --
+        '''
+        for res in self._scatter(lambda orm, _: orm.selectByPrimaeyKey(primaryValue),
+                                 self._shardsForPrimary(primaryValue)):
+            if res:
+                return res
+        return None
+
+    def selectByExample(self, example):
+        ''' 根据Example条件查询，条件中有分片键时只查询对应分片
+        --
+        '''
+        results = self._scatter(lambda orm, _: orm.selectByExample(example), self._shardsForExample(example))
+        return self._merge(results)
+
+    def selectPageByExample(self, example, page = 1, pageNum = 10):
+        ''' 根据Example条件分页查询。每个分片取前page*pageNum条，合并排序后再截取
+        --
+        '''
+        startId = (page - 1) * pageNum
+        results = self._scatter(lambda orm, _: orm.selectPageByExample(example, 1, startId + pageNum),
+                                self._shardsForExample(example))
+        num = sum(r[0] for r in results)
+        rows = self._merge([r[1] for r in results])
+        return num, rows[startId:startId + pageNum]
+
+    def selectTransactByExample(self, transactProperties, example, transactName = '', transact = 'COUNT'):
+        ''' 根据Example条件聚合查询，合并各分片的结果。支持COUNT，SUM，MIN，MAX。
+            按groupByClause的分组字段合并，没有分组时合并为一行
+        --
+        '''
+        transact = transact.upper()
+        if transact not in ('COUNT', 'SUM', 'MIN', 'MAX'):
+            raise Exception('分片聚合查询不支持{}！'.format(transact))
+        results = self._scatter(lambda orm, _: orm.selectTransactByExample(transactProperties, example, transactName, transact),
+                                self._shardsForExample(example))
+        name = transactName or '{}({})'.format(transact, transactProperties)
+        columns = [k.split('.')[-1] for k in self.groupBy]
+        groups = {}
+        for rows in results:
+            for row in rows:
+                group = tuple(row.get(c) for c in columns)
+                if group not in groups:
+                    groups[group] = dict(row)
+                    continue
+                merged = groups[group]
+                a, b = merged[name], row[name]
+                if a is None or b is None:
+                    merged[name] = b if a is None else a
+                elif transact in ('COUNT', 'SUM'):
+                    merged[name] = a + b
+                elif transact == 'MIN':
+                    merged[name] = min(a, b)
+                else:
+                    merged[name] = max(a, b)
+        rows = list(groups.values())
+        sortKey = self._sortKey()
+        return sorted(rows, key=sortKey) if sortKey else rows
+
+    #################################### 路由 ####################################
+    def _shardForData(self, data):
+        ''' 计算一条待写入数据所在的分片
+        --
+        '''
+        key = self.shardMap.shardKey
+        if key not in data or data[key] is None:
+            if key == self.keyProperty and self.generator:
+                data[key] = self.generator()
+            else:
+                raise Exception('数据中没有分片键{}！'.format(key))
+        return self.shardMap.shardFor(data[key])
+
+    def _shardsForPrimary(self, primaryValue):
+        ''' 分片键为主键时只返回对应分片，否则返回所有分片
+        --
+        '''
+        if self.shardMap.shardKey == self.keyProperty:
+            return [self.shardMap.shardFor(primaryValue)]
+        return range(len(self.shards))
+
+    def _shardsForExample(self, example):
+        ''' 条件全部用AND连接且包含分片键的=或IN条件时，只返回命中的分片，否则返回所有分片
+        --
+        '''
+        allShards = range(len(self.shards))
+        if not isinstance(example, Example) or 'OR' in example.orAnd:
+            return allShards
+        names = (self.shardMap.shardKey, '{}.{}'.format(self.tableName, self.shardMap.shardKey))
+        shards = None
+        for w in example.where:
+            if not isinstance(w, tuple) or w[0] not in names:
+                continue
+            k, v, p = w
+            if isinstance(v, SubQuery):
+                continue
+            if p == '=':
+                hit = {self.shardMap.shardFor(v)}
+            elif p.upper() == 'IN':
+                hit = {self.shardMap.shardFor(x) for x in v}
+            else:
+                continue
+            shards = hit if shards is None else shards & hit
+        if shards is None:
+            return allShards
+        return sorted(shards)
+
+    def _scatter(self, func, shards):
+        ''' 并行在多个分片上执行，按分片顺序返回结果
+        --
+            @param func: func(orm, arg)，shards为字典时arg为对应的值
+            @param shards: 分片编号列表，或者{分片编号: 参数}
+        '''
+        if isinstance(shards, dict):
+            items = list(shards.items())
+        else:
+            items = [(i, None) for i in shards]
+        if len(items) == 1:
+            i, arg = items[0]
+            return [func(self.shards[i], arg)]
+        futures = [self._pool.submit(func, self.shards[i], arg) for i, arg in items]
+        return [f.result() for f in futures]
+
+    def _sortKey(self):
+        ''' 按排序字段比较行的key函数，没有排序字段返回None
+        --
+        '''
+        if not self.orderBy:
+            return None
+        columns = [k.split('.')[-1] for k, _ in self.orderBy]
+        desc = [c.upper() == 'DESC' for _, c in self.orderBy]
+        return lambda row: _SortKey([row.get(c) for c in columns], desc)
+
+    def _merge(self, results):
+        ''' 按排序字段k路归并各分片的有序结果
+        --
+        '''
+        results = [list(r) for r in results if r]
+        sortKey = self._sortKey()
+        if not sortKey:
+            return [row for rows in results for row in rows]
+        return list(heapq.merge(*results, key=sortKey))
+
+    def close(self):
+        ''' 关闭所有分片的连接
+        --
+        '''
+        self._pool.shutdown()
+        for shard in self.shards:
+            shard.close()
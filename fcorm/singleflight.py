@@ -0,0 +1,101 @@
+import threading
+from .result import ResultList
+
+__all__ = ['SingleFlight']
+
+
+class _Call(object):
+    __slots__ = ('event', 'result', 'error', 'generation')
+
+    def __init__(self, generation):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.generation = generation
+
+
+def _copyResult(orm, res):
+    ''' 共享结果复制给等待者，避免调用方修改结果互相影响
+    --
+    '''
+    if isinstance(res, ResultList):
+        copy = ResultList(orm, [dict(r) if isinstance(r, dict) else r for r in res])
+        copy.truncated = res.truncated
+        return copy
+    if isinstance(res, dict):
+        return dict(res)
+    return res
+
+
+class SingleFlight(object):
+    def __init__(self, timeout = 5):
+        ''' 合并并发的相同查询：同一语句和参数的查询正在执行时，后来的调用等待并共享它的结果（或异常），不再访问数据库。
+            按Orm连接的库（pymysql连接的主机、端口、库名，其他连接按连接对象）、最终的SQL和参数合并，
+            连接不同库的Orm可以共用同一个SingleFlight
+        --
+            @example
+                flight = SingleFlight(timeout=2)
+                # 每个线程自己的Orm共用同一个SingleFlight
+                stuOrm = Orm(pool.connection(), 'student', 'sid').setSingleFlight(flight)
+                stuOrm.selectByPrimaeyKey(1)
+                print(flight.stats)     # {'leaders': 1, 'shared': 37, 'timeouts': 0, 'errors': 0}
+
+            @param timeout: 等待正在执行的查询的最长时间（秒），超时后自己执行查询
+        '''
+        self.timeout = timeout
+        # 统计：leaders 实际执行的查询，shared 共享结果而省下的查询，timeouts 等待超时后自己执行的查询，errors 执行失败的查询
+        self.stats = {'leaders': 0, 'shared': 0, 'timeouts': 0, 'errors': 0}
+        self._calls = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def markWrite(self):
+        ''' 有写操作，之后的查询不再共享之前开始的查询结果，由Orm在写操作后调用
+        --
+        '''
+        with self._lock:
+            self._generation += 1
+
+    def do(self, key, fn, orm = None, timeout = None):
+        ''' 执行fn()，相同key的调用正在执行时等待并共享它的结果
+        --
+            @param key: 合并的键，必须可哈希
+            @param fn: 执行查询的函数
+            @param orm: 共享结果复制后所属的Orm
+            @param timeout: 本次等待的最长时间（秒），None使用默认设置
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None or call.generation != self._generation:
+                call = self._calls[key] = _Call(self._generation)
+                self.stats['leaders'] += 1
+                leader = True
+            else:
+                leader = False
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException as e:
+                call.error = e
+                with self._lock:
+                    self.stats['errors'] += 1
+                raise
+            finally:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                call.event.set()
+
+        if timeout is None:
+            timeout = self.timeout
+        if not call.event.wait(timeout):
+            with self._lock:
+                self.stats['timeouts'] += 1
+            return fn()
+        with self._lock:
+            self.stats['shared'] += 1
+        if call.error is not None:
+            raise call.error
+        return _copyResult(orm, call.result)
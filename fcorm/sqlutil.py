@@ -0,0 +1,25 @@
+import re
+
+__all__ = ['IDENTIFIER', 'isIdentifier', 'quoteKey']
+
+# 字段名：字段 或 表名.字段
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$')
+
+
+def isIdentifier(key):
+    ''' 是否为合法的字段名（字段 或 表名.字段），用于拒绝外部传入的字段名中拼接的SQL
+    --
+    '''
+    return isinstance(key, str) and IDENTIFIER.match(key) is not None
+
+
+def quoteKey(key):
+    ''' 字段名加反引号，支持 表名.字段名 和 *
+    --
+    '''
+    if key == '*':
+        return key
+    if '.' in key:
+        keys = key.split('.')
+        return '`' + keys[0] + '`.`' + keys[1] + '`'
+    return '`' + key + '`'
@@ -0,0 +1,21 @@
+__all__ = ['SubQuery']
+
+
+class SubQuery(object):
+    __slots__ = ('sql', 'values')
+
+    def __init__(self, sql, values = None):
+        ''' 子查询，作为Example条件的值时编译为 (sql)，参数按位置合并到外层语句中。
+            一般通过Orm.subQuery生成，也可以直接传入语句
+        --
+            @example
+                SubQuery('SELECT `sid` FROM `study` WHERE `result` > %s', [60])
+
+            @param sql: 子查询语句
+            @param values: 参数列表
+        '''
+        self.sql = sql.strip()
+        self.values = list(values or [])
+
+    def __repr__(self):
+        return 'SubQuery({!r}, {!r})'.format(self.sql, self.values)
@@ -0,0 +1,108 @@
+import logging
+import re
+import threading
+import time
+from .errors import QueryTimeoutError, errorCode
+
+__all__ = ['Deadline', 'killQuery']
+
+_log = logging.getLogger()
+
+_SELECT = re.compile(r'^\s*SELECT\b', re.I)
+# 服务端中止语句的错误码：3024 超过MAX_EXECUTION_TIME，1317 被KILL QUERY中断
+TIMEOUT_CODES = (3024, 1317)
+
+
+class Deadline(object):
+    def __init__(self, conn, sql, timeout, killConn = None):
+        ''' 单条语句的执行期限
+            1. SELECT语句添加MAX_EXECUTION_TIME优化器提示，由服务端中止
+            2. 其他语句设置连接的读写超时（pymysql的_read_timeout/_write_timeout）
+            3. 配置了killConn时，到期后通过它执行KILL QUERY中止语句
+            只有3024/1317，或者到期后出现的异常（如读超时导致的2013）才转换为QueryTimeoutError，
+            未到期的断线仍按原异常抛出
+        --
+            @example
+                deadline = Deadline(conn, sql, 1.5, killConn)
+                with deadline:
+                    cursor.execute(deadline.sql, values)
+
+            @param conn: 执行语句的连接
+            @param sql: sql语句
+            @param timeout: 超时时间（秒）
+            @param killConn: 执行KILL QUERY的连接，可以是连接、连接池或者返回连接的函数
+        '''
+        self.conn = conn
+        self.timeout = timeout
+        self.killConn = killConn
+        self.isSelect = bool(_SELECT.match(sql))
+        if self.isSelect:
+            self.sql = _SELECT.sub(lambda m: m.group(0) + ' /*+ MAX_EXECUTION_TIME({}) */'.format(max(1, int(timeout * 1000))), sql, 1)
+        else:
+            self.sql = sql
+        self.expired = False
+        self._timer = None
+        self._saved = None
+        self._started = None
+        # 语句结束后不再执行KILL，避免中止连接上后续的语句
+        self._lock = threading.Lock()
+        self._finished = False
+
+    def __enter__(self):
+        if not self.isSelect and hasattr(self.conn, '_read_timeout'):
+            self._saved = (self.conn._read_timeout, self.conn._write_timeout)
+            self.conn._read_timeout = self.conn._write_timeout = self.timeout
+        self._started = time.monotonic()
+        if self.killConn is not None and hasattr(self.conn, 'thread_id'):
+            self._timer = threading.Timer(self.timeout, self._kill, (self.conn.thread_id(),))
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, excType, exc, tb):
+        with self._lock:
+            self._finished = True
+        if self._timer:
+            self._timer.cancel()
+        if self._saved:
+            self.conn._read_timeout, self.conn._write_timeout = self._saved
+        if exc is not None and not self.expired and time.monotonic() - self._started >= self.timeout:
+            self.expired = True
+        if exc is not None and (self.expired or errorCode(exc) in TIMEOUT_CODES):
+            raise QueryTimeoutError('statement timeout after {}s'.format(self.timeout), errorCode(exc)) from exc
+        return False
+
+    def _kill(self, threadId):
+        ''' 通过另一个连接中止超时的语句，持有锁直到KILL完成，语句已结束则不执行
+        --
+        '''
+        with self._lock:
+            if self._finished:
+                return
+            self.expired = True
+            killQuery(self.killConn, threadId)
+
+
+def killQuery(killConn, threadId):
+    ''' 通过另一个连接执行KILL QUERY，出错只记录日志
+    --
+        @param killConn: 执行KILL QUERY的连接，可以是连接、连接池或者返回连接的函数
+        @param threadId: 要中止的连接的thread_id
+    '''
+    if hasattr(killConn, 'cursor'):
+        conn = killConn
+    elif hasattr(killConn, 'connection'):
+        conn = killConn.connection()
+    else:
+        conn = killConn()
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('KILL QUERY %s', threadId)
+        finally:
+            cursor.close()
+    except Exception as e:
+        _log.error('kill query {} error: {}'.format(threadId, e))
+    finally:
+        if conn is not killConn:
+            conn.close()
@@ -0,0 +1,142 @@
+''' 测试用的DB-API连接，不需要MySQL：按handler返回结果并记录执行过的语句
+--
+    @example
+        conn = FakeConnection(lambda sql, values: [{'sid': 1, 'name': '张三'}])
+        Orm(conn, 'student', 'sid').selectAll()
+        conn.executed   # [('SELECT * FROM student', None)]
+'''
+import re
+
+
+def normalize(sql):
+    return ' '.join(sql.split())
+
+
+class FakeError(Exception):
+    ''' 带错误码的驱动异常，与pymysql一致：args = (code, message)
+    '''
+    pass
+
+
+class FakeCursor(object):
+    def __init__(self, conn, cursorClass = None):
+        self.conn = conn
+        self.cursorClass = cursorClass
+        self.description = None
+        self.rowcount = -1
+        self.lastrowid = None
+        self._rows = []
+        self._sets = []
+        self.closed = False
+
+    def _result(self, sql, values):
+        res = self.conn.handler(normalize(sql), values) if self.conn.handler else None
+        if isinstance(res, Exception):
+            raise res
+        if isinstance(res, int):
+            return [], None, res
+        rows = list(res or [])
+        description = None
+        if rows and isinstance(rows[0], dict):
+            description = [(k,) for k in rows[0].keys()]
+            if self.cursorClass == 'tuple':
+                rows = [tuple(r.values()) for r in rows]
+        return rows, description, len(rows)
+
+    def execute(self, sql, values = None):
+        self.conn.executed.append((normalize(sql), values))
+        statements = [s for s in sql.split(';\n')] if self.conn.multiStatements else [sql]
+        self._sets = [self._result(s, values) for s in statements]
+        self.lastrowid = self.conn.lastrowid
+        return self._nextResult()
+
+    def _nextResult(self):
+        rows, self.description, self.rowcount = self._sets.pop(0)
+        self._rows = rows
+        return self.rowcount
+
+    def nextset(self):
+        if not self._sets:
+            return None
+        self._nextResult()
+        return True
+
+    def executemany(self, sql, values):
+        self.conn.executed.append((normalize(sql), values))
+        for v in values:
+            self._result(sql, v)
+        self.lastrowid = self.conn.lastrowid
+        self.rowcount = len(values)
+        return self.rowcount
+
+    def mogrify(self, sql, values):
+        values = iter(values)
+        return re.sub('%s', lambda m: repr(next(values)), sql)
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size = 1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection(object):
+    def __init__(self, handler = None, name = 'db', multiStatements = False):
+        ''' 测试连接
+        --
+            @param handler: handler(sql, values)，返回字典列表（查询结果）、整数（影响行数）、None或者异常
+            @param multiStatements: 是否按';\\n'拆分多语句（Pipeline）
+        '''
+        self.handler = handler
+        self.name = name
+        self.multiStatements = multiStatements
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+        self.lastrowid = 1
+
+    def cursor(self, cursorClass = None):
+        return FakeCursor(self, cursorClass)
+
+    def commit(self):
+        self.commits += 1
+        self.executed.append(('COMMIT', None))
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.executed.append(('ROLLBACK', None))
+
+    def ping(self, reconnect = False):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def statements(self):
+        ''' 执行过的语句（不含参数）
+        --
+        '''
+        return [sql for sql, values in self.executed]
+
+
+class FakePool(object):
+    def __init__(self, handler = None):
+        ''' 连接池，connection()每次返回新的FakeConnection
+        --
+        '''
+        self.handler = handler
+        self.connections = []
+
+    def connection(self):
+        conn = FakeConnection(self.handler, 'pool{}'.format(len(self.connections)))
+        self.connections.append(conn)
+        return conn
@@ -0,0 +1,58 @@
+import unittest
+from fcorm import Orm, Example, Aggregate
+from fcorm.sqlutil import quoteKey
+from fakedb import FakeConnection, normalize
+
+PASSED = Example().andGreaterThanOrEqualTo({'result': 60})
+
+
+def build(*args, **kwargs):
+    sql, values = Aggregate(*args, **kwargs).build()
+    return normalize(sql), values
+
+
+class TestAggregate(unittest.TestCase):
+    def testPlain(self):
+        self.assertEqual(build('count'), ('COUNT(*)', []))
+        self.assertEqual(build('SUM', 'result', 'total'), ('SUM(`result`) `total`', []))
+        self.assertEqual(build('COUNT', 'study.sid', 'n', distinct=True), ('COUNT(DISTINCT `study`.`sid`) `n`', []))
+
+    def testConditional(self):
+        self.assertEqual(build('COUNT', '*', 'n', when=PASSED), ('COUNT(CASE WHEN `result` >= %s THEN 1 END) `n`', [60]))
+        self.assertEqual(build('SUM', 'result', 's', when=PASSED),
+                         ('SUM(CASE WHEN `result` >= %s THEN `result` ELSE 0 END) `s`', [60]))
+        self.assertEqual(build('MAX', 'result', 'm', when=PASSED), ('MAX(CASE WHEN `result` >= %s THEN `result` END) `m`', [60]))
+
+    def testCountDistinctConditionalCountsColumn(self):
+        # THEN 1会让COUNT(DISTINCT ...)永远返回1
+        self.assertEqual(build('COUNT', 'sid', 'n', distinct=True, when=PASSED),
+                         ('COUNT(DISTINCT CASE WHEN `result` >= %s THEN `sid` END) `n`', [60]))
+
+    def testUnsupported(self):
+        with self.assertRaises(Exception):
+            Aggregate('MEDIAN', 'result')
+
+    def testQuoteKey(self):
+        self.assertEqual([quoteKey(k) for k in ('*', 'sid', 'study.sid')], ['*', '`sid`', '`study`.`sid`'])
+
+
+class TestSelectAggregate(unittest.TestCase):
+    def testSingleQuery(self):
+        conn = FakeConnection(lambda sql, values: [{'cid': 1, 'num': 2}])
+        orm = Orm(conn, 'study', 'sid')
+        orm.selectAggregateByExample([
+            ('COUNT', '*', 'num'),
+            {'func': 'AVG', 'column': 'result', 'alias': 'avgResult'},
+            Aggregate('COUNT', '*', 'passed', when=PASSED)
+        ], Example().andEqualTo({'sid': 1}), groupBy=['cid'], withRollup=True)
+        self.assertEqual(conn.executed[0], (
+            'SELECT `cid`, COUNT(*) `num`, AVG(`result`) `avgResult`, COUNT(CASE WHEN `result` >= %s THEN 1 END) `passed` '
+            'FROM study WHERE `sid` = %s GROUP BY `cid` WITH ROLLUP', [60, 1]))
+
+    def testEmpty(self):
+        with self.assertRaises(Exception):
+            Orm(FakeConnection(), 'study', 'sid').selectAggregateByExample([])
+
+
+if __name__ == '__main__':
+    unittest.main()
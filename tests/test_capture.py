@@ -0,0 +1,137 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from fcorm import Orm, Example, WorkloadCapture, replayWorkload, redactStrings
+from fcorm.constant import TEMP_TABLE
+from fakedb import FakeConnection, FakeError, FakePool
+
+
+def handler(sql, values):
+    if sql.startswith('SELECT'):
+        return [{'sid': 1}]
+    if sql.startswith('UPDATE') and values and values[0] == 'boom':
+        return FakeError(1062, 'Duplicate entry')
+    return 1
+
+
+class TestCapture(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'workload.jsonl')
+        self.capture = WorkloadCapture(self.path)
+        self.conn = FakeConnection(handler)
+
+    def tearDown(self):
+        self.capture.close()
+        shutil.rmtree(self.dir)
+
+    def items(self):
+        self.capture.flush()
+        with open(self.path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def testCallerSqlRecorded(self):
+        orm = Orm(self.conn, 'student', 'sid').setCapture(self.capture).setTimeout(5).setResultLimit(maxRows=100)
+        orm.selectByExample(Example().andEqualTo({'sid': 1}))
+        item = self.items()[0]
+        # 执行的语句带有LIMIT和超时提示，记录的是调用方生成的语句
+        self.assertIn('LIMIT 101', self.conn.statements()[0])
+        self.assertEqual(item['s'], 'SELECT * FROM student WHERE `sid` = %s')
+        self.assertEqual(item['v'], [1])
+        self.assertEqual(item['w'], 0)
+
+    def testCommitAndRollbackRecorded(self):
+        orm = Orm(self.conn, 'student', 'sid').setCapture(self.capture)
+        orm.updateByPrimaryKey({'name': 'a'}, 1)
+        with self.assertRaises(Exception):
+            orm.updateByPrimaryKey({'name': 'boom'}, 2)
+        items = self.items()
+        self.assertEqual([i.get('e') for i in items], [None, 'commit', 'rollback'])
+        self.assertTrue(all(i['c'] == items[0]['c'] for i in items))
+
+    def testManualCommitRecordedByCaller(self):
+        orm = Orm(self.conn, 'student', 'sid', auto_commit=False).setCapture(self.capture)
+        orm.updateByPrimaryKey({'name': 'a'}, 1)
+        self.capture.recordEnd(self.conn, True)
+        self.assertEqual([i.get('e') for i in self.items()], [None, 'commit'])
+
+    def testSpillsAndRedaction(self):
+        self.capture.redact = redactStrings
+        orm = Orm(self.conn, 'student', 'sid').setCapture(self.capture).setLargeInThreshold(1, TEMP_TABLE)
+        orm.selectByExample(Example().andEqualTo({'name': '张三'}).andInValues('code', ['ab', 'c']))
+        item = self.items()[0]
+        self.assertEqual(item['v'], ['xx'])
+        name, columnType, values = item['p'][0]
+        self.assertIn('`{}`'.format(name), item['s'])
+        self.assertEqual((columnType, values), ('VARCHAR(2)', ['xx', 'x']))
+
+    def testValuesEncoded(self):
+        orm = Orm(self.conn, 'student', 'sid').setCapture(self.capture)
+        orm.insertMany(['sid', 'birthday'], [[1, datetime.date(2000, 1, 1)], [2, None]])
+        item = self.items()[0]
+        self.assertEqual(item['m'], 1)
+        self.assertEqual(len(item['v']), 2)
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'workload.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, items):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            for item in items:
+                f.write(json.dumps(item) + '\n')
+
+    def testTransactionBoundariesReplayed(self):
+        self.write([
+            {'t': 0, 'c': 1, 's': 'UPDATE a SET b=%s', 'v': [1], 'd': 1, 'w': 1},
+            {'t': 0, 'c': 1, 's': 'UPDATE a SET b=%s', 'v': [2], 'd': 1, 'w': 1},
+            {'t': 0, 'c': 1, 'e': 'commit'},
+            {'t': 0, 'c': 1, 's': 'UPDATE a SET b=%s', 'v': [3], 'd': 1, 'w': 1},
+            {'t': 0, 'c': 1, 'e': 'rollback'},
+            {'t': 0, 'c': 1, 's': 'UPDATE a SET b=%s', 'v': [4], 'd': 1, 'w': 1}
+        ])
+        pool = FakePool(handler)
+        report = replayWorkload(self.path, pool, speed=None, threads=1)
+        self.assertEqual(report['count'], 4)
+        self.assertEqual(report['errors'], 0)
+        conn = pool.connections[0]
+        self.assertEqual(conn.statements(), ['UPDATE a SET b=%s', 'UPDATE a SET b=%s', 'COMMIT',
+                                             'UPDATE a SET b=%s', 'ROLLBACK', 'UPDATE a SET b=%s', 'ROLLBACK'])
+
+    def testErrorDoesNotEndTransaction(self):
+        self.write([
+            {'t': 0, 'c': 1, 's': 'UPDATE a SET b=%s', 'v': ['boom'], 'd': 1, 'w': 1},
+            {'t': 0, 'c': 1, 'e': 'commit'}
+        ])
+        pool = FakePool(handler)
+        report = replayWorkload(self.path, pool, speed=None, threads=1)
+        self.assertEqual(report['errors'], 1)
+        self.assertEqual(pool.connections[0].statements()[-2:], ['COMMIT', 'ROLLBACK'])
+
+    def testCaptureThenReplay(self):
+        conn = FakeConnection(handler)
+        capture = WorkloadCapture(self.path)
+        orm = Orm(conn, 'student', 'sid').setCapture(capture).setLargeInThreshold(1, TEMP_TABLE)
+        orm.selectByExample(Example().andInValues('sid', [1, 2]))
+        orm.deleteByPrimaryKey(3)
+        capture.close()
+
+        pool = FakePool(handler)
+        report = replayWorkload(self.path, pool, speed=None, threads=1, writes=False)
+        self.assertEqual(report['count'], 1)
+        replayed = [s for c in pool.connections for s in c.statements()]
+        self.assertTrue(replayed[0].startswith('CREATE TEMPORARY TABLE'))
+        self.assertIn('DROP TEMPORARY TABLE', ' '.join(replayed))
+        self.assertNotIn('DELETE', ' '.join(replayed))
+
+
+if __name__ == '__main__':
+    unittest.main()
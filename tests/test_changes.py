@@ -0,0 +1,100 @@
+import datetime
+import decimal
+import os
+import tempfile
+import unittest
+from fcorm import Orm, Example, FileCheckpoint, TableCheckpoint
+from fcorm.changes import keysetWhere
+from fakedb import FakeConnection
+
+T = datetime.datetime(2024, 1, 1)
+
+
+def table(rows):
+    ''' 按pullChanges的语句模拟MySQL：NULL排在最前，按(updated_at, sid)的字典序过滤
+    --
+    '''
+    def handler(sql, values):
+        if not sql.startswith('SELECT'):
+            return 1
+        res = [r for r in rows if 'IS NOT NULL' not in sql or r['updated_at'] is not None]
+        if values:
+            position = (values[0], values[2])
+            res = [r for r in res if r['updated_at'] is not None and (r['updated_at'], r['sid']) > position]
+        res.sort(key=lambda r: (r['updated_at'] is not None, r['updated_at'] or T, r['sid']))
+        return [dict(r) for r in res[:int(sql.rsplit('LIMIT', 1)[1])]]
+    return handler
+
+
+ROWS = [
+    {'sid': 1, 'updated_at': T},
+    {'sid': 2, 'updated_at': T},
+    {'sid': 3, 'updated_at': T},
+    {'sid': 4, 'updated_at': T + datetime.timedelta(seconds=1)},
+    {'sid': 5, 'updated_at': None}
+]
+
+
+class TestKeyset(unittest.TestCase):
+    def testKeysetWhere(self):
+        self.assertEqual(keysetWhere(['updated_at', 'sid']),
+                         ('(`updated_at` > %s) OR (`updated_at` = %s AND `sid` > %s)', [0, 0, 1]))
+
+
+class TestPullChanges(unittest.TestCase):
+    def testSameWatermarkAcrossBatches(self):
+        conn = FakeConnection(table(ROWS))
+        rows = list(Orm(conn, 'student', 'sid').pullChanges('updated_at', batchSize=2))
+        # 水位相同的数据跨批次也不会遗漏或重复，NULL不拉取
+        self.assertEqual([r['sid'] for r in rows], [1, 2, 3, 4])
+        self.assertIn('ORDER BY `updated_at` ASC, `sid` ASC LIMIT 2', conn.statements()[0])
+
+    def testResumeFromCheckpoint(self):
+        path = os.path.join(tempfile.mkdtemp(), 'student.ckpt')
+        orm = Orm(FakeConnection(table(ROWS)), 'student', 'sid')
+        it = orm.pullChanges('updated_at', since=FileCheckpoint(path), batchSize=2)
+        self.assertEqual([next(it)['sid'], next(it)['sid']], [1, 2])
+        # 第一批处理完，取下一批时保存位置
+        next(it)
+        it.close()
+        self.assertEqual(FileCheckpoint(path).load(), (T, 2))
+        rows = list(orm.pullChanges('updated_at', since=FileCheckpoint(path), batchSize=2))
+        self.assertEqual([r['sid'] for r in rows], [3, 4])
+
+    def testTupleSinceAndExample(self):
+        conn = FakeConnection(table(ROWS))
+        rows = list(Orm(conn, 'student', 'sid').pullChanges('updated_at', since=(T, 3), example=Example().andEqualTo({'age': 18})))
+        self.assertEqual([r['sid'] for r in rows], [4])
+        sql, values = conn.executed[0]
+        self.assertIn('AND ( `age` = %s )', sql)
+        self.assertEqual(values, [T, T, 3, 18])
+
+
+class TestCheckpoint(unittest.TestCase):
+    def testFileRoundTrip(self):
+        path = os.path.join(tempfile.mkdtemp(), 'ckpt')
+        checkpoint = FileCheckpoint(path)
+        self.assertIsNone(checkpoint.load())
+        position = (T, datetime.date(2024, 1, 2), decimal.Decimal('1.50'), b'\x00\x01', 7, 'a')
+        checkpoint.save(position)
+        self.assertEqual(checkpoint.load(), position)
+        self.assertFalse(os.path.exists(path + '.tmp'))
+
+    def testTable(self):
+        saved = {}
+
+        def handler(sql, values):
+            if sql.startswith('INSERT'):
+                saved[values[0]] = values[1]
+                return 1
+            return [{'position': saved[values]}] if values in saved else []
+        conn = FakeConnection(handler)
+        checkpoint = TableCheckpoint(conn, 'student-sync')
+        self.assertIsNone(checkpoint.load())
+        checkpoint.save((T, 3))
+        self.assertEqual(checkpoint.load(), (T, 3))
+        self.assertTrue(conn.statements()[2].endswith('ON DUPLICATE KEY UPDATE `position`=VALUES(`position`)'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import types
+import unittest
+import fcorm.chunked as chunked
+from fcorm import Orm, Example, FileCheckpoint
+from fakedb import FakeConnection
+
+
+class Table(object):
+    ''' 主键为sid的表，按分批语句的条件模拟SELECT和DELETE
+    --
+    '''
+    def __init__(self, n):
+        self.rows = {i: {'sid': i, 'age': i % 3} for i in range(1, n + 1)}
+        self.batches = []
+
+    def select(self, values, limit, lower):
+        keys = sorted(k for k, r in self.rows.items() if (lower is None or k > lower) and r['age'] == values[-1])
+        return [{'sid': k} for k in keys[:limit]]
+
+    def __call__(self, sql, values):
+        if sql.startswith('SELECT'):
+            limit = int(sql.rsplit('LIMIT', 1)[1])
+            return self.select(values, limit, values[0] if '`sid` > %s' in sql else None)
+        if sql.startswith('DELETE'):
+            lower, upper = (values[0], values[1]) if '`sid` > %s' in sql else (None, values[0])
+            hit = [k for k, r in self.rows.items() if (lower is None or k > lower) and k <= upper and r['age'] == values[-1]]
+            for k in hit:
+                del self.rows[k]
+            self.batches.append(len(hit))
+            return len(hit)
+        return 0
+
+
+class TestChunked(unittest.TestCase):
+    def testDeleteInChunks(self):
+        table = Table(30)
+        conn = FakeConnection(table)
+        progress = []
+        n = Orm(conn, 'student', 'sid').deleteByExampleInChunks(Example().andEqualTo({'age': 0}), chunkSize=4,
+                                                               progress=lambda total, key: progress.append((total, key)))
+        self.assertEqual(n, 10)
+        self.assertEqual(table.batches, [4, 4, 2])
+        self.assertEqual(progress, [(4, 12), (8, 24), (10, 30)])
+        self.assertFalse(any(r['age'] == 0 for r in table.rows.values()))
+        deletes = [s for s in conn.statements() if s.startswith('DELETE')]
+        self.assertEqual(deletes[1], 'DELETE FROM `student` WHERE `sid` > %s AND `sid` <= %s AND ( `age` = %s )')
+        # 每批一个事务
+        self.assertEqual(conn.commits, len(conn.executed) - conn.commits)
+
+    def testCheckpointResume(self):
+        path = os.path.join(tempfile.mkdtemp(), 'ckpt')
+        FileCheckpoint(path).save((12,))
+        table = Table(30)
+        n = Orm(FakeConnection(table), 'student', 'sid').deleteByExampleInChunks(
+            Example().andEqualTo({'age': 0}), chunkSize=4, since=FileCheckpoint(path))
+        self.assertEqual(n, 6)
+        self.assertEqual(FileCheckpoint(path).load(), (30,))
+        self.assertIn(3, table.rows)
+
+    def testUpdateInChunks(self):
+        conn = FakeConnection(Table(10))
+        Orm(conn, 'student', 'sid').updateByExampleInChunks({'name': 'x'}, Example().andEqualTo({'age': 1}), chunkSize=2)
+        updates = [(s, v) for s, v in conn.executed if s.startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(updates[0][1][-2:], [4, 1])
+
+    def testAdaptiveChunkSize(self):
+        clock = iter(range(0, 1000, 2))
+        real = chunked.time
+        chunked.time = types.SimpleNamespace(monotonic=lambda: next(clock), sleep=real.sleep)
+        table = Table(300)
+        try:
+            Orm(FakeConnection(table), 'student', 'sid').deleteByExampleInChunks(
+                Example().andEqualTo({'age': 0}), chunkSize=40, maxLatency=1)
+        finally:
+            chunked.time = real
+        # 每批耗时2秒，超过maxLatency，分批大小减半直到下限
+        self.assertEqual(table.batches[:5], [40, 20, 10, 10, 10])
+
+    def testRequirements(self):
+        with self.assertRaises(Exception):
+            Orm(FakeConnection(), 'study', ['sid', 'cid']).deleteByExampleInChunks(Example().andEqualTo({'sid': 1}))
+        with self.assertRaises(Exception):
+            Orm(FakeConnection(), 'student', 'sid', auto_commit=False).deleteByExampleInChunks(Example().andEqualTo({'sid': 1}))
+        with self.assertRaises(Exception):
+            Orm(FakeConnection(), 'student', 'sid').deleteByExampleInChunks(None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from fcorm import Orm, Example
+from fakedb import FakeConnection, FakeError
+
+
+class TestCopy(unittest.TestCase):
+    def testCopySQL(self):
+        conn = FakeConnection(lambda sql, values: 3)
+        orm = Orm(conn, 'student', 'sid')
+        self.assertEqual(orm.copyByExample('student_bak', Example().andLessThan({'age': 10})), 3)
+        orm.copyByExample('student_name', columns=['sid', 'name'], mapping={'name': 'stu_name'})
+        self.assertEqual(conn.executed[0], ('INSERT INTO `student_bak` SELECT * FROM `student` WHERE `age` < %s', [10]))
+        self.assertEqual(conn.executed[2], ('INSERT INTO `student_name`(`sid`, `stu_name`) SELECT `sid`, `name` FROM `student`', None))
+
+    def testMappingNeedsColumns(self):
+        with self.assertRaises(Exception):
+            Orm(FakeConnection(), 'student', 'sid').copyByExample('b', mapping={'name': 'stu_name'})
+
+
+class TestMove(unittest.TestCase):
+    def setUp(self):
+        self.rows = {1: 5, 2: 8, 3: 20}
+
+    def handler(self, sql, values):
+        # auto_commit不会在执行中被临时修改
+        self.assertTrue(self.orm.auto_commit)
+        if sql.startswith('SELECT'):
+            locked = [{'sid': k} for k, age in sorted(self.rows.items()) if age < values[0]]
+            # 锁定之后、复制之前有新的符合条件的行提交
+            self.rows[4] = 1
+            return locked
+        if sql.startswith('INSERT'):
+            return len(values)
+        if sql.startswith('DELETE'):
+            for k in values:
+                del self.rows[k]
+            return len(values)
+        return 0
+
+    def testMoveByLockedKeySet(self):
+        conn = FakeConnection(self.handler)
+        self.orm = Orm(conn, 'student', 'sid')
+        self.assertEqual(self.orm.moveByExample('student_bak', Example().andLessThan({'age': 10})), 2)
+        statements = conn.statements()
+        self.assertEqual(statements[0], 'SELECT `sid` FROM `student` WHERE `age` < %s FOR UPDATE')
+        self.assertTrue(statements[1].startswith('INSERT INTO `student_bak` SELECT * FROM `student` WHERE `sid` IN ('))
+        self.assertTrue(statements[2].startswith('DELETE FROM `student` WHERE `sid` IN ('))
+        self.assertEqual(statements[3:], ['COMMIT'])
+        self.assertEqual(conn.executed[2][1], [1, 2])
+        # 新插入的行没有被删除
+        self.assertEqual(self.rows, {3: 20, 4: 1})
+
+    def testNothingToMove(self):
+        conn = FakeConnection(lambda sql, values: [])
+        self.orm = Orm(conn, 'student', 'sid')
+        self.assertEqual(self.orm.moveByExample('student_bak', Example().andLessThan({'age': 10})), 0)
+        self.assertEqual(len(conn.statements()), 2)
+
+    def testCompositeKey(self):
+        def handler(sql, values):
+            if sql.startswith('SELECT'):
+                return [(1, 1), (1, 2)]
+            return 2
+        conn = FakeConnection(handler)
+        self.orm = Orm(conn, 'study', ['sid', 'cid'])
+        self.orm.moveByExample('study_bak', Example().andEqualTo({'sid': 1}))
+        self.assertEqual(conn.executed[2], ('DELETE FROM `study` WHERE (`sid`, `cid`) IN ((%s, %s), (%s, %s))', [1, 1, 1, 2]))
+
+    def testRollbackOnError(self):
+        def handler(sql, values):
+            if sql.startswith('DELETE'):
+                return FakeError(1205, 'Lock wait timeout exceeded')
+            return [{'sid': 1}] if sql.startswith('SELECT') else 1
+        conn = FakeConnection(handler)
+        self.orm = Orm(conn, 'student', 'sid')
+        with self.assertRaises(Exception):
+            self.orm.moveByExample('student_bak', Example().andLessThan({'age': 10}))
+        self.assertEqual(conn.commits, 0)
+        self.assertGreaterEqual(conn.rollbacks, 1)
+        self.assertTrue(self.orm.auto_commit)
+
+    def testRequirements(self):
+        self.orm = Orm(FakeConnection(), 'student', 'sid')
+        with self.assertRaises(Exception):
+            self.orm.moveByExample('student_bak', None)
+        with self.assertRaises(Exception):
+            Orm(FakeConnection(), 'student', 'sid', auto_commit=False).moveByExample('b', Example().andEqualTo({'sid': 1}))
+
+
+if __name__ == '__main__':
+    unittest.main()
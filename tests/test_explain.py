@@ -0,0 +1,77 @@
+import json
+import unittest
+from fcorm import Orm, Example, ExplainSampler
+from fcorm.explain import planWarnings
+from fcorm.fingerprint import fingerprint
+from fakedb import FakeConnection
+
+FULL_SCAN = {'query_block': {'select_id': 1, 'ordering_operation': {'using_filesort': True, 'table': {
+    'table_name': 'student', 'access_type': 'ALL', 'rows_examined_per_scan': 50000}}}}
+INDEXED = {'query_block': {'select_id': 1, 'table': {'table_name': 'student', 'access_type': 'const', 'rows_examined_per_scan': 1}}}
+
+
+def handler(plan):
+    def h(sql, values):
+        if sql.startswith('EXPLAIN FORMAT=JSON'):
+            return [{'EXPLAIN': json.dumps(plan)}]
+        return [{'sid': 1}]
+    return h
+
+
+class TestFingerprint(unittest.TestCase):
+    def testSameShape(self):
+        self.assertEqual(fingerprint('SELECT * FROM student WHERE `sid` IN (%s, %s) LIMIT 0, 10'),
+                         'SELECT * FROM student WHERE `sid` IN (...) LIMIT ?')
+        self.assertEqual(fingerprint("SELECT /*+ MAX_EXECUTION_TIME(100) */ * FROM a WHERE b = 'x' AND c = 1.5"),
+                         fingerprint("SELECT * FROM a   WHERE b = 'it\\'s' AND c = 20"))
+        self.assertNotEqual(fingerprint('SELECT * FROM a WHERE b = 1'), fingerprint('SELECT * FROM a WHERE c = 1'))
+
+
+class TestExplain(unittest.TestCase):
+    def testPlanWarnings(self):
+        self.assertEqual(planWarnings(FULL_SCAN, 10000),
+                         ['using filesort', 'full table scan on student', '50000 rows examined on student'])
+        self.assertEqual(planWarnings(INDEXED), [])
+
+    def testExplainByExample(self):
+        conn = FakeConnection(handler(FULL_SCAN))
+        plan, warnings = Orm(conn, 'student', 'sid').explainByExample(Example().andLike('name', '%三'))
+        self.assertEqual(plan, FULL_SCAN)
+        self.assertIn('full table scan on student', warnings)
+        self.assertTrue(conn.statements()[0].startswith('EXPLAIN FORMAT=JSON SELECT'))
+
+    def testSamplerExplainsEachShapeOnce(self):
+        conn = FakeConnection(handler(FULL_SCAN))
+        sampler = ExplainSampler(rate=1)
+        orm = Orm(conn, 'student', 'sid').setExplainSampler(sampler)
+        for sid in (1, 2, 3):
+            orm.selectByExample(Example().andEqualTo({'sid': sid}))
+        orm.insertOne({'sid': 4, 'name': 'x'})
+        explains = [s for s in conn.statements() if s.startswith('EXPLAIN')]
+        self.assertEqual(len(explains), 1)
+        report = sampler.report()
+        self.assertEqual(len(report), 1)
+        self.assertEqual(report[0]['calls'], 3)
+        self.assertIn('full table scan on student', report[0]['warnings'])
+
+    def testUnsampledAndCleanShapesNotReported(self):
+        conn = FakeConnection(handler(INDEXED))
+        sampler = ExplainSampler(rate=0)
+        orm = Orm(conn, 'student', 'sid').setExplainSampler(sampler)
+        orm.selectAll()
+        self.assertFalse(any(s.startswith('EXPLAIN') for s in conn.statements()))
+        sampler.rate = 1
+        orm.selectByExample(Example().andEqualTo({'sid': 1}))
+        self.assertEqual(sampler.report(), [])
+
+    def testExplainErrorIgnored(self):
+        def h(sql, values):
+            if sql.startswith('EXPLAIN'):
+                return Exception('explain denied')
+            return [{'sid': 1}]
+        orm = Orm(FakeConnection(h), 'student', 'sid').setExplainSampler(ExplainSampler(rate=1))
+        self.assertEqual(orm.selectAll(), [{'sid': 1}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import threading
+import unittest
+from fcorm import Orm, Example, SingleFlight, setMaxConcurrency
+from fakedb import FakeConnection, FakeError, FakePool
+
+
+def handler(sql, values):
+    if 'COUNT' in sql:
+        return [{'n': 2}]
+    return [{'sid': 1}]
+
+
+class TestGather(unittest.TestCase):
+    def tearDown(self):
+        setMaxConcurrency(None)
+
+    def testResultsInOrderOnPoolConnections(self):
+        primary = FakeConnection(handler)
+        replica = FakeConnection(handler)
+        pool = FakePool(handler)
+        orm = Orm(primary, 'student', 'sid', replicas=[replica]).setSingleFlight(SingleFlight())
+        seen = []
+
+        def task(o):
+            seen.append((o.router, o.singleFlight, o.mirror))
+            return o.selectAll()
+        total, rows = orm.gather([lambda o: o.selectOneBySQL('SELECT COUNT(*) n FROM student'), task], pool)
+        self.assertEqual(total, {'n': 2})
+        self.assertEqual(rows, [{'sid': 1}])
+        # 任务副本不共享路由和SingleFlight，原Orm不受影响
+        self.assertEqual(seen, [(None, None, None)])
+        self.assertIsNotNone(orm.router)
+        self.assertEqual(primary.executed + replica.executed, [])
+        self.assertEqual(len(pool.connections), 2)
+        self.assertTrue(all(c.closed for c in pool.connections))
+
+    def testCopyKeepsSettings(self):
+        orm = Orm(FakeConnection(handler), 'student', 'sid').orderByClause('sid', 'ASC')
+        pool = FakePool(handler)
+        orm.gather([lambda o: o.selectByExample(Example().andEqualTo({'sid': 1}))], pool)
+        self.assertIn('ORDER BY', pool.connections[0].statements()[0])
+
+    def testFirstErrorRaised(self):
+        pool = FakePool(lambda sql, values: FakeError(1146, "Table doesn't exist") if 'bad' in sql else [{'sid': 1}])
+        orm = Orm(FakeConnection(), 'student', 'sid')
+        with self.assertRaises(Exception) as ctx:
+            orm.gather([lambda o: o.selectAllBySQL('SELECT * FROM bad'), lambda o: o.selectAll()], pool, maxWorkers=1)
+        self.assertEqual(ctx.exception.code, 1146)
+        # 出错后没有开始的任务被取消
+        self.assertEqual(len(pool.connections), 1)
+
+    def testMaxConcurrency(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+
+        def task(o):
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            threading.Event().wait(0.02)
+            with lock:
+                state['running'] -= 1
+        setMaxConcurrency(2)
+        Orm(FakeConnection(), 'student', 'sid').gather([task] * 6, FakePool(), maxWorkers=6)
+        self.assertLessEqual(state['peak'], 2)
+
+    def testEmpty(self):
+        self.assertEqual(Orm(FakeConnection(), 'student', 'sid').gather([], FakePool()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import threading
+import unittest
+from fcorm import Orm, HiLoGenerator, SnowflakeGenerator
+from fcorm import idgen
+from fakedb import FakeConnection
+
+
+class SequenceConnection(FakeConnection):
+    ''' 模拟序列表：UPDATE ... LAST_INSERT_ID(next_value + size)的新值通过lastrowid返回
+    '''
+    def __init__(self, exists = True):
+        FakeConnection.__init__(self, self.handle)
+        self.value = 1 if exists else None
+
+    def handle(self, sql, values):
+        if sql.startswith('UPDATE'):
+            if self.value is None:
+                return 0
+            self.value += values[0]
+            self.lastrowid = self.value
+            return 1
+        if sql.startswith('INSERT IGNORE'):
+            self.value = values[1]
+            return 1
+        return None
+
+
+class FakeClock(object):
+    def __init__(self, now):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestHiLo(unittest.TestCase):
+    def testBlocksFromLastRowId(self):
+        conn = SequenceConnection()
+        gen = HiLoGenerator(conn, 'student', blockSize=3)
+        self.assertEqual([gen() for _ in range(4)], [1, 2, 3, 4])
+        self.assertEqual(gen.take(5), [5, 6, 7, 8, 9])
+        # 不再查询SELECT LAST_INSERT_ID()
+        self.assertEqual([s for s in conn.statements() if s.startswith('SELECT')], [])
+        self.assertEqual(conn.commits, 3)
+
+    def testCreatesMissingSequence(self):
+        conn = SequenceConnection(exists=False)
+        gen = HiLoGenerator(conn, 'student', blockSize=10, start=100)
+        self.assertEqual(gen.take(2), [100, 101])
+        self.assertTrue(conn.statements()[1].startswith('INSERT IGNORE'))
+
+    def testErrorRolledBack(self):
+        conn = FakeConnection(lambda sql, values: Exception('boom'))
+        with self.assertRaises(Exception):
+            HiLoGenerator(conn, 'student')()
+        self.assertEqual(conn.rollbacks, 1)
+
+    def testUsedByBatchInsert(self):
+        conn = SequenceConnection()
+        data = FakeConnection(lambda sql, values: 1)
+        orm = Orm(data, 'student', 'sid').setPrimaryGenerator(HiLoGenerator(conn, 'student', blockSize=100))
+        orm.insertDictList([{'name': 'a'}, {'name': 'b'}])
+        self.assertEqual(conn.commits, 1)
+
+
+class TestSnowflake(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock(1700000000.0)
+        self.saved = idgen.time
+        idgen.time = self.clock
+
+    def tearDown(self):
+        idgen.time = self.saved
+
+    def testUniqueAndIncreasing(self):
+        gen = SnowflakeGenerator(workerId=3)
+        ids = gen.take(10) + [gen() for _ in range(10)]
+        self.assertEqual(len(set(ids)), 20)
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual((ids[0] >> 12) & 1023, 3)
+
+    def testWaitsForNextMillisecond(self):
+        gen = SnowflakeGenerator(workerId=1)
+        ids = gen.take(4096 * 2 + 1)
+        self.assertEqual(len(set(ids)), len(ids))
+        # ID中的时间戳不超过当前时间
+        self.assertLessEqual(ids[-1] >> 22, int(self.clock.now * 1000) - gen.epoch)
+        self.assertTrue(self.clock.sleeps)
+
+    def testWaitsForClockRollback(self):
+        gen = SnowflakeGenerator(workerId=1)
+        before = gen()
+        self.clock.now -= 0.5
+        after = gen()
+        self.assertGreater(after, before)
+        self.assertLessEqual(after >> 22, int(self.clock.now * 1000) - gen.epoch)
+        self.assertAlmostEqual(sum(self.clock.sleeps), 0.5, places=2)
+
+    def testLargeRollbackRaises(self):
+        gen = SnowflakeGenerator(workerId=1, maxLag=1)
+        gen()
+        self.clock.now -= 5
+        with self.assertRaises(Exception):
+            gen()
+
+    def testThreads(self):
+        idgen.time = self.saved
+        gen = SnowflakeGenerator(workerId=2)
+        ids = []
+
+        def work():
+            ids.extend(gen.take(2000))
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(set(ids)), 8000)
+
+    def testInvalidWorker(self):
+        with self.assertRaises(Exception):
+            SnowflakeGenerator(workerId=1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import datetime
+import decimal
+import io
+import json
+import unittest
+from fcorm import Orm, Example, JSONFetch, RetryPolicy
+from fakedb import FakeConnection, FakeCursor, FakeError
+
+ROWS = [
+    {'sid': 1, 'name': '张三 "x"\n', 'score': decimal.Decimal('90.50'), 'ratio': 0.25, 'ok': True,
+     'born': datetime.date(2000, 1, 2), 'at': datetime.datetime(2020, 1, 1, 10, 0, 0), 'photo': b'abc', 'note': None},
+    {'sid': 2, 'name': 'b', 'score': decimal.Decimal('-1'), 'ratio': 1e20, 'ok': False,
+     'born': datetime.date(1999, 12, 31), 'at': datetime.datetime(2020, 1, 1, 10, 0, 0, 5), 'photo': b'\xff', 'note': 'n'}
+]
+
+
+def expected(rows):
+    ''' 期望的输出：与json.dumps(default=str)相同，但Decimal为数字、UTF-8的bytes为字符串
+    --
+    '''
+    def value(v):
+        if isinstance(v, bytes):
+            try:
+                return v.decode('utf-8')
+            except UnicodeDecodeError:
+                return str(v)
+        if isinstance(v, (datetime.date, datetime.datetime)):
+            return str(v)
+        return v
+    return [{k: value(v) for k, v in r.items()} for r in rows]
+
+
+def loads(data):
+    # 按Decimal解析小数，检查DECIMAL没有经过float丢失精度
+    return json.loads(data.decode('utf-8'), parse_float=decimal.Decimal)
+
+
+class Field(object):
+    def __init__(self, tableName, name):
+        self.table_name = tableName
+        self.name = name
+
+
+class JoinCursor(FakeCursor):
+    ''' 模拟pymysql元组游标的多表连接结果：description只有字段名，_result.fields带有表名
+    '''
+    def __init__(self, columns, rows):
+        FakeCursor.__init__(self, FakeConnection(), 'tuple')
+        self._result = type('Result', (object,), {'fields': [Field(t, n) for t, n in columns]})()
+        self.description = [(n,) for _, n in columns]
+        self._rows = list(rows)
+
+
+def cursorOf(rows, cursorClass = None):
+    cursor = FakeCursor(FakeConnection(lambda sql, values: [dict(r) for r in rows]), cursorClass)
+    cursor.execute('SELECT * FROM student')
+    return cursor
+
+
+class TestJSONFetch(unittest.TestCase):
+    def testValueEncoding(self):
+        data = JSONFetch()(cursorOf(ROWS))
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(loads(data), expected(ROWS))
+        # DECIMAL按数字输出，不丢精度
+        self.assertIn(b'"score":90.50', data)
+        self.assertEqual(loads(data)[1]['photo'], str(b'\xff'))
+        self.assertEqual(loads(data)[1]['at'], '2020-01-01 10:00:00.000005')
+
+    def testTupleCursor(self):
+        data = JSONFetch()(cursorOf(ROWS, 'tuple'))
+        self.assertEqual(loads(data), expected(ROWS))
+
+    def testJoinDuplicateNames(self):
+        cursor = JoinCursor([('student', 'sid'), ('student', 'name'), ('class', 'sid'), ('class', 'name')],
+                            [(1, '张三', 10, '一班')])
+        data = JSONFetch()(cursor)
+        # 与DictCursor的键相同，不输出重复的键
+        self.assertEqual(data.decode('utf-8'), '[{"sid":1,"name":"张三","class.sid":10,"class.name":"一班"}]')
+
+    def testEmpty(self):
+        self.assertEqual(JSONFetch()(cursorOf([])), b'[]')
+        self.assertEqual(JSONFetch(jsonLines=True)(cursorOf([])), b'')
+
+    def testJsonLines(self):
+        data = JSONFetch(jsonLines=True)(cursorOf(ROWS)).decode('utf-8')
+        lines = data.split('\n')
+        self.assertEqual(lines[-1], '')
+        self.assertEqual([json.loads(line)['sid'] for line in lines[:-1]], [1, 2])
+
+    def testBatchesAcrossFetchmany(self):
+        rows = [{'sid': i, 'name': str(i)} for i in range(25)]
+        fetch = JSONFetch()
+        fetch.FETCH_BATCH = 10
+        self.assertEqual(json.loads(fetch(cursorOf(rows)).decode('utf-8')), rows)
+
+    def testWriterChunks(self):
+        rows = [{'sid': i} for i in range(5)]
+        out = io.BytesIO()
+        chunks = []
+        fetch = JSONFetch(writer=lambda b: (chunks.append(b), out.write(b)), chunkRows=2)
+        total = fetch(cursorOf(rows))
+        self.assertEqual(json.loads(out.getvalue().decode('utf-8')), rows)
+        self.assertEqual(total, len(out.getvalue()))
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(fetch.written, total - 1)
+
+
+class TestOrmJSON(unittest.TestCase):
+    def testSelectJSONByExample(self):
+        conn = FakeConnection(lambda sql, values: [dict(r) for r in ROWS])
+        data = Orm(conn, 'student', 'sid').selectJSONByExample(Example().andEqualTo({'sid': 1}))
+        self.assertEqual(loads(data), expected(ROWS))
+        self.assertEqual(conn.executed[0], ('SELECT * FROM student WHERE `sid` = %s', [1]))
+
+    def testSelectJSONBySQLToWriter(self):
+        conn = FakeConnection(lambda sql, values: [dict(r) for r in ROWS])
+        out = io.BytesIO()
+        Orm(conn, 'student', 'sid').selectJSONBySQL('SELECT * FROM student', jsonLines=True, writer=out)
+        self.assertEqual([loads(line.encode('utf-8')) for line in out.getvalue().decode('utf-8').splitlines()], expected(ROWS))
+
+    def testNoRetryAfterWrite(self):
+        class FailingCursor(FakeCursor):
+            def fetchmany(self, size = 1):
+                if not self._rows:
+                    raise FakeError(2013, 'Lost connection')
+                return FakeCursor.fetchmany(self, size)
+
+        conn = FakeConnection(lambda sql, values: [{'sid': 1}])
+        conn.cursor = lambda cursorClass = None: FailingCursor(conn, cursorClass)
+        out = io.BytesIO()
+        orm = Orm(conn, 'student', 'sid').setRetryPolicy(RetryPolicy(maxRetries=3, baseDelay=0))
+        with self.assertRaises(Exception):
+            orm.selectJSONBySQL('SELECT * FROM student', writer=out, chunkRows=1)
+        # 已经写出过数据，重试会输出重复的行
+        self.assertEqual(conn.statements().count('SELECT * FROM student'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import json
+import unittest
+from fcorm import Orm, Example, Pipeline
+from fcorm.constant import JSON_TABLE, TEMP_TABLE
+from fcorm import guard, largein
+from fcorm.largein import largeInSQL
+from fakedb import FakeConnection, FakeCursor, FakeError, normalize
+
+
+class DictCursorMixin(object):
+    pass
+
+
+class SSCursor(object):
+    pass
+
+
+class SSDictCursor(DictCursorMixin, SSCursor):
+    pass
+
+
+class ClosingCursor(FakeCursor):
+    ''' 和pymysql一样，关闭之后不能再执行语句
+    '''
+    def execute(self, sql, values = None):
+        if self.closed:
+            raise FakeError(0, 'Cursor closed')
+        return FakeCursor.execute(self, sql, values)
+
+
+class StreamingConnection(FakeConnection):
+    cursorclass = SSDictCursor
+
+    def __init__(self, *args, **kwargs):
+        FakeConnection.__init__(self, *args, **kwargs)
+        self.cursors = []
+
+    def cursor(self, cursorClass = None):
+        cursor = ClosingCursor(self, cursorClass)
+        self.cursors.append(cursor)
+        return cursor
+
+    def thread_id(self):
+        return 7
+
+
+class TestLargeInSQL(unittest.TestCase):
+    def testJsonTable(self):
+        sql, values = largeInSQL('`sid`', 'IN', [3, 1, 3, 2], JSON_TABLE)
+        self.assertEqual(normalize(sql),
+                         "`sid` IN (SELECT `v` FROM JSON_TABLE(%s, '$[*]' COLUMNS(`v` BIGINT PATH '$')) `_in`)")
+        # 去重并保持顺序
+        self.assertEqual(json.loads(values[0]), [3, 1, 2])
+
+    def testColumnType(self):
+        sql, values = largeInSQL('`name`', 'NOT IN', ['a', '张三丰', True], JSON_TABLE)
+        self.assertIn('NOT IN', sql)
+        self.assertIn('VARCHAR(4)', sql)
+        self.assertEqual(json.loads(values[0]), ['a', '张三丰', True])
+
+    def testTempTable(self):
+        sql, values = largeInSQL('`sid`', 'IN', [1, 2], TEMP_TABLE)
+        spill = values[0]
+        self.assertEqual(normalize(sql), '`sid` IN (SELECT `v` FROM `{}`)'.format(spill.name))
+        self.assertEqual((spill.values, spill.columnType), ([1, 2], 'BIGINT'))
+
+    def testUnsupportedMethod(self):
+        with self.assertRaises(Exception):
+            largeInSQL('`sid`', 'IN', [1], 'VALUES')
+        with self.assertRaises(Exception):
+            Orm(FakeConnection(), 'student', 'sid').setLargeInThreshold(10, 'VALUES')
+
+
+class TestOrmLargeIn(unittest.TestCase):
+    def setUp(self):
+        self.conn = FakeConnection(lambda sql, values: [{'sid': 1}] if sql.startswith('SELECT') else None)
+        self.orm = Orm(self.conn, 'student', 'sid')
+
+    def testBelowThresholdUnchanged(self):
+        self.orm.setLargeInThreshold(3).selectByExample(Example().andInValues('sid', [1, 2, 3]))
+        self.assertEqual(self.conn.executed[0][1], [1, 2, 3])
+        self.assertIn('IN (%s, %s, %s)', self.conn.statements()[0])
+
+    def testJsonTableOneParameter(self):
+        sids = list(range(5000))
+        self.orm.setLargeInThreshold(1000).selectByExample(Example().andEqualTo({'cid': 1}).andInValues('sid', sids))
+        sql, values = self.conn.executed[0]
+        self.assertIn('JSON_TABLE(%s', sql)
+        self.assertEqual(values[0], 1)
+        self.assertEqual(json.loads(values[1]), sids)
+
+    def testTempTableCreatedAndDropped(self):
+        self.orm.setLargeInThreshold(2, TEMP_TABLE)
+        batch = largein.INSERT_BATCH
+        largein.INSERT_BATCH = 2
+        try:
+            self.orm.selectByExample(Example().andInValues('sid', [1, 2, 3]))
+        finally:
+            largein.INSERT_BATCH = batch
+        statements = self.conn.statements()
+        name = statements[0].split('`')[1]
+        self.assertEqual(statements[0], 'CREATE TEMPORARY TABLE `{}` (`v` BIGINT NULL, KEY (`v`))'.format(name))
+        self.assertEqual(self.conn.executed[1], ('INSERT INTO `{}` (`v`) VALUES (%s), (%s)'.format(name), [1, 2]))
+        self.assertEqual(self.conn.executed[2], ('INSERT INTO `{}` (`v`) VALUES (%s)'.format(name), [3]))
+        # 语句参数中不包含InSpill
+        self.assertEqual(self.conn.executed[3], ('SELECT * FROM student WHERE `sid` IN (SELECT `v` FROM `{}`)'.format(name), []))
+        self.assertIn('DROP TEMPORARY TABLE IF EXISTS `{}`'.format(name), statements)
+
+    def testTempTableDroppedOnError(self):
+        def handler(sql, values):
+            if sql.startswith('SELECT'):
+                return FakeError(1064, 'syntax error')
+            return None
+        conn = FakeConnection(handler)
+        orm = Orm(conn, 'student', 'sid').setLargeInThreshold(1, TEMP_TABLE)
+        with self.assertRaises(Exception):
+            orm.selectByExample(Example().andInValues('sid', [1, 2]))
+        self.assertTrue(conn.statements()[-1].startswith('DROP TEMPORARY TABLE'))
+
+    def testTempTableDroppedAfterAbortedResult(self):
+        saved = guard.DictCursorMixin, guard.SSCursor, guard.SSDictCursor
+        guard.DictCursorMixin, guard.SSCursor, guard.SSDictCursor = DictCursorMixin, SSCursor, SSDictCursor
+        try:
+            conn = StreamingConnection(lambda sql, values: [{'sid': i} for i in range(20)] if sql.startswith('SELECT') else None)
+            orm = Orm(conn, 'student', 'sid').setLargeInThreshold(1, TEMP_TABLE).setResultLimit(maxRows=5, truncate=True)
+            rows = orm.selectByExample(Example().andInValues('sid', [1, 2]))
+        finally:
+            guard.DictCursorMixin, guard.SSCursor, guard.SSDictCursor = saved
+        self.assertTrue(rows.truncated)
+        self.assertIs(conn.cursors[0].cursorClass, SSDictCursor)
+        name = conn.statements()[0].split('`')[1]
+        # 超过限制后不缓冲游标被关闭，临时表用新游标删除
+        self.assertEqual(conn.statements()[-1], 'DROP TEMPORARY TABLE IF EXISTS `{}`'.format(name))
+
+    def testWritesUseRewrite(self):
+        self.orm.setLargeInThreshold(1).deleteByExample(Example().andNotInValues('sid', [1, 2]))
+        sql, values = self.conn.executed[0]
+        self.assertTrue(sql.startswith('DELETE'))
+        self.assertIn('NOT IN (SELECT `v` FROM JSON_TABLE', sql)
+        self.assertEqual(json.loads(values[0]), [1, 2])
+
+    def testPipelineRejectsTempTable(self):
+        orm = Orm(FakeConnection(multiStatements=True), 'student', 'sid').setLargeInThreshold(1, TEMP_TABLE)
+        with self.assertRaisesRegex(Exception, '不支持pipeline'):
+            Pipeline(orm.conn).add(orm.selectByExample, Example().andInValues('sid', [1, 2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+import datetime
+import decimal
+import unittest
+from fcorm import Orm, Example, SQLiteMirror, SubQuery
+from fcorm.schema import TableSchema
+from fakedb import FakeConnection
+
+TYPES = {'cid': 'int', 'code': 'varchar', 'name': 'varchar', 'credit': 'decimal', 'level': 'enum',
+         'opened': 'date', 'updated': 'datetime', 'ratio': 'float'}
+ROWS = [
+    {'cid': 1, 'code': 'MATH', 'name': 'Math', 'credit': decimal.Decimal('3.5'), 'level': 'A',
+     'opened': datetime.date(2024, 1, 1), 'updated': datetime.datetime(2024, 1, 1, 8), 'ratio': 0.1},
+    {'cid': 2, 'code': 'eng', 'name': 'English ', 'credit': decimal.Decimal('2.0'), 'level': 'B',
+     'opened': datetime.date(2024, 3, 1), 'updated': datetime.datetime(2024, 3, 1, 8), 'ratio': 0.2},
+    {'cid': 10, 'code': 'ART', 'name': '美术', 'credit': decimal.Decimal('1.25'), 'level': 'A',
+     'opened': datetime.date(2024, 2, 1), 'updated': datetime.datetime(2024, 2, 1, 8), 'ratio': 0.3}
+]
+
+
+def handler(sql, values):
+    if sql.startswith('SELECT'):
+        return [dict(r) for r in ROWS]
+    return 1
+
+
+def courseOrm(conn, caseSensitive = False, schema = True):
+    orm = Orm(conn, 'course', 'cid')
+    if schema:
+        orm.schema = TableSchema('test', 'course', list(TYPES), TYPES, ['cid'])
+    return orm.setMirror(SQLiteMirror(caseSensitive=caseSensitive))
+
+
+def cids(rows):
+    return [r['cid'] for r in rows]
+
+
+def selects(conn):
+    return [s for s in conn.statements() if s.startswith('SELECT')]
+
+
+class TestMirror(unittest.TestCase):
+    def setUp(self):
+        self.conn = FakeConnection(handler)
+        self.orm = courseOrm(self.conn)
+        self.mirror = self.orm.mirror
+        self.mirror.reload()
+
+    def select(self, example):
+        ''' 期望在镜像中执行
+        --
+        '''
+        before = len(self.conn.executed)
+        rows = self.orm.selectByExample(example)
+        self.assertEqual(len(self.conn.executed), before, 'fell back to MySQL')
+        return rows
+
+    def assertFallback(self, example):
+        before = self.mirror.stats['fallbacks']
+        self.orm.selectByExample(example)
+        self.assertEqual(self.mirror.stats['fallbacks'], before + 1)
+
+    def testParamsCoercedLikeMySQL(self):
+        # MySQL中 cid='1' 与 cid=1 结果相同
+        self.assertEqual(cids(self.select(Example().andEqualTo({'cid': '1'}))), [1])
+        self.assertEqual(cids(self.select(Example().andGreaterThan({'cid': '2'}))), [10])
+        self.assertEqual(cids(self.select(Example().andInValues('cid', ['1', 2]))), [1, 2])
+        self.assertEqual(cids(self.select(Example().andEqualTo({'credit': '3.50'}))), [1])
+        self.assertEqual(cids(self.select(Example().andGreaterThan({'credit': 2}))), [1])
+        self.assertEqual(cids(self.select(Example().andBetween('opened', '2024-01-15', datetime.date(2024, 2, 1)))), [10])
+        self.assertEqual(cids(self.select(Example().andEqualTo({'opened': '2024-01-01 00:00:00'}))), [1])
+        self.assertEqual(cids(self.select(Example().andEqualTo({'opened': '2024-01-01 10:00:00'}))), [])
+        self.assertEqual(cids(self.select(Example().andGreaterThanOrEqualTo({'updated': datetime.date(2024, 2, 1)}))), [2, 10])
+
+    def testRowsReturnedUnchanged(self):
+        self.assertEqual(self.select(Example().andEqualTo({'cid': 10})), [ROWS[2]])
+
+    def testCaseInsensitiveEquality(self):
+        self.assertEqual(cids(self.select(Example().andEqualTo({'code': 'math'}))), [1])
+        self.assertEqual(cids(self.select(Example().andInValues('code', ['ENG', 'art']))), [2, 10])
+        self.assertEqual(cids(self.select(Example().andEqualTo({'level': 'a'}))), [1, 10])
+        # _ci排序规则与SQLite的大小顺序不同
+        self.assertFallback(Example().andGreaterThan({'code': 'B'}))
+
+    def testCaseSensitive(self):
+        orm = courseOrm(FakeConnection(handler), caseSensitive=True)
+        self.assertEqual(cids(orm.selectByExample(Example().andEqualTo({'code': 'math'}))), [])
+        self.assertEqual(cids(orm.selectByExample(Example().andGreaterThan({'code': 'Z'}))), [2])
+
+    def testFallbacks(self):
+        # LIKE的转义与排序规则、子查询、末尾空格（PAD SPACE）、非ASCII字符、FLOAT、其他表的字段、类型不符的参数
+        for example in [
+            Example().andLike('code', 'MA%'),
+            Example().andInSubquery('cid', SubQuery('SELECT `cid` FROM `study` WHERE `sid` = %s', [1])),
+            Example().andEqualTo({'name': 'Math'}),
+            Example().andEqualTo({'ratio': 0.1}),
+            Example().andEqualTo({'study.cid': 1}),
+            Example().andEqualTo({'cid': 'abc'}),
+            Example().andEqualTo({'code': 1}),
+            Example().andInValues('cid', [])
+        ]:
+            self.assertFallback(example)
+        # 回退后的结果来自MySQL
+        self.assertIn('FROM course WHERE', selects(self.conn)[-1])
+
+    def testNestedExample(self):
+        example = Example().andEqualTo({'level': 'A'}).andExample(
+            Example().andEqualTo({'cid': 1}).orGreaterThan({'credit': decimal.Decimal('1.0')}))
+        self.assertEqual(cids(self.select(example)), [1, 10])
+        example = Example().andEqualTo({'cid': 2}).orExample(Example().andLessThan({'opened': '2024-02-01'}))
+        self.assertEqual(cids(self.select(example)), [1, 2])
+
+    def testOrderBy(self):
+        self.orm.orderByClause('credit', 'ASC')
+        self.assertEqual(cids(self.select(Example().andGreaterThan({'cid': 0}))), [10, 2, 1])
+        self.orm.orderByClause('code')
+        self.assertFallback(Example().andGreaterThan({'cid': 0}))
+
+    def testPrimaryKey(self):
+        before = len(selects(self.conn))
+        self.assertEqual(self.orm.selectByPrimaeyKey('10')['cid'], 10)
+        self.assertIsNone(self.orm.selectByPrimaeyKey(3))
+        self.assertEqual(len(selects(self.conn)), before)
+        self.orm.selectByPrimaeyKey('x')
+        self.assertEqual(len(selects(self.conn)), before + 1)
+
+    def testStringPrimaryKey(self):
+        rows = [{'code': 'MATH', 'name': 'Math'}]
+        orm = Orm(FakeConnection(lambda sql, values: [dict(r) for r in rows]), 'course', 'code')
+        orm.setMirror(SQLiteMirror())
+        self.assertEqual(orm.selectByPrimaeyKey('math'), rows[0])
+        self.assertEqual(orm.mirror.stats['hits'], 1)
+
+    def testTypesInferredWithoutSchema(self):
+        orm = courseOrm(FakeConnection(handler), schema=False)
+        self.assertEqual(cids(orm.selectByExample(Example().andEqualTo({'cid': '2'}))), [2])
+        self.assertEqual(orm.mirror.stats['hits'], 1)
+
+    def testReloadIgnoresResultLimit(self):
+        self.orm.setResultLimit(maxRows=2)
+        self.assertEqual(cids(self.select(Example().andEqualTo({'cid': 10}))), [10])
+        self.assertFalse(any('LIMIT' in s for s in self.conn.statements()))
+        # 镜像中的结果超过限制时由MySQL查询处理
+        self.orm.setResultLimit(maxRows=2, truncate=True)
+        before = len(selects(self.conn))
+        rows = self.orm.selectByExample(Example().andGreaterThan({'cid': 0}))
+        self.assertEqual(len(selects(self.conn)), before + 1)
+        self.assertTrue(rows.truncated)
+
+    def testPullKeepsKeyIndex(self):
+        conn = FakeConnection(handler)
+        orm = courseOrm(conn)
+        orm.mirror.changeColumn = 'updated'
+        orm.selectByPrimaeyKey(1)
+        orm.mirror.maxStaleness = 0
+        changed = dict(ROWS[0], name='Maths', updated=datetime.datetime(2024, 4, 1))
+        conn.handler = lambda sql, values: [dict(changed)] if 'WHERE' in sql else handler(sql, values)
+        self.assertEqual(orm.selectByPrimaeyKey('1')['name'], 'Maths')
+        self.assertEqual(orm.mirror.stats['pulls'], 1)
+        self.assertEqual(len(orm.mirror._rows), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+from fcorm import Orm, Model, Example
+from fakedb import FakeConnection
+
+
+class Student(Model):
+    __fields__ = ('sid', 'name', 'age')
+
+
+def handler(sql, values):
+    if sql.startswith('SELECT'):
+        return [{'sid': 1, 'name': '张三', 'age': 18}, {'sid': 2, 'name': '李四', 'age': 19}]
+    return 1
+
+
+class TestModel(unittest.TestCase):
+    def setUp(self):
+        self.conn = FakeConnection(handler)
+        self.conn.lastrowid = 7
+        Student.bind(Orm(self.conn, 'student', 'sid'))
+
+    def writes(self):
+        return [(sql, v) for sql, v in self.conn.executed if not sql.startswith(('SELECT', 'COMMIT'))]
+
+    def testSlotsAndUnknownField(self):
+        s = Student(name='王五')
+        self.assertFalse(hasattr(s, '__dict__'))
+        with self.assertRaises(AttributeError):
+            s.score = 1
+
+    def testDirtyTracking(self):
+        s = Student.get(1)
+        self.assertEqual(s.save(), 0)
+        s.age = 18                              # 值没有变化
+        self.assertEqual(s.dirtyFields(), set())
+        s.age = 20
+        s.save()
+        sql, values = self.writes()[0]
+        self.assertTrue(sql.startswith('UPDATE `student` SET'))
+        self.assertNotIn('`name`', sql)
+        self.assertEqual(values, [20, 1])
+        self.assertEqual(s.save(), 0)
+
+    def testInsertWritesBackKey(self):
+        s = Student(name='王五', age=20)
+        self.assertEqual(s.save(), 7)
+        self.assertEqual(s.sid, 7)
+        s.age = 21
+        s.save()
+        self.assertEqual(self.writes()[-1][1], [21, 7])
+
+    def testGeneratedKeyWrittenBack(self):
+        keys = iter(range(4242, 4250))
+        Student.__orm__.setPrimaryGenerator(lambda: next(keys))
+        self.conn.lastrowid = 0
+        s = Student(name='王五')
+        s.save()
+        self.assertEqual(s.sid, 4242)
+        s.age = 21
+        s.save()
+        self.assertEqual(self.writes()[-1][1], [21, 4242])
+
+        a, b = Student(name='a'), Student(name='b')
+        Student.saveAll([a, b])
+        self.assertEqual((a.sid, b.sid), (4243, 4244))
+        a.age = 30
+        a.save()
+        self.assertEqual(self.writes()[-1][1], [30, 4243])
+
+    def testChangedPrimaryKeyUsesOriginal(self):
+        s = Student.get(1)
+        s.sid = 100
+        s.save()
+        sql, values = self.writes()[0]
+        self.assertTrue(sql.endswith('WHERE `sid`=%s'))
+        self.assertEqual(values, [100, 1])
+        # 保存后以新主键为准
+        s.name = '赵六'
+        s.save()
+        self.assertEqual(self.writes()[1][1], ['赵六', 100])
+
+    def testSaveAllMergesUpdates(self):
+        a, b = Student.select(Example().andLessThan({'age': 20}))
+        a.age, b.age = 30, 31
+        c = Student(name='王五')
+        self.assertEqual(Student.saveAll([a, b, c]), 2)
+        sql, values = [w for w in self.writes() if w[0].startswith('UPDATE')][0]
+        self.assertTrue(sql.startswith('UPDATE `student` SET `age` = CASE WHEN `sid`=%s THEN %s WHEN `sid`=%s THEN %s END '
+                                       'WHERE `sid` IN ('))
+        self.assertEqual(values, [1, 30, 2, 31, 1, 2])
+        self.assertEqual(a.dirtyFields(), set())
+
+    def testSaveAllRejectsChangedPrimaryKey(self):
+        a, b = Student.select()
+        a.sid = 100
+        b.age = 20
+        with self.assertRaises(Exception):
+            Student.saveAll([a, b])
+        self.assertEqual(self.writes(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import threading
+import unittest
+from fcorm import Orm, SingleFlight
+from fakedb import FakeConnection, FakeError, FakePool
+
+
+def pages(total):
+    def handler(sql, values):
+        offset, n = [int(x) for x in sql.rsplit('LIMIT', 1)[1].split(',')]
+        return [{'sid': i} for i in range(offset, min(offset + n, total))]
+    return handler
+
+
+class ThreadPool(FakePool):
+    def connection(self):
+        conn = FakePool.connection(self)
+        conn.thread_id = lambda: 42
+        return conn
+
+
+class TestPageIterator(unittest.TestCase):
+    def testAllPagesOnPoolConnection(self):
+        primary = FakeConnection(pages(5))
+        replica = FakeConnection(pages(5))
+        pool = FakePool(pages(5))
+        orm = Orm(primary, 'student', 'sid', replicas=[replica]).setSingleFlight(SingleFlight())
+        with orm.orderByClause('sid', 'ASC').iterPagesByExample(pageNum=2, pool=pool) as it:
+            res = [[r['sid'] for r in rows] for rows in it]
+        self.assertEqual(res, [[0, 1], [2, 3], [4]])
+        # 后台查询只使用连接池的连接，不经过从库路由
+        self.assertEqual(primary.executed, [])
+        self.assertEqual(replica.executed, [])
+        self.assertEqual(len(pool.connections), 1)
+        self.assertTrue(pool.connections[0].closed)
+
+    def testExactMultipleEnds(self):
+        it = Orm(FakeConnection(), 'student', 'sid').iterPagesByExample(pageNum=2, pool=FakePool(pages(4)))
+        self.assertEqual([len(rows) for rows in it], [2, 2])
+
+    def testErrorRaised(self):
+        pool = FakePool(lambda sql, values: FakeError(1146, "Table doesn't exist"))
+        with self.assertRaises(Exception) as ctx:
+            list(Orm(FakeConnection(), 'student', 'sid').iterPagesByExample(pool=pool))
+        self.assertEqual(ctx.exception.code, 1146)
+
+    def testCloseKillsRunningQuery(self):
+        started = threading.Event()
+        killed = threading.Event()
+
+        def handler(sql, values):
+            if 'LIMIT 2, 2' in sql:
+                started.set()
+                killed.wait(5)
+                return FakeError(1317, 'Query execution was interrupted')
+            return pages(10)(sql, values)
+
+        def kill(sql, values):
+            killed.set()
+        killConn = FakeConnection(kill)
+        orm = Orm(FakeConnection(), 'student', 'sid').setTimeout(None, killConn)
+        it = orm.iterPagesByExample(pageNum=2, pool=ThreadPool(handler))
+        next(it)
+        self.assertTrue(started.wait(5))
+        it.close()
+        self.assertEqual(killConn.executed, [('KILL QUERY %s', 42)])
+        with self.assertRaises(StopIteration):
+            next(it)
+
+    def testReadAhead(self):
+        with self.assertRaises(Exception):
+            Orm(FakeConnection(), 'student', 'sid').iterPagesByExample(pool=FakePool(), readAhead=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from decimal import Decimal
+from fcorm import Example
+from fcorm.parser import parseWhere
+
+
+def where(s):
+    whereStr, values = Example().whereFromStr(s).whereBuilder()
+    return ' '.join(whereStr.split()), values
+
+
+class TestParser(unittest.TestCase):
+    def testOperators(self):
+        self.assertEqual(where("name = '张三' AND age >= 18 AND sid != 3"),
+                         ('`name` = %s AND `age` >= %s AND `sid` <> %s', ['张三', 18, 3]))
+
+    def testQuotedStringWithSpacesAndEscapes(self):
+        self.assertEqual(where("name LIKE '张 %' OR name = 'it''s' OR name = \"a\\\"b\""),
+                         ('`name` LIKE %s OR `name` = %s OR `name` = %s', ['张 %', "it's", 'a"b']))
+
+    def testInBetween(self):
+        self.assertEqual(where('sid NOT IN (1, 2, 3) AND age BETWEEN 18 AND 20'),
+                         ('`sid` NOT IN (%s, %s, %s) AND `age` BETWEEN %s AND %s', [1, 2, 3, 18, 20]))
+
+    def testParenthesesNest(self):
+        # 括号内的条件作为一组，AND/OR按原顺序拼接，由MySQL按AND优先于OR计算
+        self.assertEqual(where('a = 1 AND (b = 2 OR c = 3) OR d = 4'),
+                         ('`a` = %s AND ( `b` = %s OR `c` = %s ) OR `d` = %s', [1, 2, 3, 4]))
+        self.assertEqual(parseWhere('a = 1 OR b = 2 AND c = 3'),
+                         (('AND', ('a', 1, '=')), ('OR', ('b', 2, '=')), ('AND', ('c', 3, '='))))
+
+    def testBacktickAndTableKeys(self):
+        self.assertEqual(where('`student`.`sid` = 1 AND `name` = x'),
+                         ('`student`.`sid` = %s AND `name` = %s', [1, 'x']))
+
+    def testNumberTypes(self):
+        self.assertEqual(where('a = 1 AND b = -2 AND c = 1.50 AND d = 007x')[1], [1, -2, Decimal('1.50'), '007x'])
+
+    def testRejectsMalformed(self):
+        for s in ('a =', 'a = 1 AND', '(a = 1', 'a = 1)', 'a IN 1', 'a BETWEEN 1 2', 'a 1', "a = 'x"):
+            with self.assertRaises(Exception, msg=s):
+                parseWhere(s)
+
+    def testRejectsInjectedKeys(self):
+        for s in ('a.b.c = 1', 'sleep(1) = 1', '1 = 1', 'a;DROP = 1', '`a` `b` = 1', 'a-b = 1', '`x`.`y`.`z` = 1'):
+            with self.assertRaises(Exception, msg=s):
+                parseWhere(s)
+
+    def testCached(self):
+        self.assertIs(parseWhere('a = 1'), parseWhere('a = 1'))
+        # 缓存的结果不会被Example修改
+        e1 = Example().whereFromStr('a IN (1, 2)')
+        e1.where[0][1].append(3)
+        self.assertEqual(Example().whereFromStr('a IN (1, 2)').where[0][1], [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
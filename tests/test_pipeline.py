@@ -0,0 +1,112 @@
+import unittest
+from fcorm import Orm, Example, Pipeline, ReplicaRouter, SingleFlight
+from fakedb import FakeConnection
+
+
+def handler(sql, values):
+    if sql.startswith('SELECT'):
+        return [{'sid': 1, 'name': '张三'}]
+    if sql.startswith('START TRANSACTION'):
+        return None
+    return 1
+
+
+class StaleMirror(object):
+    def __init__(self):
+        self.stale = 0
+
+    def bind(self, orm):
+        return self
+
+    def markStale(self):
+        self.stale += 1
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.conn = FakeConnection(handler, multiStatements=True)
+        self.orm = Orm(self.conn, 'student', 'sid')
+
+    def testOneRoundTrip(self):
+        p = self.orm.pipeline()
+        p.add(self.orm.selectByExample, Example().andEqualTo({'sid': 1}))
+        p.add(self.orm.selectByPrimaeyKey, 1)
+        students, student = p.execute()
+        self.assertEqual(students, [{'sid': 1, 'name': '张三'}])
+        self.assertEqual(student, {'sid': 1, 'name': '张三'})
+        # 只读：一条多语句请求，不开启事务
+        self.assertEqual(len(self.conn.executed), 2)
+        self.assertNotIn('START TRANSACTION', self.conn.executed[0][0])
+        self.assertEqual(self.conn.executed[1], ('COMMIT', None))
+        self.assertEqual(p.execute(), [])
+
+    def testWriteInTransaction(self):
+        p = self.orm.pipeline()
+        p.add(self.orm.selectAll).add(self.orm.deleteByPrimaryKey, 2)
+        rows, deleted = p.execute()
+        self.assertEqual(deleted, 1)
+        self.assertTrue(self.conn.executed[0][0].startswith('START TRANSACTION; SELECT'))
+        self.assertEqual(self.conn.commits, 1)
+
+    def testWriteHooks(self):
+        router = ReplicaRouter([FakeConnection(handler)], stickyWindow=60)
+        flight = SingleFlight()
+        mirror = StaleMirror()
+        orm = Orm(self.conn, 'student', 'sid', replicas=router).setSingleFlight(flight).setMirror(mirror)
+        p = orm.pipeline().add(orm.updateByPrimaryKey, {'name': '李四'}, 1)
+        p.execute()
+        self.assertTrue(router.isSticky())
+        self.assertEqual(mirror.stale, 1)
+        self.assertEqual(flight._generation, 1)
+
+    def testManualCommitNotCommitted(self):
+        orm = Orm(self.conn, 'student', 'sid', auto_commit=False)
+        orm.pipeline().add(orm.deleteByPrimaryKey, 2).execute()
+        self.assertFalse(self.conn.executed[0][0].startswith('START TRANSACTION'))
+        self.assertEqual(self.conn.commits, 0)
+
+    def testRefuseInsideOpenTransaction(self):
+        self.conn.server_status = 1
+        p = self.orm.pipeline().add(self.orm.deleteByPrimaryKey, 2)
+        with self.assertRaises(Exception):
+            p.execute()
+        self.assertEqual(self.conn.executed, [])
+
+    def testUnsupportedMethod(self):
+        p = self.orm.pipeline()
+        with self.assertRaisesRegex(Exception, '不支持pipeline'):
+            p.add(self.orm.selectPageByExample, Example().andEqualTo({'sid': 1}))
+        with self.assertRaisesRegex(Exception, '不支持pipeline'):
+            p.add(self.orm.insertMany, ['sid', 'name'], [[1, 'a'], [2, 'b']])
+        self.assertEqual(p.statements, [])
+
+    def testMoveRefused(self):
+        p = self.orm.pipeline()
+        with self.assertRaisesRegex(Exception, '不支持pipeline'):
+            p.add(self.orm.moveByExample, 'student_archive', Example().andLessThan({'sid': 10}))
+        self.assertEqual(p.statements, [])
+        # 没有执行语句，也没有提交
+        self.assertEqual(self.conn.executed, [])
+
+    def testMethodErrorsPropagate(self):
+        p = self.orm.pipeline()
+        with self.assertRaisesRegex(Exception, '数据为空'):
+            p.add(self.orm.insertOne, {})
+        with self.assertRaises(ZeroDivisionError):
+            p.add(lambda: 1 / 0)
+
+    def testRollbackOnError(self):
+        def failing(sql, values):
+            if sql.startswith('DELETE'):
+                return Exception('boom')
+            return handler(sql, values)
+        conn = FakeConnection(failing, multiStatements=True)
+        orm = Orm(conn, 'student', 'sid')
+        with self.assertRaises(Exception):
+            Pipeline(conn).add(orm.selectAll).add(orm.deleteByPrimaryKey, 1).execute()
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertEqual(conn.commits, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
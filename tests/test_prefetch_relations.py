@@ -0,0 +1,44 @@
+import unittest
+from fcorm import Orm
+from fakedb import FakeConnection
+
+STUDENTS = [{'sid': 1, 'name': '张三'}, {'sid': 2, 'name': '李四'}, {'sid': 3, 'name': '王五'}]
+STUDY = [{'sid': 1, 'cid': 1, 'result': 90}, {'sid': 1, 'cid': 2, 'result': 70}, {'sid': 2, 'cid': 1, 'result': 80}]
+COURSES = [{'cid': 1, 'name': '计算机', 'tid': 1}, {'cid': 2, 'name': '数学', 'tid': 1}]
+
+
+def handler(sql, values):
+    if sql.startswith('SELECT * FROM student'):
+        return [dict(r) for r in STUDENTS]
+    tables = {'study': STUDY, 'course': COURSES}
+    for table, rows in tables.items():
+        if sql.startswith('SELECT * FROM `{}`'.format(table)):
+            key = sql.split('WHERE `')[1].split('`')[0]
+            return [dict(r) for r in rows if r[key] in values]
+    return []
+
+
+class TestPrefetch(unittest.TestCase):
+    def testNestedPrefetchOneQueryPerLevel(self):
+        conn = FakeConnection(handler)
+        res = Orm(conn, 'student', 'sid').selectAll().prefetch('study', 'sid', then=('course', 'cid', None, None, True))
+        self.assertEqual(len(conn.statements()), 3 + 3)     # 3条查询，每条一次提交
+        self.assertEqual([len(r['study']) for r in res], [2, 1, 0])
+        self.assertEqual(res[0]['study'][1]['course']['name'], '数学')
+
+    def testChunkedInQueries(self):
+        conn = FakeConnection(handler)
+        Orm(conn, 'student', 'sid').selectAll().prefetch('study', 'sid', chunkSize=2)
+        queries = [sql for sql in conn.statements() if 'study' in sql]
+        self.assertEqual(len(queries), 2)
+
+    def testDifferentKeyNamesAndOne(self):
+        conn = FakeConnection(handler)
+        courses = Orm(conn, 'course', 'cid').selectAllBySQL('SELECT * FROM `course` WHERE `cid` IN (%s, %s, %s)', [1, 2, 3])
+        courses.append({'cid': 3, 'name': '英语', 'tid': 2})
+        courses.prefetch('study', ('cid', 'cid'), attr='first', one=True)
+        self.assertEqual([c['first'] and c['first']['result'] for c in courses], [90, 70, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
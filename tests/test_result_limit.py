@@ -0,0 +1,130 @@
+import unittest
+from fcorm import Orm, Example, ResultTooLargeError, resultPeaks
+from fcorm import guard
+from fcorm.guard import injectLimit, clearResultPeaks
+from fakedb import FakeConnection
+
+ROWS = [{'sid': i, 'name': 'x' * 10} for i in range(50)]
+
+
+class DictCursorMixin(object):
+    pass
+
+
+class SSCursor(object):
+    pass
+
+
+class SSDictCursor(DictCursorMixin, SSCursor):
+    pass
+
+
+class DictCursor(DictCursorMixin):
+    pass
+
+
+class StreamingConnection(FakeConnection):
+    ''' 模拟pymysql连接：cursorclass为DictCursor，thread_id可以用于KILL QUERY
+    '''
+    cursorclass = DictCursor
+
+    def __init__(self, *args, **kwargs):
+        FakeConnection.__init__(self, *args, **kwargs)
+        self.cursors = []
+
+    def cursor(self, cursorClass = None):
+        cursor = FakeConnection.cursor(self, cursorClass)
+        self.cursors.append(cursor)
+        return cursor
+
+    def thread_id(self):
+        return 7
+
+
+class Pooled(object):
+    def __init__(self, con):
+        self._con = con
+
+
+class TestInjectLimit(unittest.TestCase):
+    def testAdded(self):
+        self.assertEqual(injectLimit('SELECT * FROM t', 100), 'SELECT * FROM t LIMIT 101')
+        self.assertEqual(injectLimit('SELECT * FROM t', None), 'SELECT * FROM t')
+        self.assertEqual(injectLimit('UPDATE t SET a=1', 100), 'UPDATE t SET a=1')
+
+    def testUnionLimitsWholeResult(self):
+        self.assertEqual(injectLimit('SELECT a FROM t UNION SELECT a FROM u', 100),
+                         'SELECT a FROM t UNION SELECT a FROM u LIMIT 101')
+
+    def testSubqueryLimitIgnored(self):
+        self.assertEqual(injectLimit('SELECT * FROM t WHERE id IN (SELECT id FROM u ORDER BY id LIMIT 5)', 100),
+                         'SELECT * FROM t WHERE id IN (SELECT id FROM u ORDER BY id LIMIT 5) LIMIT 101')
+        self.assertEqual(injectLimit("SELECT * FROM t WHERE n = 'a (LIMIT'", 100), "SELECT * FROM t WHERE n = 'a (LIMIT' LIMIT 101")
+
+    def testExistingLimitLowered(self):
+        self.assertEqual(injectLimit('SELECT * FROM t LIMIT 5000', 100), 'SELECT * FROM t LIMIT 101')
+        self.assertEqual(injectLimit('SELECT * FROM t LIMIT 20, 5000', 100), 'SELECT * FROM t LIMIT 20, 101')
+        self.assertEqual(injectLimit('SELECT * FROM t LIMIT 5000 OFFSET 20', 100), 'SELECT * FROM t LIMIT 101 OFFSET 20')
+        self.assertEqual(injectLimit('SELECT * FROM t LIMIT 10', 100), 'SELECT * FROM t LIMIT 10')
+        self.assertEqual(injectLimit('SELECT * FROM t LIMIT %s', 100), 'SELECT * FROM t LIMIT %s')
+
+    def testLockingReadsUntouched(self):
+        for sql in ('SELECT * FROM t FOR UPDATE', 'SELECT * FROM t LOCK IN SHARE MODE', 'SELECT a INTO @x FROM t', 'SELECT 1; SELECT 2'):
+            self.assertEqual(injectLimit(sql, 100), sql)
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        self.saved = (guard.DictCursorMixin, guard.SSCursor, guard.SSDictCursor)
+        guard.DictCursorMixin, guard.SSCursor, guard.SSDictCursor = DictCursorMixin, SSCursor, SSDictCursor
+        clearResultPeaks()
+
+    def tearDown(self):
+        guard.DictCursorMixin, guard.SSCursor, guard.SSDictCursor = self.saved
+
+    def testCursorClass(self):
+        self.assertIs(guard.streamingCursor(StreamingConnection()), SSDictCursor)
+        self.assertIs(guard.streamingCursor(Pooled(Pooled(StreamingConnection()))), SSDictCursor)
+        conn = StreamingConnection()
+        conn.cursorclass = object
+        self.assertIs(guard.streamingCursor(conn), SSCursor)
+        self.assertIsNone(guard.streamingCursor(FakeConnection()))
+
+    def testMaxBytesOnlyStreams(self):
+        conn = StreamingConnection(lambda sql, values: [dict(r) for r in ROWS])
+        orm = Orm(conn, 'student', 'sid').setResultLimit(maxBytes=100)
+        with self.assertRaises(ResultTooLargeError) as ctx:
+            orm.selectAll()
+        # 没有maxRows时不添加LIMIT，由不缓冲游标边读边计算大小
+        self.assertEqual(conn.statements()[0], 'SELECT * FROM student')
+        self.assertIs(conn.cursors[0].cursorClass, SSDictCursor)
+        self.assertTrue(conn.cursors[0].closed)
+        self.assertEqual((ctx.exception.rows, ctx.exception.size), (5, 90))
+
+    def testAbortKillsQuery(self):
+        killConn = FakeConnection()
+        conn = StreamingConnection(lambda sql, values: [dict(r) for r in ROWS])
+        orm = Orm(conn, 'student', 'sid').setTimeout(None, killConn).setResultLimit(maxRows=10, truncate=True)
+        rows = orm.selectByExample(Example().andGreaterThan({'sid': 0}))
+        self.assertEqual(len(rows), 10)
+        self.assertTrue(rows.truncated)
+        self.assertEqual(killConn.executed, [('KILL QUERY %s', 7)])
+        self.assertEqual(resultPeaks()[0]['limited'], 1)
+
+    def testNoKillWithinLimit(self):
+        killConn = FakeConnection()
+        conn = StreamingConnection(lambda sql, values: [dict(r) for r in ROWS[:3]])
+        orm = Orm(conn, 'student', 'sid').setTimeout(None, killConn).setResultLimit(maxRows=10)
+        self.assertEqual(len(orm.selectAll()), 3)
+        self.assertEqual(killConn.executed, [])
+
+    def testBufferedWithoutPymysql(self):
+        guard.SSCursor = None
+        conn = StreamingConnection(lambda sql, values: [dict(r) for r in ROWS])
+        rows = Orm(conn, 'student', 'sid').setResultLimit(maxRows=10, truncate=True).selectAll()
+        self.assertEqual(len(rows), 10)
+        self.assertIsNone(conn.cursors[0].cursorClass)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+from fcorm import Orm, RetryPolicy, DeadlockError, ConnectionLostError, QueryTimeoutError
+from fakedb import FakeConnection, FakeError
+
+
+def failing(errors, result = None):
+    ''' 前几次执行依次抛出errors中的异常，之后返回result
+    --
+    '''
+    errors = list(errors)
+
+    def handler(sql, values):
+        if errors:
+            return errors.pop(0)
+        return result if result is not None else [{'sid': 1}]
+    return handler
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(maxRetries=2, baseDelay=0)
+
+    def testRetryableCodes(self):
+        self.assertTrue(self.policy.isRetryable(FakeError(1213, 'Deadlock'), False))
+        self.assertTrue(self.policy.isRetryable(FakeError(1205, 'Lock wait timeout'), True))
+        self.assertTrue(self.policy.isRetryable(FakeError(2006, 'gone away'), False))
+        # 写操作断线时无法确定是否已执行
+        self.assertFalse(self.policy.isRetryable(FakeError(2013, 'Lost connection'), True))
+        self.assertFalse(self.policy.isRetryable(FakeError(1062, 'Duplicate entry'), False))
+        self.assertFalse(self.policy.isRetryable(QueryTimeoutError('timeout', 3024), False))
+        self.assertFalse(RetryPolicy(retryWrites=False).isRetryable(FakeError(1213, 'Deadlock'), True))
+
+    def testDelayBounded(self):
+        policy = RetryPolicy(baseDelay=0.1, maxDelay=0.3)
+        for attempt in range(6):
+            self.assertLessEqual(policy.delay(attempt), 0.3)
+
+    def testRecoversAfterDeadlock(self):
+        conn = FakeConnection(failing([FakeError(1213, 'Deadlock found')]))
+        orm = Orm(conn, 'student', 'sid').setRetryPolicy(self.policy)
+        self.assertEqual(orm.selectAll(), [{'sid': 1}])
+        self.assertEqual(conn.statements().count('SELECT * FROM student'), 2)
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertEqual(self.policy.stats, {'retries': 1, 'recovered': 1, 'failed': 0, 'codes': {1213: 1}})
+
+    def testGivesUpAfterMaxRetries(self):
+        conn = FakeConnection(failing([FakeError(1213, 'Deadlock found')] * 5))
+        orm = Orm(conn, 'student', 'sid').setRetryPolicy(self.policy)
+        with self.assertRaises(DeadlockError):
+            orm.selectAll()
+        self.assertEqual(conn.statements().count('SELECT * FROM student'), 3)
+        self.assertEqual(self.policy.stats['failed'], 1)
+
+    def testWriteNotRetriedOnLostConnection(self):
+        conn = FakeConnection(failing([FakeError(2013, 'Lost connection')], 1))
+        orm = Orm(conn, 'student', 'sid').setRetryPolicy(self.policy)
+        with self.assertRaises(ConnectionLostError):
+            orm.deleteByPrimaryKey(1)
+        self.assertEqual(len([s for s in conn.statements() if s.startswith('DELETE')]), 1)
+
+    def testNoRetryInTransaction(self):
+        conn = FakeConnection(failing([FakeError(1213, 'Deadlock found')]))
+        orm = Orm(conn, 'student', 'sid', auto_commit=False).setRetryPolicy(self.policy)
+        with self.assertRaises(DeadlockError):
+            orm.selectAll()
+        self.assertEqual(self.policy.stats['retries'], 0)
+
+    def testErrorsKeepCode(self):
+        conn = FakeConnection(failing([FakeError(1205, 'Lock wait timeout exceeded')]))
+        with self.assertRaises(Exception) as ctx:
+            Orm(conn, 'student', 'sid').selectAll()
+        self.assertEqual(ctx.exception.code, 1205)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+from fcorm import Orm, Example, ReplicaRouter
+from fcorm.constant import LEAST_OUTSTANDING
+from fakedb import FakeConnection, FakeError
+
+
+def rows(sql, values):
+    if 'COUNT' in sql:
+        return [{'num': 2}]
+    return [{'sid': 1, 'name': '张三'}, {'sid': 2, 'name': '李四'}]
+
+
+def lagHandler(lag, replicaStatus = True, column = 'Seconds_Behind_Source'):
+    def handler(sql, values):
+        if sql == 'SHOW REPLICA STATUS':
+            if not replicaStatus:
+                return FakeError(1064, 'You have an error in your SQL syntax')
+            return [{'Replica_IO_Running': 'Yes', column: lag}]
+        if sql == 'SHOW SLAVE STATUS':
+            return [{'Slave_IO_Running': 'Yes', column: lag}]
+        return rows(sql, values)
+    return handler
+
+
+class TestReplicaRouter(unittest.TestCase):
+    def testReadsGoToReplicaWritesToPrimary(self):
+        primary = FakeConnection(rows, 'primary')
+        replica = FakeConnection(rows, 'replica')
+        orm = Orm(primary, 'student', 'sid', replicas=[replica])
+        orm.selectAll()
+        orm.updateByPrimaryKey({'name': '王五'}, 1)
+        orm.selectAll(usePrimary=True)
+        self.assertEqual(replica.statements(), ['SELECT * FROM student', 'COMMIT'])
+        queries = [s for s in primary.statements() if s != 'COMMIT']
+        self.assertEqual(len(queries), 2)
+        self.assertTrue(queries[0].startswith('UPDATE `student`'))
+        self.assertEqual(queries[1], 'SELECT * FROM student')
+
+    def testManualCommitUsesPrimary(self):
+        primary = FakeConnection(rows, 'primary')
+        replica = FakeConnection(rows, 'replica')
+        Orm(primary, 'student', 'sid', auto_commit=False, replicas=[replica]).selectAll()
+        self.assertEqual(replica.executed, [])
+
+    def testStickyWindowAfterWrite(self):
+        primary = FakeConnection(rows, 'primary')
+        replica = FakeConnection(rows, 'replica')
+        orm = Orm(primary, 'student', 'sid', replicas=ReplicaRouter([replica], stickyWindow=60))
+        orm.deleteByPrimaryKey(1)
+        orm.selectAll()
+        self.assertEqual(replica.executed, [])
+
+    def testRoundRobinAndLeastOutstanding(self):
+        a, b = FakeConnection(rows, 'a'), FakeConnection(rows, 'b')
+        router = ReplicaRouter([a, b])
+        self.assertEqual([router.acquire().source.name for _ in range(4)], ['a', 'b', 'a', 'b'])
+
+        router = ReplicaRouter([a, b], balance=LEAST_OUTSTANDING)
+        first = router.acquire()
+        second = router.acquire()
+        self.assertNotEqual(first.source.name, second.source.name)
+        router.release(first)
+        self.assertIs(router.acquire(), first)
+
+    def testLagUsesReplicaStatus(self):
+        replica = FakeConnection(lagHandler(3))
+        router = ReplicaRouter([replica], maxLag=5)
+        self.assertIsNotNone(router.acquire())
+        self.assertEqual(replica.statements(), ['SHOW REPLICA STATUS'])
+
+    def testLagFallsBackToSlaveStatus(self):
+        replica = FakeConnection(lagHandler(3, replicaStatus=False, column='Seconds_Behind_Master'))
+        router = ReplicaRouter([replica], maxLag=5)
+        self.assertEqual(router.currentLag(), 3)
+        self.assertEqual(replica.statements(), ['SHOW REPLICA STATUS', 'SHOW SLAVE STATUS'])
+        # 记住可用的语句
+        router.currentLag()
+        self.assertEqual(replica.statements()[-1], 'SHOW SLAVE STATUS')
+
+    def testLagFromTupleCursor(self):
+        class TupleConnection(FakeConnection):
+            def cursor(self, cursorClass = None):
+                return FakeConnection.cursor(self, 'tuple')
+        replica = TupleConnection(lagHandler(7))
+        self.assertEqual(ReplicaRouter([replica]).currentLag(), 7)
+
+    def testLaggingReplicaExcluded(self):
+        replica = FakeConnection(lagHandler(30))
+        router = ReplicaRouter([replica], maxLag=5)
+        self.assertIsNone(router.acquire())
+        self.assertEqual(router.status()[0]['lag'], 30)
+
+    def testFailedCheckIsReported(self):
+        replica = FakeConnection(lambda sql, values: FakeError(1227, 'Access denied'))
+        router = ReplicaRouter([replica], maxLag=5)
+        with self.assertLogs(level='WARNING') as logs:
+            self.assertIsNone(router.acquire())
+        self.assertIn('Access denied', router.status()[0]['error'])
+        self.assertTrue(any('no replica available' in line for line in logs.output))
+
+    def testStoppedReplicationExcluded(self):
+        router = ReplicaRouter([FakeConnection(lagHandler(None))], maxLag=5)
+        self.assertIsNone(router.acquire())
+        self.assertEqual(router.status()[0]['error'], 'replication is not running')
+
+    def testPagedQueryPinsReplica(self):
+        a, b = FakeConnection(rows, 'a'), FakeConnection(rows, 'b')
+        orm = Orm(FakeConnection(rows, 'primary'), 'student', 'sid', replicas=[a, b])
+        for _ in range(3):
+            num, page = orm.selectPageByExample(Example().andEqualTo({'age': 18}))
+            self.assertEqual(num, 2)
+            orm.selectPageAll()
+        for conn in (a, b):
+            queries = [s for s in conn.statements() if s != 'COMMIT']
+            # 每次分页的COUNT和数据查询在同一个从库
+            self.assertEqual(len(queries) % 2, 0)
+            for count, data in zip(queries[::2], queries[1::2]):
+                self.assertIn('COUNT', count)
+                self.assertIn('LIMIT', data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from fcorm import Orm
+from fcorm.schema import clearSchemaCache
+from fakedb import FakeConnection
+
+COLUMNS = [
+    {'name': 'sid', 'type': 'int', 'columnKey': 'PRI', 'extra': ''},
+    {'name': 'cid', 'type': 'int', 'columnKey': 'PRI', 'extra': ''},
+    {'name': 'result', 'type': 'int', 'columnKey': '', 'extra': ''}
+]
+STATISTICS = [
+    {'indexName': 'PRIMARY', 'nonUnique': 0, 'name': 'sid'},
+    {'indexName': 'PRIMARY', 'nonUnique': 0, 'name': 'cid'},
+    {'indexName': 'idx_result', 'nonUnique': 1, 'name': 'result'}
+]
+
+
+def handler(sql, values):
+    if sql.startswith('SELECT DATABASE()'):
+        return [{'db': 'test'}]
+    if 'information_schema.COLUMNS' in sql:
+        return [dict(r) for r in COLUMNS]
+    if 'information_schema.STATISTICS' in sql:
+        return [dict(r) for r in STATISTICS]
+    if sql.startswith('SELECT'):
+        return [{'sid': 1, 'cid': 1, 'result': 90}]
+    return 1
+
+
+class TestSchema(unittest.TestCase):
+    def setUp(self):
+        clearSchemaCache()
+        self.dir = tempfile.mkdtemp()
+        self.cacheFile = os.path.join(self.dir, 'schema.json')
+
+    def tearDown(self):
+        clearSchemaCache()
+
+    def schemaQueries(self, conn):
+        return [s for s in conn.statements() if 'information_schema' in s]
+
+    def testCompositePrimaryKey(self):
+        conn = FakeConnection(handler)
+        orm = Orm(conn, 'study').loadSchema()
+        self.assertEqual(orm.keyProperty, ['sid', 'cid'])
+        orm.selectByPrimaeyKey({'sid': 1, 'cid': 2})
+        orm.deleteByPrimaryKey((1, 2))
+        self.assertEqual(conn.executed[-4][1], [1, 2])
+        self.assertEqual(conn.executed[-2], ('DELETE FROM `study` WHERE `study`.`sid`=%s AND `study`.`cid`=%s', [1, 2]))
+        self.assertIn('`study`.`sid`, `study`.`cid`, `study`.`result`', conn.executed[-4][0])
+
+    def testCheckColumns(self):
+        orm = Orm(FakeConnection(handler), 'study').loadSchema()
+        with self.assertRaises(Exception):
+            orm.insertOne({'sid': 1, 'cid': 1, 'score': 1})
+
+    def testLoadedOncePerProcess(self):
+        conn = FakeConnection(handler)
+        Orm(conn, 'study').loadSchema()
+        Orm(conn, 'study').loadSchema()
+        self.assertEqual(len(self.schemaQueries(conn)), 2)
+
+    def testDiskCacheAndTTL(self):
+        Orm(FakeConnection(handler), 'study').loadSchema(self.cacheFile)
+        clearSchemaCache()
+        conn = FakeConnection(handler)
+        Orm(conn, 'study').loadSchema(self.cacheFile)
+        self.assertEqual(self.schemaQueries(conn), [])
+
+        # 过期后重新读取
+        with open(self.cacheFile, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        data['test.study']['cachedAt'] = time.time() - 7200
+        with open(self.cacheFile, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        clearSchemaCache()
+        conn = FakeConnection(handler)
+        Orm(conn, 'study').loadSchema(self.cacheFile, ttl=3600)
+        self.assertEqual(len(self.schemaQueries(conn)), 2)
+        with open(self.cacheFile, 'r', encoding='utf-8') as f:
+            self.assertGreater(json.load(f)['test.study']['cachedAt'], time.time() - 60)
+
+    def testCacheWithoutTimestampExpires(self):
+        Orm(FakeConnection(handler), 'study').loadSchema(self.cacheFile)
+        with open(self.cacheFile, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        del data['test.study']['cachedAt']
+        with open(self.cacheFile, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        clearSchemaCache()
+        conn = FakeConnection(handler)
+        Orm(conn, 'study').loadSchema(self.cacheFile)
+        self.assertEqual(len(self.schemaQueries(conn)), 2)
+
+    def testGeneratorSkippedForCompositeKey(self):
+        conn = FakeConnection(handler)
+        orm = Orm(conn, 'study', ['sid', 'cid']).setPrimaryGenerator(lambda: 100)
+        orm.insertOne({'sid': 1, 'cid': 2, 'result': 90})
+        orm.insertMany(['sid', 'cid'], [[1, 2], [1, 3]])
+        orm.insertDictList([{'sid': 1, 'cid': 4}])
+        inserts = [(sql, v) for sql, v in conn.executed if sql.startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual([sql.count('%s') for sql, v in inserts], [3, 2, 2])
+        self.assertNotIn(100, [x for sql, v in inserts for row in v for x in (row if isinstance(row, list) else [row])])
+
+
+if __name__ == '__main__':
+    unittest.main()
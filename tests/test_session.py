@@ -0,0 +1,104 @@
+import unittest
+from fcorm import Orm, Session, Model, Example
+from fakedb import FakeConnection
+
+
+def handler(sql, values):
+    if sql.startswith('SELECT'):
+        rows = [{'sid': 1, 'name': '张三'}, {'sid': 2, 'name': '李四'}]
+        if '`sid`=%s' in sql:
+            return [r for r in rows if r['sid'] == values[0]]
+        return rows
+    return 1
+
+
+class Student(Model):
+    __fields__ = ('sid', 'name')
+
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        self.conn = FakeConnection(handler, multiStatements=True)
+        self.session = Session()
+        self.orm = self.session.wrap(Orm(self.conn, 'student', 'sid'))
+
+    def selects(self):
+        return len([s for s in self.conn.statements() if s.startswith('SELECT')])
+
+    def assertReloads(self, write, *args, **kwargs):
+        first = self.orm.selectByPrimaeyKey(1)
+        getattr(self.orm, write)(*args, **kwargs)
+        n = self.selects()
+        self.assertIsNot(self.orm.selectByPrimaeyKey(1), first, write)
+        self.assertEqual(self.selects(), n + 1, write)
+
+    def testIdentityMap(self):
+        t1 = self.orm.selectByPrimaeyKey(1)
+        t2 = self.orm.selectByPrimaeyKey(1)
+        rows = self.orm.selectByExample(Example().andGreaterThan({'sid': 0}))
+        self.assertIs(t1, t2)
+        self.assertIs(rows[0], t1)
+        self.assertEqual(self.session.stats, {'hits': 1, 'misses': 1})
+        self.assertEqual(self.selects(), 2)
+
+    def testPartialRowsNotMapped(self):
+        rows = self.orm.setSelectProperties({'student': ['sid']}).selectAll()
+        self.assertIsNone(self.session.get('student', (1,)))
+        self.assertEqual(len(rows), 2)
+
+    def testChainReturnsWrapper(self):
+        self.assertIs(self.orm.orderByClause('sid'), self.orm)
+        self.assertIs(self.orm.setTimeout(1), self.orm)
+
+    def testWritesEvict(self):
+        self.assertReloads('updateByPrimaryKey', {'name': 'x'}, 1)
+        self.assertReloads('deleteByPrimaryKey', 1)
+        self.assertReloads('updateByExample', {'name': 'x'}, Example().andEqualTo({'sid': 1}))
+        self.assertReloads('deleteByExample', Example().andEqualTo({'sid': 1}))
+        self.assertReloads('insertOne', {'sid': 3, 'name': 'x'})
+        self.assertReloads('insertMany', ['sid', 'name'], [[3, 'x']])
+        self.assertReloads('insertDictList', [{'sid': 3, 'name': 'x'}])
+        self.assertReloads('executeBySQL', 'UPDATE student SET name = %s', ['x'])
+        self.assertReloads('copyByExample', 'student_bak', Example().andEqualTo({'sid': 1}))
+        self.assertReloads('deleteByExampleInChunks', Example().andEqualTo({'sid': 1}), chunkSize=10)
+
+    def testUnknownMethodTreatedAsWrite(self):
+        self.orm._orm.customWrite = lambda: self.orm._orm.executeBySQL('DELETE FROM student')
+        self.assertReloads('customWrite')
+
+    def testReadsKeepMap(self):
+        first = self.orm.selectByPrimaeyKey(1)
+        self.orm.selectAllBySQL('SELECT * FROM student')
+        self.orm._primaryKeys()
+        self.assertIs(self.orm.selectByPrimaeyKey(1), first)
+
+    def testPipelineWriteClears(self):
+        first = self.orm.selectByPrimaeyKey(1)
+        p = self.orm.pipeline()
+        p.add(self.orm._orm.updateByPrimaryKey, {'name': 'x'}, 1)
+        self.assertIs(self.session.get('student', (1,)), first)
+        p.execute()
+        self.assertIsNone(self.session.get('student', (1,)))
+
+    def testModelSave(self):
+        Student.bind(self.orm)
+        first = self.orm.selectByPrimaeyKey(1)
+        s = Student.get(2)
+        s.name = 'x'
+        s.save()
+        self.assertIsNone(self.session.get('student', (2,)))
+        self.assertIs(self.session.get('student', (1,)), first)
+        a, b = Student.select()
+        a.name = b.name = 'y'
+        Student.saveAll([a, b])
+        self.assertIsNone(self.session.get('student', (1,)))
+
+    def testClosed(self):
+        with Session() as session:
+            orm = session.wrap(Orm(self.conn, 'student', 'sid'))
+            orm.selectByPrimaeyKey(1)
+        self.assertIsNone(session.get('student', (1,)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+from fcorm import Example, ShardMap, ShardedOrm
+from fakedb import FakeConnection
+
+
+def shardHandler(rows):
+    def handler(sql, values):
+        if sql.startswith('SELECT'):
+            if 'COUNT(' in sql and 'num' in sql and 'GROUP BY' not in sql:
+                return [{'sid': rows[0]['sid'] if rows else None, 'age': rows[0]['age'] if rows else None, 'num': len(rows)}]
+            if 'GROUP BY' in sql:
+                counts = {}
+                for row in rows:
+                    counts[row['age']] = counts.get(row['age'], 0) + 1
+                return [{'sid': 0, 'age': age, 'num': n} for age, n in counts.items()]
+            return list(rows)
+        return 1
+    return handler
+
+
+class TestShardMap(unittest.TestCase):
+    def testHashAndRange(self):
+        self.assertEqual(ShardMap('sid', 4).shardFor(7), 3)
+        self.assertEqual(ShardMap('sid', 4).shardFor('abc'), ShardMap('sid', 4).shardFor('abc'))
+        ranges = ShardMap('sid', 3, ranges=[10, 20])
+        self.assertEqual([ranges.shardFor(v) for v in (1, 10, 19, 20, 99)], [0, 1, 1, 2, 2])
+
+    def testRangeCountMismatch(self):
+        with self.assertRaises(Exception):
+            ShardMap('sid', 3, ranges=[10])
+
+
+class TestShardedOrm(unittest.TestCase):
+    def setUp(self):
+        self.rows = [
+            [{'sid': 2, 'name': 'b', 'age': 18}, {'sid': 4, 'name': 'd', 'age': 20}],
+            [{'sid': 1, 'name': 'a', 'age': 18}, {'sid': 3, 'name': 'c', 'age': 19}]
+        ]
+        self.conns = [FakeConnection(shardHandler(r), 'shard{}'.format(i)) for i, r in enumerate(self.rows)]
+        self.orm = ShardedOrm(self.conns, 'student', ShardMap('sid', 2), 'sid')
+
+    def tearDown(self):
+        self.orm.close()
+
+    def testPrimaryKeyRoutesToOneShard(self):
+        self.orm.selectByPrimaeyKey(3)
+        self.assertEqual(self.conns[0].executed, [])
+        self.assertTrue(self.conns[1].executed)
+
+    def testExampleWithShardKeyRoutes(self):
+        self.orm.selectByExample(Example().andEqualTo({'sid': 4}).andLike('name', '%d'))
+        self.assertTrue(self.conns[0].executed)
+        self.assertEqual(self.conns[1].executed, [])
+
+    def testOrConditionHitsAllShards(self):
+        self.orm.selectByExample(Example().andEqualTo({'sid': 4}).orEqualTo({'name': 'a'}))
+        self.assertTrue(self.conns[0].executed and self.conns[1].executed)
+
+    def testMergeOrdered(self):
+        res = self.orm.orderByClause('sid', 'ASC').selectAll()
+        self.assertEqual([r['sid'] for r in res], [1, 2, 3, 4])
+
+    def testMergeDescendingWithNulls(self):
+        self.rows[0][0]['age'] = None
+        self.rows[0].sort(key=lambda r: -(r['age'] or -1))
+        self.rows[1].sort(key=lambda r: -r['age'])
+        res = self.orm.orderByClause('age', 'DESC').selectAll()
+        self.assertEqual([r['age'] for r in res], [20, 19, 18, None])
+
+    def testPage(self):
+        num, rows = self.orm.orderByClause('sid', 'ASC').selectPageByExample(Example().andGreaterThan({'age': 0}), 2, 2)
+        self.assertEqual(num, 4)
+        self.assertEqual([r['sid'] for r in rows], [3, 4])
+
+    def testTransactWithoutGroupByMergesToOneRow(self):
+        res = self.orm.selectTransactByExample('sid', Example().andGreaterThan({'age': 0}), 'num')
+        self.assertEqual(len(res), 1)
+        self.assertEqual(res[0]['num'], 4)
+
+    def testTransactGroupBy(self):
+        res = self.orm.groupByClause('age').selectTransactByExample('sid', Example().andGreaterThan({'age': 0}), 'num')
+        self.assertEqual(sorted((r['age'], r['num']) for r in res), [(18, 2), (19, 1), (20, 1)])
+
+    def testTransactGroupByOrdered(self):
+        # 分组交错分布在各分片：第一个分片有18、20，第二个分片有18、19
+        example = Example().andGreaterThan({'age': 0})
+        res = self.orm.groupByClause('age').orderByClause('age', 'ASC').selectTransactByExample('sid', example, 'num')
+        self.assertEqual([(r['age'], r['num']) for r in res], [(18, 2), (19, 1), (20, 1)])
+        self.orm.orderBy = [('age', 'DESC')]
+        res = self.orm.selectTransactByExample('sid', example, 'num')
+        self.assertEqual([r['age'] for r in res], [20, 19, 18])
+
+    def testTransactUnsupported(self):
+        with self.assertRaises(Exception):
+            self.orm.selectTransactByExample('sid', Example(), 'n', 'AVG')
+
+    def testInsertDictListReturnsRowCount(self):
+        n = self.orm.insertDictList([{'sid': 5, 'name': 'e'}, {'sid': 6, 'name': 'f'}, {'sid': 8, 'name': 'g'}])
+        self.assertEqual(n, 3)
+        inserts = [v for sql, v in self.conns[0].executed if sql.startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(len(inserts[0]), 2)
+
+    def testInsertWithoutShardKey(self):
+        with self.assertRaises(Exception):
+            self.orm.insertOne({'name': 'x'})
+
+    def testUpdateByExampleSums(self):
+        self.assertEqual(self.orm.updateByExample({'age': 1}, Example().andLike('name', '%')), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import threading
+import time
+import unittest
+from fcorm import Orm, SingleFlight
+from fcorm.pool import connectionIdentity
+from fakedb import FakeConnection
+
+
+class BlockingConnection(FakeConnection):
+    ''' 查询在release之前阻塞，started表示查询已经开始
+    '''
+    def __init__(self, rows, host = None, db = None):
+        FakeConnection.__init__(self, self.handle)
+        self.rows = rows
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if host is not None:
+            self.host, self.port, self.db = host, 3306, db
+
+    def handle(self, sql, values):
+        self.started.set()
+        self.release.wait(5)
+        return [dict(r) for r in self.rows]
+
+
+class Pooled(object):
+    ''' 模拟DBUtils连接池包装的连接
+    '''
+    def __init__(self, con):
+        self._con = con
+
+    def cursor(self, *args):
+        return self._con.cursor(*args)
+
+    def commit(self):
+        self._con.commit()
+
+    def rollback(self):
+        self._con.rollback()
+
+
+class TestSingleFlight(unittest.TestCase):
+    def testIdentity(self):
+        a = FakeConnection()
+        self.assertEqual(connectionIdentity(a), ('id', id(a)))
+        shard = BlockingConnection([], 'db1', b'school')
+        self.assertEqual(connectionIdentity(Pooled(Pooled(shard))), ('db1', 3306, b'school'))
+
+    def leader(self, orm, conn):
+        ''' 在另一个线程中开始查询，返回时查询正在执行
+        --
+        '''
+        result = {}
+        thread = threading.Thread(target=lambda: result.setdefault('rows', orm.selectAll()))
+        thread.start()
+        conn.started.wait(5)
+        return thread, result
+
+    def testDifferentDatabasesNotShared(self):
+        flight = SingleFlight()
+        connA = BlockingConnection([{'sid': 1}])
+        connB = FakeConnection(lambda sql, values: [{'sid': 2}])
+        thread, result = self.leader(Orm(connA, 'student', 'sid').setSingleFlight(flight), connA)
+        # 同样的SQL，但是另一个库：不能等待并共享connA的结果
+        self.assertEqual(Orm(connB, 'student', 'sid').setSingleFlight(flight).selectAll(), [{'sid': 2}])
+        connA.release.set()
+        thread.join()
+        self.assertEqual(result['rows'], [{'sid': 1}])
+        self.assertEqual(flight.stats['leaders'], 2)
+        self.assertEqual(flight.stats['shared'], 0)
+
+    def testSameDatabaseShared(self):
+        flight = SingleFlight()
+        connA = BlockingConnection([{'sid': 1}], 'db1', b'school')
+        connB = BlockingConnection([{'sid': 2}], 'db1', b'school')
+        thread, result = self.leader(Orm(Pooled(connA), 'student', 'sid').setSingleFlight(flight), connA)
+        shared = {}
+        follower = threading.Thread(target=lambda: shared.setdefault(
+            'rows', Orm(Pooled(connB), 'student', 'sid').setSingleFlight(flight).selectAll()))
+        follower.start()
+        time.sleep(0.05)
+        connA.release.set()
+        thread.join()
+        follower.join()
+        self.assertEqual(shared['rows'], [{'sid': 1}])
+        self.assertEqual(connB.executed, [])
+        self.assertEqual(flight.stats['shared'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from fcorm import Orm, Example, SubQuery
+from fakedb import FakeConnection, normalize
+
+
+def where(example):
+    s, values = example.whereBuilder()
+    return normalize(s), values
+
+
+class TestSubQuery(unittest.TestCase):
+    def setUp(self):
+        self.study = Orm(FakeConnection(), 'study', ['sid', 'cid'])
+        self.student = Orm(FakeConnection(), 'student', 'sid')
+
+    def testProperties(self):
+        self.assertEqual(self.study.subQuery(properties='sid').sql, 'SELECT `sid` FROM `study`')
+        self.assertEqual(self.study.subQuery(properties='study.sid').sql, 'SELECT `study`.`sid` FROM `study`')
+        self.assertEqual(self.study.subQuery(properties=['sid', 'cid']).sql, 'SELECT `sid`, `cid` FROM `study`')
+        # 不是字段名的按表达式原样拼接
+        self.assertEqual(self.study.subQuery(properties='1').sql, 'SELECT 1 FROM `study`')
+        self.assertEqual(self.study.subQuery(properties='AVG(`result`)').sql, 'SELECT AVG(`result`) FROM `study`')
+        self.assertEqual(self.study.subQuery(properties='a.b.c').sql, 'SELECT a.b.c FROM `study`')
+        self.assertEqual(self.study.subQuery(properties='1sid').sql, 'SELECT 1sid FROM `study`')
+        with self.assertRaises(Exception):
+            self.study.subQuery(properties=['sid', 'sid; DROP TABLE study'])
+
+    def testInSubquery(self):
+        sub = self.study.subQuery(Example().andLessThan({'result': 60}), 'sid')
+        self.assertEqual(where(Example().andEqualTo({'age': 18}).andInSubquery('sid', sub)),
+                         ('`age` = %s AND `sid` IN (SELECT `sid` FROM `study` WHERE ( `result` < %s ))', [18, 60]))
+        self.assertEqual(where(Example().andNotInSubquery('sid', SubQuery('SELECT 1', []))), ('`sid` NOT IN (SELECT 1)', []))
+
+    def testExistsAndScalar(self):
+        sub = self.study.subQuery(properties='1', correlation='`study`.`sid`=`student`.`sid`')
+        self.assertEqual(where(Example().andNotExists(sub)),
+                         ('NOT EXISTS (SELECT 1 FROM `study` WHERE `study`.`sid`=`student`.`sid`)', []))
+        avg = self.student.subQuery(properties='AVG(`age`)')
+        self.assertEqual(where(Example().andGreaterThan({'age': avg})), ('`age` > (SELECT AVG(`age`) FROM `student`)', []))
+
+    def testValuesInOrder(self):
+        conn = FakeConnection(lambda sql, values: [])
+        sub = self.study.groupByClause('sid').havingByExample(Example().andGreaterThan({'COUNT(*)': 1}))
+        Orm(conn, 'student', 'sid').selectByExample(
+            Example().andEqualTo({'age': 18}).andInSubquery('sid', sub.subQuery(Example().andLessThan({'result': 60}), 'sid')))
+        self.assertEqual(conn.executed[0][1], [18, 60, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import time
+import unittest
+from fcorm import Orm, QueryTimeoutError
+from fcorm.timeout import Deadline
+from fakedb import FakeConnection, FakeError
+
+
+class ThreadConnection(FakeConnection):
+    def __init__(self, *args, **kwargs):
+        FakeConnection.__init__(self, *args, **kwargs)
+        self._read_timeout = self._write_timeout = None
+
+    def thread_id(self):
+        return 42
+
+
+class TestDeadline(unittest.TestCase):
+    def testSelectHint(self):
+        self.assertEqual(Deadline(FakeConnection(), 'select * from a', 1.5).sql,
+                         'select /*+ MAX_EXECUTION_TIME(1500) */ * from a')
+        # 小于1毫秒的超时不能变成MAX_EXECUTION_TIME(0)（0表示不限制）
+        self.assertIn('MAX_EXECUTION_TIME(1)', Deadline(FakeConnection(), 'SELECT 1', 0.0001).sql)
+        self.assertEqual(Deadline(FakeConnection(), 'UPDATE a SET b=1', 1).sql, 'UPDATE a SET b=1')
+
+    def testServerTimeoutTranslated(self):
+        for code in (3024, 1317):
+            with self.assertRaises(QueryTimeoutError) as ctx:
+                with Deadline(FakeConnection(), 'SELECT 1', 10):
+                    raise FakeError(code, 'interrupted')
+            self.assertEqual(ctx.exception.code, code)
+
+    def testLostConnectionBeforeDeadlineNotTranslated(self):
+        with self.assertRaises(FakeError):
+            with Deadline(ThreadConnection(), 'UPDATE a SET b=1', 10):
+                raise FakeError(2013, 'Lost connection to MySQL server during query')
+
+    def testReadTimeoutTranslated(self):
+        conn = ThreadConnection()
+        with self.assertRaises(QueryTimeoutError):
+            with Deadline(conn, 'UPDATE a SET b=1', 0.01):
+                self.assertEqual(conn._read_timeout, 0.01)
+                time.sleep(0.02)
+                raise FakeError(2013, 'Lost connection to MySQL server during query (timed out)')
+        self.assertIsNone(conn._read_timeout)
+
+    def testKillAfterDeadline(self):
+        killConn = FakeConnection()
+        with self.assertRaises(QueryTimeoutError):
+            with Deadline(ThreadConnection(), 'SELECT 1', 0.01, killConn) as deadline:
+                time.sleep(0.1)
+                raise FakeError(1317, 'Query execution was interrupted')
+        self.assertTrue(deadline.expired)
+        self.assertEqual(killConn.executed, [('KILL QUERY %s', 42)])
+
+    def testNoKillAfterFinished(self):
+        killConn = FakeConnection()
+        with Deadline(ThreadConnection(), 'SELECT 1', 10, killConn) as deadline:
+            pass
+        # 定时器已经触发但语句已结束：不能中止连接上的下一条语句
+        deadline._kill(42)
+        self.assertFalse(deadline.expired)
+        self.assertEqual(killConn.executed, [])
+
+    def testOrmTimeout(self):
+        conn = FakeConnection(lambda sql, values: FakeError(3024, 'maximum statement execution time exceeded'))
+        orm = Orm(conn, 'student', 'sid').setTimeout(0.5)
+        with self.assertRaises(QueryTimeoutError):
+            orm.selectAll()
+        self.assertIn('MAX_EXECUTION_TIME(500)', conn.statements()[0])
+
+
+if __name__ == '__main__':
+    unittest.main()